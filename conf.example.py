@@ -4,3 +4,121 @@ BASE_DIR = Path(__file__).parent.resolve()
 XHS_SERVER = "http://127.0.0.1:11901"
 LOCAL_CHROME_PATH = ""   # change me necessary！ for example C:/Program Files/Google/Chrome/Application/chrome.exe
 LOCAL_CHROME_HEADLESS = False
+
+# 浏览器池：常驻的 Chromium 数量，单个浏览器服务多少次任务后回收，池内浏览器总内存上限（MB，按浏览器数量平分，
+# 单个浏览器的进程树超过自己那一份时回收）
+BROWSER_POOL_SIZE = 2
+BROWSER_POOL_MAX_JOBS = 20
+BROWSER_POOL_MAX_RSS_MB = 2048
+
+# 发布任务队列：后台 worker 数量，任务租约时长（秒），租约过期后最多重试次数
+PUBLISH_WORKERS = 2
+PUBLISH_JOB_LEASE_SECONDS = 120
+PUBLISH_JOB_MAX_ATTEMPTS = 3
+
+# 上传并发：同时进行的上传总数，以及各平台的上限（同一账号始终只会同时打开一个页面）
+UPLOAD_CONCURRENCY = 4
+UPLOAD_PLATFORM_CONCURRENCY = {
+    "douyin": 2,
+    "tencent": 2,
+    "kuaishou": 2,
+    "xiaohongshu": 2,
+}
+
+# Cookie 批量校验：同时进行的检查数，单个账号检查超时（秒）
+COOKIE_CHECK_CONCURRENCY = 5
+COOKIE_CHECK_TIMEOUT = 30
+
+# Cookie 校验结果缓存：各平台结果有效期（秒，key 为平台类型 1 小红书 2 视频号 3 抖音 4 快手 5 TikTok），
+# 未配置的平台使用默认值；后台每隔 COOKIE_REFRESH_INTERVAL 秒提前刷新快过期的结果
+COOKIE_CACHE_TTL = {
+    1: 1800,
+    2: 1800,
+    3: 3600,
+    4: 1800,
+    5: 3600,
+}
+COOKIE_CACHE_DEFAULT_TTL = 1800
+COOKIE_REFRESH_INTERVAL = 300
+
+# Cookie 探测模式：先请求各平台的账号信息接口判断 cookie（毫秒级，不开浏览器），结果不明确时再用浏览器检查。
+# COOKIE_PROBE_BASE_URLS 可以把某个平台（key 为平台类型）的接口指向本地 stub，例如 {3: "http://127.0.0.1:8000"}
+COOKIE_PROBE_MODE = False
+COOKIE_PROBE_BASE_URLS = {}
+COOKIE_PROBE_TIMEOUT = 5
+
+# 等待视频上传完成的最长时间（秒）；“上传中”标记在这段时间（秒）内没出现时视为已经传完；上传出错后最多重试次数
+UPLOAD_WAIT_TIMEOUT = 1800
+UPLOAD_MARKER_TIMEOUT = 5
+UPLOAD_MAX_RETRIES = 3
+
+# 上传页面资源拦截：默认只拦截字体和常见统计埋点；确认不影响发布的平台可以再拦截图片/视频预览，例如
+# RESOURCE_BLOCK_PROFILES = {"douyin": {"types": ["font", "image", "media"], "allow": [r"douyinpic\.com"]}}
+RESOURCE_BLOCKING = True
+RESOURCE_BLOCK_PROFILES = {}
+
+# /upload、/uploadSave 整体上传的请求体上限（字节），更大的文件走分片上传
+UPLOAD_MAX_CONTENT_LENGTH = 160 * 1024 * 1024
+# 分片上传：建议的分片大小、单个分片上限（字节），未完成的上传保留多久（小时）
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+UPLOAD_CHUNK_MAX_SIZE = 64 * 1024 * 1024
+UPLOAD_SESSION_TTL_HOURS = 24
+# 后台清理没有引用的 blob（videoFile 下的文件被直接删除后留下的）的间隔（秒）
+UPLOAD_BLOB_SWEEP_INTERVAL = 3600
+
+# /getFile 通过前置代理的 X-Sendfile 发送文件（需要 nginx X-Accel / apache mod_xsendfile 配合）
+USE_X_SENDFILE = False
+
+# SQLite：覆盖默认的 PRAGMA（默认 WAL、synchronous=NORMAL、busy_timeout=5000ms、mmap 256MB），每个连接缓存的预编译语句数量
+SQLITE_PRAGMAS = {}
+SQLITE_CACHED_STATEMENTS = 256
+
+# 扫码登录：同时进行的会话数、等待扫码的最长时间（秒），每个平台预先打开的二维码页面数及其有效期（秒）
+LOGIN_MAX_SESSIONS = 5
+LOGIN_SCAN_TIMEOUT = 200
+LOGIN_WARM_PAGES = 1
+LOGIN_WARM_PAGE_TTL = 120
+# 所有平台合计最多预热的页面数；有效期内同一平台登录达到几次才开始预热
+LOGIN_WARM_BUDGET = 2
+LOGIN_WARM_MIN_DEMAND = 2
+
+# 远程视频下载：支持 Range 的服务端按段并发下载（每段字节数、同时下载的段数），单次请求超时（秒）和每段重试次数
+DOWNLOAD_PART_SIZE = 8 * 1024 * 1024
+DOWNLOAD_CONCURRENCY = 4
+DOWNLOAD_TIMEOUT = 60
+DOWNLOAD_RETRIES = 3
+
+# 远程视频下载缓存（videoFile/cache）：磁盘占用上限（字节），以及服务端没有 ETag/Last-Modified 时缓存的有效期（秒）
+DOWNLOAD_CACHE_MAX_BYTES = 20 * 1024 * 1024 * 1024
+DOWNLOAD_CACHE_UNVALIDATED_TTL = 3600
+
+# 视频参数探测：ffprobe 路径和单次超时（秒）；发布前按平台限制检查时长/大小/分辨率等，可按平台覆盖，例如
+# MEDIA_LIMITS = {"douyin": {"max_duration": 15 * 60}, "default": {"min_aspect": 0.5, "max_aspect": 2}}
+FFPROBE_PATH = "ffprobe"
+MEDIA_PROBE_TIMEOUT = 60
+MEDIA_LIMITS = {}
+# 不在 videoFile 下的文件现算内容哈希，按 (路径, 大小, 修改时间) 缓存的条数
+MEDIA_HASH_CACHE_SIZE = 256
+
+# 转码：ffmpeg 路径、可用 CPU 核数、同时运行的 ffmpeg 进程数、单个转码的超时（秒）
+# 平台 -> 转码配置名（默认视频号/TikTok 为 h264_1080p，YouTube 为 youtube_2160p），设为 None 表示直接上传原文件
+FFMPEG_PATH = "ffmpeg"
+# TRANSCODE_CPU_BUDGET = 8
+# TRANSCODE_WORKERS = 2
+TRANSCODE_TIMEOUT = 3600
+TRANSCODE_PROFILES = {}
+TRANSCODE_PLATFORM_PROFILES = {}
+
+# 自动封面（coverFile）：没有指定封面时从视频里挑一帧，按平台尺寸裁剪（默认抖音 1080x1440 竖封面、TikTok 1080x1920）
+# 跳过开头的秒数、场景检测分析的时长（秒）、场景切换阈值、候选帧数、单次 ffmpeg 超时（秒）；COVER_PROFILES 可按平台覆盖尺寸
+COVER_SKIP_SECONDS = 1
+COVER_SCAN_SECONDS = 60
+COVER_SCENE_THRESHOLD = 0.3
+COVER_CANDIDATES = 5
+COVER_TIMEOUT = 300
+COVER_PROFILES = {}
+
+# python wsgi.py（waitress）监听的地址、端口和处理请求的线程数；SSE 登录长连接每个占一个线程
+SERVER_HOST = "0.0.0.0"
+SERVER_PORT = 5409
+SERVER_THREADS = 16
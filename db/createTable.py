@@ -1,42 +1,19 @@
-import sqlite3
-import json
-import os
+import sys
+from pathlib import Path
 
-# 数据库文件路径（如果不存在会自动创建）
-db_file = './database.db'
-
-# 如果数据库已存在，则删除旧的表（可选）
-# if os.path.exists(db_file):
-#     os.remove(db_file)
-
-# 连接到SQLite数据库（如果文件不存在则会自动创建）
-conn = sqlite3.connect(db_file)
-cursor = conn.cursor()
+# 允许在 db 目录下直接运行：python createTable.py
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
-# 创建账号记录表
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS user_info (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    type INTEGER NOT NULL,
-    filePath TEXT NOT NULL,  -- 存储文件路径
-    userName TEXT NOT NULL,
-    status INTEGER DEFAULT 0
-)
-''')
-
-# 创建文件记录表
-cursor.execute('''CREATE TABLE IF NOT EXISTS file_records (
-    id INTEGER PRIMARY KEY AUTOINCREMENT, -- 唯一标识每条记录
-    filename TEXT NOT NULL,               -- 文件名
-    filesize REAL,                     -- 文件大小（单位：MB）
-    upload_time DATETIME DEFAULT CURRENT_TIMESTAMP, -- 上传时间，默认当前时间
-    file_path TEXT                        -- 文件路径
-)
-''')
+from utils.db import connect
+from utils.migrations import migrate, MIGRATIONS
 
+# 数据库文件路径（如果不存在会自动创建）
+db_file = Path(__file__).resolve().parent / "database.db"
 
-# 提交更改
-conn.commit()
-print("✅ 表创建成功")
+# 建表、加列、建索引都由 utils/migrations.py 中的迁移完成，已有数据库会原地升级到最新版本
+# 后端启动时也会自动执行同样的迁移
+conn = connect(db_file)
+version = migrate(conn)
+print(f"✅ 表创建成功，数据库版本 {version}/{MIGRATIONS[-1][0]}")
 # 关闭连接
-conn.close()
\ No newline at end of file
+conn.close()
@@ -3,8 +3,14 @@ from pathlib import Path
 from venv import logger
 
 from conf import BASE_DIR
+from myUtils.covers import cover_files
+from myUtils.media_info import check_media_files
+from myUtils.transcode import cut_clip, transcode_files
 # from tk_uploader.main import tiktok_setup, TiktokVideo
 from uploader.tk_uploader.main_chrome import tiktok_setup, TiktokVideo
+from utils.base_social_media import SOCIAL_MEDIA_TIKTOK
+from utils.download_cache import get_download_cache
+from utils.event_loop import run_coroutine
 from utils.files_times import generate_schedule_time_next_day, get_title_and_hashtags
 
 
@@ -30,103 +36,99 @@ def post_video_tiktok(
     video_dir = base_dir / "videoFile" / "tmp"
 
     normalized_files = []
-
-    for f in file_list:
-        f = f.strip()
-
-        # 远程 URL → 只下载前几秒（测试用）
-        if f.startswith("http://") or f.startswith("https://"):
-            local_file = download_video_preview(
-                url=f,
-                output_dir=video_dir,
-                seconds=5  # 👈 你想测几秒就改这里
-            )
-            normalized_files.append(local_file)
-            continue
-
-        # 已经是绝对路径
-        if f.startswith("/"):
-            p = Path(f)
+    download_cache = get_download_cache()
+    acquired = []
+    previews = []
+
+    try:
+        for f in file_list:
+            f = f.strip()
+
+            # 远程 URL → 从下载缓存获取完整视频，再截取前几秒（测试用）
+            if f.startswith("http://") or f.startswith("https://"):
+                source = run_coroutine(download_cache.acquire(f))
+                acquired.append(source)
+                local_file = cut_video_preview(
+                    source=source,
+                    output_dir=video_dir,
+                    seconds=5  # 👈 你想测几秒就改这里
+                )
+                previews.append(local_file)
+                normalized_files.append(local_file)
+                continue
+
+            # 已经是绝对路径
+            if f.startswith("/"):
+                p = Path(f)
+            else:
+                p = base_dir / "videoFile" / f
+
+            if not p.exists():
+                raise FileNotFoundError(f"视频文件不存在：{p}")
+
+            normalized_files.append(p)
+
+        files = normalized_files
+        # 不符合平台要求的视频不再打开浏览器
+        rejected_files = run_coroutine(check_media_files(SOCIAL_MEDIA_TIKTOK, files))
+        # 平台需要的编码/分辨率与源文件不同时先转码
+        files = run_coroutine(transcode_files(SOCIAL_MEDIA_TIKTOK, files, skip=rejected_files))
+        # 没有指定封面、视频旁也没有同名 png 时用自动生成的封面
+        covers = [None] * len(files) if thumbnail_path else \
+            run_coroutine(cover_files(SOCIAL_MEDIA_TIKTOK, files, skip=rejected_files))
+
+        file_num = len(files)
+
+        # 3️⃣ 定时发布
+        if enableTimer:
+            publish_datetimes = generate_schedule_time_next_day(file_num, videos_per_day, daily_times, start_days)
         else:
-            p = base_dir / "videoFile" / f
-
-        if not p.exists():
-            raise FileNotFoundError(f"视频文件不存在：{p}")
-
-        normalized_files.append(p)
-
-    files = normalized_files
-
-    file_num = len(files)
-
-    # 3️⃣ 定时发布
-    if enableTimer:
-        publish_datetimes = generate_schedule_time_next_day(file_num, videos_per_day, daily_times, start_days)
-    else:
-        publish_datetimes = 0
+            publish_datetimes = 0
+
+        # 4️⃣ 逐个上传（可以后面改成并发）
+        for index, file in enumerate(files):
+            if file in rejected_files:
+                logger.error(f"视频不符合平台要求，跳过：{file} -> {rejected_files[file]}")
+                continue
+            video_title = title
+            video_tags = tags
+
+            # 如果没传标题，走自动生成
+            if not title or not tags:
+                video_title, video_tags = get_title_and_hashtags(str(file))
+
+            thumb = Path(thumbnail_path) if thumbnail_path else file.with_suffix('.png')
+            thumb = thumb if thumb.exists() else covers[index]
+
+            app = TiktokVideo(
+                video_title,
+                file,
+                video_tags,
+                publish_datetimes,
+                account_file,
+                thumb
+            )
 
-    # 4️⃣ 逐个上传（可以后面改成并发）
-    for index, file in enumerate(files):
-        video_title = title
-        video_tags = tags
-
-        # 如果没传标题，走自动生成
-        if not title or not tags:
-            video_title, video_tags = get_title_and_hashtags(str(file))
-
-        thumb = Path(thumbnail_path) if thumbnail_path else file.with_suffix('.png')
-        thumb = thumb if thumb.exists() else None
-
-        app = TiktokVideo(
-            video_title,
-            file,
-            video_tags,
-            publish_datetimes,
-            account_file,
-            thumb
-        )
-
-        try:
-            asyncio.run(app.main(), debug=False)
-        except Exception as e:
-            # 单视频失败不影响后续
-            logger.exception(f"TikTok upload failed: {file} -> {e}")
-
-
-def download_video_preview(url: str, output_dir: Path, seconds: int = 5) -> Path:
-    import hashlib
-    import subprocess
-
-    output_dir.mkdir(parents=True, exist_ok=True)
-
-    url_hash = hashlib.md5(url.encode()).hexdigest()
-    output_file = output_dir / f"{url_hash}_test_{seconds}s.mp4"
-
-    if output_file.exists():
-        print(f"测试视频已存在，直接使用：{output_file}")
-        return output_file
-
-    print(f"下载远程视频前 {seconds} 秒：{url}")
-
-    cmd = [
-        "ffmpeg",
-        "-y",
-        "-nostdin",                 # 🔥 防止卡死
-        "-loglevel", "error",       # 可选
-        "-i", url,
-        "-t", str(seconds),
-        "-c", "copy",
-        str(output_file)
-    ]
-
-    subprocess.run(
-        cmd,
-        check=True,
-        stdout=subprocess.DEVNULL,
-        stderr=subprocess.PIPE
-    )
-
-    return output_file
+            try:
+                asyncio.run(app.main(), debug=False)
+            except Exception as e:
+                # 单视频失败不影响后续
+                logger.exception(f"TikTok upload failed: {file} -> {e}")
+    finally:
+        # 截出的片段用完即删，缓存里的完整视频只释放引用，由下载缓存统一淘汰
+        for preview in previews:
+            preview.unlink(missing_ok=True)
+        for source in acquired:
+            download_cache.release(source)
+
+
+def cut_video_preview(source: Path, output_dir: Path, seconds: int = 5) -> Path:
+    import uuid
+
+    output_file = output_dir / f"{source.stem}_{uuid.uuid4().hex[:8]}_test_{seconds}s.mp4"
+    print(f"截取视频前 {seconds} 秒：{source}")
+    # 在后台事件循环上运行，与转码、封面共用 ffmpeg 名额
+    return run_coroutine(cut_clip(source, output_file, seconds))
 
 
 
@@ -1,24 +1,58 @@
 import asyncio
 import configparser
 import os
+import re
+import time
+from contextlib import asynccontextmanager
 from venv import logger
 
 from playwright.async_api import async_playwright
 from xhs import XhsClient
 
+import conf
 from conf import BASE_DIR, LOCAL_CHROME_HEADLESS
+from myUtils.probe import COOKIE_PROBE_MODE, probe_cookie
 from uploader.tk_uploader.main import tiktok_setup
-from utils.base_social_media import set_init_script
-from utils.log import tencent_logger, kuaishou_logger, douyin_logger
+from utils.base_social_media import set_init_script, set_resource_blocking, SOCIAL_MEDIA_DOUYIN, \
+    SOCIAL_MEDIA_TENCENT, SOCIAL_MEDIA_KUAISHOU, SOCIAL_MEDIA_XIAOHONGSHU, SOCIAL_MEDIA_TIKTOK
+from utils.log import tencent_logger, kuaishou_logger, douyin_logger, tiktok_logger
+from utils.metrics import COOKIE_CHECK_SECONDS
 from pathlib import Path
 from uploader.xhs_uploader.main import sign_local
 
-
-async def cookie_auth_douyin(account_file):
+# 批量校验时同时进行的检查数，以及单个账号检查的超时时间（秒）
+COOKIE_CHECK_CONCURRENCY = getattr(conf, "COOKIE_CHECK_CONCURRENCY", 5)
+COOKIE_CHECK_TIMEOUT = getattr(conf, "COOKIE_CHECK_TIMEOUT", 30)
+
+
+@asynccontextmanager
+async def auth_context(account_file, browser_pool=None, platform=None):
+    """
+    提供一个带 cookie 的浏览器上下文：传入 browser_pool 时从池中分配，
+    否则单独启动一个浏览器，退出时关闭。传入 platform 时按该平台规则拦截无用资源。
+    """
+    if browser_pool is not None:
+        async with browser_pool.new_context(storage_state=account_file) as context:
+            yield await _prepare_auth_context(context, platform)
+        return
     async with async_playwright() as playwright:
         browser = await playwright.chromium.launch(headless=LOCAL_CHROME_HEADLESS)
-        context = await browser.new_context(storage_state=account_file)
-        context = await set_init_script(context)
+        try:
+            context = await browser.new_context(storage_state=account_file)
+            yield await _prepare_auth_context(context, platform)
+        finally:
+            await browser.close()
+
+
+async def _prepare_auth_context(context, platform):
+    context = await set_init_script(context)
+    if platform is not None:
+        context = await set_resource_blocking(context, platform)
+    return context
+
+
+async def cookie_auth_douyin(account_file, browser_pool=None):
+    async with auth_context(account_file, browser_pool, SOCIAL_MEDIA_DOUYIN) as context:
         # 创建一个新的页面
         page = await context.new_page()
         # 访问指定的 URL
@@ -32,21 +66,16 @@ async def cookie_auth_douyin(account_file):
                 await page.get_by_text("扫码登录").wait_for(timeout=5000)
                 douyin_logger.error("[+] cookie 失效，需要扫码登录")
                 return False
-            except:
+            except Exception:
                 douyin_logger.success("[+]  cookie 有效")
                 return True
-        except:
+        except Exception:
             douyin_logger.error("[+] 等待5秒 cookie 失效")
-            await context.close()
-            await browser.close()
             return False
 
 
-async def cookie_auth_tencent(account_file):
-    async with async_playwright() as playwright:
-        browser = await playwright.chromium.launch(headless=LOCAL_CHROME_HEADLESS)
-        context = await browser.new_context(storage_state=account_file)
-        context = await set_init_script(context)
+async def cookie_auth_tencent(account_file, browser_pool=None):
+    async with auth_context(account_file, browser_pool, SOCIAL_MEDIA_TENCENT) as context:
         # 创建一个新的页面
         page = await context.new_page()
         # 访问指定的 URL
@@ -55,16 +84,13 @@ async def cookie_auth_tencent(account_file):
             await page.wait_for_selector('div.title-name:has-text("微信小店")', timeout=5000)  # 等待5秒
             tencent_logger.error("[+] 等待5秒 cookie 失效")
             return False
-        except:
+        except Exception:
             tencent_logger.success("[+] cookie 有效")
             return True
 
 
-async def cookie_auth_ks(account_file):
-    async with async_playwright() as playwright:
-        browser = await playwright.chromium.launch(headless=LOCAL_CHROME_HEADLESS)
-        context = await browser.new_context(storage_state=account_file)
-        context = await set_init_script(context)
+async def cookie_auth_ks(account_file, browser_pool=None):
+    async with auth_context(account_file, browser_pool, SOCIAL_MEDIA_KUAISHOU) as context:
         # 创建一个新的页面
         page = await context.new_page()
         # 访问指定的 URL
@@ -74,26 +100,21 @@ async def cookie_auth_ks(account_file):
 
             kuaishou_logger.info("[+] 等待5秒 cookie 失效")
             return False
-        except:
+        except Exception:
             kuaishou_logger.success("[+] cookie 有效")
             return True
 
 
-async def cookie_auth_xhs(account_file):
-    async with async_playwright() as playwright:
-        browser = await playwright.chromium.launch(headless=LOCAL_CHROME_HEADLESS)
-        context = await browser.new_context(storage_state=account_file)
-        context = await set_init_script(context)
+async def cookie_auth_xhs(account_file, browser_pool=None):
+    async with auth_context(account_file, browser_pool, SOCIAL_MEDIA_XIAOHONGSHU) as context:
         # 创建一个新的页面
         page = await context.new_page()
         # 访问指定的 URL
         await page.goto("https://creator.xiaohongshu.com/creator-micro/content/upload")
         try:
             await page.wait_for_url("https://creator.xiaohongshu.com/creator-micro/content/upload", timeout=5000)
-        except:
+        except Exception:
             print("[+] 等待5秒 cookie 失效")
-            await context.close()
-            await browser.close()
             return False
         # 2024.06.17 抖音创作者中心改版
         if await page.get_by_text('手机号登录').count() or await page.get_by_text('扫码登录').count():
@@ -104,21 +125,60 @@ async def cookie_auth_xhs(account_file):
             return True
 
 
-async def check_cookie(type, file_path):
+async def cookie_auth_tiktok(account_file, browser_pool=None):
+    if not os.path.exists(account_file):
+        return False
+    async with auth_context(account_file, browser_pool, SOCIAL_MEDIA_TIKTOK) as context:
+        # 创建一个新的页面
+        page = await context.new_page()
+        # 访问指定的 URL
+        await page.goto("https://www.tiktok.com/tiktokstudio/upload?lang=en")
+        await page.wait_for_load_state('networkidle')
+        try:
+            # 选择所有的 select 元素
+            select_elements = await page.query_selector_all('select')
+            for element in select_elements:
+                class_name = await element.get_attribute('class')
+                # 使用正则表达式匹配特定模式的 class 名称
+                if re.match(r'tiktok-.*-SelectFormContainer.*', class_name):
+                    tiktok_logger.error("[+] cookie expired")
+                    return False
+            tiktok_logger.success("[+] cookie valid")
+            return True
+        except Exception:
+            tiktok_logger.success("[+] cookie valid")
+            return True
+
+
+async def check_cookie(type, file_path, browser_pool=None):
+    started = time.perf_counter()
+    result = await _check_cookie(type, file_path, browser_pool)
+    COOKIE_CHECK_SECONDS.observe(time.perf_counter() - started, type=type, result=str(result).lower())
+    return result
+
+
+async def _check_cookie(type, file_path, browser_pool=None):
     try:
         cookie_path = Path(BASE_DIR / "cookiesFile" / file_path)
 
+        if COOKIE_PROBE_MODE:
+            result = await probe_cookie(type, cookie_path)
+            if result is not None:
+                return result
+
         match type:
             case 1:
-                return await cookie_auth_xhs(cookie_path)
+                return await cookie_auth_xhs(cookie_path, browser_pool)
             case 2:
-                return await cookie_auth_tencent(cookie_path)
+                return await cookie_auth_tencent(cookie_path, browser_pool)
             case 3:
-                return await cookie_auth_douyin(cookie_path)
+                return await cookie_auth_douyin(cookie_path, browser_pool)
             case 4:
-                return await cookie_auth_ks(cookie_path)
+                return await cookie_auth_ks(cookie_path, browser_pool)
             case 5:
-                return await tiktok_setup(cookie_path)
+                if browser_pool is None:
+                    return await tiktok_setup(cookie_path)
+                return await cookie_auth_tiktok(cookie_path, browser_pool)
             case _:
                 return False
 
@@ -129,5 +189,26 @@ async def check_cookie(type, file_path):
         return False
 
 
+async def check_cookies(accounts, browser_pool, concurrency=None, timeout=None):
+    """
+    并发校验多个账号的 cookie，accounts 为 [(type, file_path), ...]。
+    同时进行的检查数受 concurrency 限制，单个检查超过 timeout 秒返回 None（状态未知），
+    返回结果与 accounts 一一对应。
+    """
+    semaphore = asyncio.Semaphore(concurrency or COOKIE_CHECK_CONCURRENCY)
+    timeout = timeout or COOKIE_CHECK_TIMEOUT
+
+    async def check_one(type, file_path):
+        async with semaphore:
+            try:
+                return await asyncio.wait_for(check_cookie(type, file_path, browser_pool), timeout)
+            except asyncio.TimeoutError:
+                COOKIE_CHECK_SECONDS.observe(timeout, type=type, result="timeout")
+                logger.warning(f"[!] check_cookie timeout after {timeout}s, type={type}, file={file_path}")
+                return None
+
+    return await asyncio.gather(*[check_one(type, file_path) for type, file_path in accounts])
+
+
 # a = asyncio.run(check_cookie(1,"3a6cfdc0-3d51-11f0-8507-44e51723d63c.json"))
 # print(a)
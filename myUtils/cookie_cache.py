@@ -0,0 +1,163 @@
+import asyncio
+import hashlib
+import time
+from pathlib import Path
+
+import conf
+from conf import BASE_DIR
+from myUtils.auth import check_cookie, check_cookies
+from utils.browser_pool import get_browser_pool
+from utils.db import get_connection
+from utils.event_loop import spawn
+from utils.log import logger
+from utils.migrations import ensure_schema
+
+# 各平台 cookie 校验结果的有效期（秒），key 为平台类型：1 小红书 2 视频号 3 抖音 4 快手 5 TikTok
+COOKIE_CACHE_TTL = getattr(conf, "COOKIE_CACHE_TTL", {})
+COOKIE_CACHE_DEFAULT_TTL = getattr(conf, "COOKIE_CACHE_DEFAULT_TTL", 1800)
+# 后台刷新：多久扫描一次，以及条目用掉多少比例的有效期后提前重新校验
+COOKIE_REFRESH_INTERVAL = getattr(conf, "COOKIE_REFRESH_INTERVAL", 300)
+COOKIE_REFRESH_RATIO = 0.8
+
+
+def cookie_ttl(type):
+    return COOKIE_CACHE_TTL.get(type, COOKIE_CACHE_DEFAULT_TTL)
+
+
+def _cookie_path(file_path):
+    return Path(BASE_DIR / "cookiesFile" / file_path)
+
+
+def _content_hash(cookie_path):
+    try:
+        return hashlib.sha1(cookie_path.read_bytes()).hexdigest()
+    except OSError:
+        return None
+
+
+def get_cached_validity(type, file_path):
+    """
+    返回缓存中仍然新鲜的校验结果（True/False），
+    没有记录、已过期或 cookie 文件内容已变化时返回 None。
+    """
+    cookie_path = _cookie_path(file_path)
+    content_hash = _content_hash(cookie_path)
+    if content_hash is None:
+        return False
+    ensure_schema()
+    with get_connection() as conn:
+        row = conn.execute('''
+        SELECT content_hash, valid, checked_at FROM cookie_validity WHERE file_path = ?
+        ''', (str(cookie_path),)).fetchone()
+    if row is None or row[0] != content_hash or time.time() - row[2] > cookie_ttl(type):
+        return None
+    return bool(row[1])
+
+
+def record_validities(results):
+    """写入校验结果，results 为 [(type, file_path, valid), ...]，valid 为 None 的不记录"""
+    now = time.time()
+    params = []
+    for type, file_path, valid in results:
+        if valid is None:
+            continue
+        cookie_path = _cookie_path(file_path)
+        content_hash = _content_hash(cookie_path)
+        if content_hash is None:
+            continue
+        params.append((str(cookie_path), type, content_hash, int(valid), now))
+    if not params:
+        return
+    ensure_schema()
+    with get_connection() as conn:
+        conn.executemany('''
+        INSERT OR REPLACE INTO cookie_validity (file_path, type, content_hash, valid, checked_at)
+        VALUES (?, ?, ?, ?, ?)
+        ''', params)
+        conn.commit()
+
+
+async def check_cookie_cached(type, file_path, browser_pool=None):
+    """先读缓存，缓存不新鲜时才做一次真实校验并写回缓存"""
+    valid = get_cached_validity(type, file_path)
+    if valid is not None:
+        return valid
+    valid = await check_cookie(type, file_path, browser_pool)
+    record_validities([(type, file_path, valid)])
+    return valid
+
+
+async def check_cookies_cached(accounts, browser_pool=None):
+    """
+    批量版本，accounts 为 [(type, file_path), ...]。
+    只对缓存不新鲜的账号并发做真实校验，返回结果与 accounts 一一对应（超时为 None）。
+    browser_pool 为空时使用当前事件循环的共享浏览器池。
+    """
+    results = [get_cached_validity(type, file_path) for type, file_path in accounts]
+    stale = [index for index, valid in enumerate(results) if valid is None]
+    if stale:
+        browser_pool = browser_pool or await get_browser_pool()
+        fresh = await check_cookies([accounts[index] for index in stale], browser_pool)
+        for index, valid in zip(stale, fresh):
+            results[index] = valid
+        record_validities([(*accounts[index], valid) for index, valid in zip(stale, fresh)])
+    return results
+
+
+class CookieRefresher(object):
+    """
+    后台刷新：定期找出即将过期（已用掉 COOKIE_REFRESH_RATIO 的有效期）的缓存条目，
+    提前重新校验并同步 user_info 的状态，让前台请求几乎总能命中缓存。
+    """
+
+    def __init__(self, interval=None):
+        self.interval = interval or COOKIE_REFRESH_INTERVAL
+        self._future = None
+
+    def start(self):
+        if self._future is not None:
+            return
+        ensure_schema()
+        self._future = spawn(self._run(), "cookie refresher")
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh_once()
+            except Exception as e:
+                logger.exception(f"[cookie refresher] 刷新失败: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def refresh_once(self):
+        now = time.time()
+        with get_connection() as conn:
+            accounts = conn.execute('SELECT id, type, filePath FROM user_info').fetchall()
+            checked = dict(conn.execute('SELECT file_path, checked_at FROM cookie_validity').fetchall())
+        due = []
+        for row in accounts:
+            checked_at = checked.get(str(_cookie_path(row[2])))
+            if checked_at is None or now - checked_at > cookie_ttl(row[1]) * COOKIE_REFRESH_RATIO:
+                due.append(row)
+        if not due:
+            return
+        logger.info(f"[cookie refresher] 重新校验 {len(due)} 个账号")
+        browser_pool = await get_browser_pool()
+        results = await check_cookies([(row[1], row[2]) for row in due], browser_pool)
+        record_validities([(row[1], row[2], valid) for row, valid in zip(due, results)])
+        invalid_ids = [(0, row[0]) for row, valid in zip(due, results) if valid is False]
+        if invalid_ids:
+            with get_connection() as conn:
+                conn.executemany('UPDATE user_info SET status = ? WHERE id = ?', invalid_ids)
+                conn.commit()
+
+
+_refresher = None
+
+
+def start_cookie_refresher(interval=None):
+    """启动后台 cookie 刷新（重复调用只启动一次）"""
+    global _refresher
+    if _refresher is None:
+        _refresher = CookieRefresher(interval)
+        _refresher.start()
+    return _refresher
@@ -0,0 +1,145 @@
+import asyncio
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import conf
+from conf import BASE_DIR
+from myUtils.media_info import probe_media
+from myUtils.transcode import FFMPEG_PATH, TRANSCODE_CPU_BUDGET, TRANSCODE_WORKERS, ffmpeg_slot
+from utils.base_social_media import SOCIAL_MEDIA_DOUYIN, SOCIAL_MEDIA_TIKTOK
+from utils.log import logger
+
+# 自动封面目录：coverFile/ab/{源文件sha256}_frame.jpg 为挑出的代表帧，{源文件sha256}_{平台}_{宽}x{高}.jpg 为各平台封面，
+# 同一内容只挑一次帧、每个平台只裁一次
+COVER_DIR = Path(BASE_DIR / "coverFile")
+# 挑帧时跳过开头的秒数（片头常是黑场/转场）、只分析的时长（秒）、场景切换阈值（0~1）、候选帧数
+COVER_SKIP_SECONDS = getattr(conf, "COVER_SKIP_SECONDS", 1)
+COVER_SCAN_SECONDS = getattr(conf, "COVER_SCAN_SECONDS", 60)
+COVER_SCENE_THRESHOLD = getattr(conf, "COVER_SCENE_THRESHOLD", 0.3)
+COVER_CANDIDATES = getattr(conf, "COVER_CANDIDATES", 5)
+COVER_TIMEOUT = getattr(conf, "COVER_TIMEOUT", 300)
+
+# 平台 -> 封面尺寸，没有配置的平台不生成封面；代表帧按封面宽高比居中裁剪后缩放
+#   抖音上传的是竖封面（3:4），TikTok 封面与视频同为 9:16
+COVER_PROFILES = {
+    SOCIAL_MEDIA_DOUYIN: {"width": 1080, "height": 1440},
+    SOCIAL_MEDIA_TIKTOK: {"width": 1080, "height": 1920},
+}
+COVER_PROFILES.update(getattr(conf, "COVER_PROFILES", {}))
+
+
+class CoverError(Exception):
+    """ffmpeg 无法从视频中取出封面"""
+
+
+async def _run_ffmpeg(*args):
+    threads = max(1, TRANSCODE_CPU_BUDGET // TRANSCODE_WORKERS)
+    async with ffmpeg_slot():
+        process = await asyncio.create_subprocess_exec(
+            FFMPEG_PATH, "-nostdin", "-y", "-v", "error", "-threads", str(threads), *args,
+            stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE)
+        try:
+            _, stderr = await asyncio.wait_for(process.communicate(), timeout=COVER_TIMEOUT)
+        except BaseException:
+            process.kill()
+            await process.wait()
+            raise
+    if process.returncode != 0:
+        raise CoverError(stderr.decode("utf-8", "replace").strip()[-500:] or f"ffmpeg 退出码 {process.returncode}")
+
+
+async def extract_frame(path, info, output):
+    """
+    挑一帧作为封面底图：在开头 COVER_SCAN_SECONDS 内用场景检测取前几个镜头切换后的画面，
+    选编码后最大的一张（细节最多，避开黑场、纯色过渡）；没有场景切换时用 thumbnail 滤镜从视频 1/3 处挑一帧。
+    """
+    duration = info.get("duration") or 0
+    start = min(COVER_SKIP_SECONDS, duration / 10)
+    workdir = Path(tempfile.mkdtemp(prefix=".frames_", dir=output.parent))
+    try:
+        await _run_ffmpeg("-ss", f"{start:.3f}", "-t", str(COVER_SCAN_SECONDS), "-i", str(path),
+                          "-vf", f"select='gt(scene,{COVER_SCENE_THRESHOLD})'", "-vsync", "vfr",
+                          "-frames:v", str(COVER_CANDIDATES), "-q:v", "2", str(workdir / "scene_%02d.jpg"))
+        candidates = list(workdir.glob("scene_*.jpg"))
+        if not candidates:
+            await _run_ffmpeg("-ss", f"{duration / 3:.3f}", "-i", str(path), "-vf", "thumbnail",
+                              "-frames:v", "1", "-q:v", "2", str(workdir / "thumbnail.jpg"))
+            candidates = list(workdir.glob("thumbnail.jpg"))
+        if not candidates:
+            raise CoverError("没有取到任何画面")
+        os.replace(max(candidates, key=lambda candidate: candidate.stat().st_size), output)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+async def render_cover(frame, profile, output):
+    """把代表帧按封面宽高比居中裁剪并缩放到封面尺寸"""
+    width, height = profile["width"], profile["height"]
+    aspect = width / height
+    part = output.with_name(output.name + ".part")
+    await _run_ffmpeg("-i", str(frame),
+                      "-vf", f"crop='min(iw,ih*{aspect:.6f})':'min(ih,iw/{aspect:.6f})',scale={width}:{height}",
+                      "-frames:v", "1", "-q:v", "2", "-f", "image2", str(part))
+    os.replace(part, output)
+
+
+_running = {}
+_ffmpeg_missing = False
+
+
+async def _once(output, make):
+    """output 不存在时生成它，同一输出同时只生成一次，其余调用等待同一个任务"""
+    if output.exists():
+        return output
+    task = _running.get(output)
+    if task is None or task.get_loop() is not asyncio.get_running_loop():
+        output.parent.mkdir(parents=True, exist_ok=True)
+        task = asyncio.ensure_future(make())
+        _running[output] = task
+        task.add_done_callback(lambda done: _running.pop(output, None))
+    await asyncio.shield(task)
+    return output
+
+
+async def cover_for_platform(platform, path):
+    """
+    返回 path 在 platform 上使用的封面路径（必要时先生成），结果按内容哈希缓存在 coverFile 下。
+    平台没有封面配置、没有 ffmpeg/ffprobe 或生成失败时返回 None，上传器按没有封面处理。
+    """
+    global _ffmpeg_missing
+    profile = COVER_PROFILES.get(platform)
+    if not profile or _ffmpeg_missing:
+        return None
+    try:
+        info = await probe_media(path)
+        if info is None or info.get("error") or info.get("video_codec") is None:
+            return None
+        content_hash = info["content_hash"]
+        directory = COVER_DIR / content_hash[:2]
+        output = directory / f"{content_hash}_{platform}_{profile['width']}x{profile['height']}.jpg"
+        if output.exists():
+            return output
+        frame = await _once(directory / f"{content_hash}_frame.jpg",
+                            lambda: extract_frame(path, info, directory / f"{content_hash}_frame.jpg"))
+        await _once(output, lambda: render_cover(frame, profile, output))
+    except FileNotFoundError:
+        if not Path(path).exists():
+            raise
+        _ffmpeg_missing = True
+        logger.warning(f"[cover] 找不到 {FFMPEG_PATH}，不生成封面")
+        return None
+    except Exception as e:
+        logger.warning(f"[cover] {Path(path).name} 生成封面失败: {e}")
+        return None
+    logger.info(f"[cover] {Path(path).name} -> {output.name}")
+    return output
+
+
+async def cover_files(platform, files, skip=()):
+    """并发准备一批文件的平台封面，返回与 files 一一对应的路径（没有封面为 None）；skip 中的文件不生成"""
+    async def prepare(file):
+        return None if file in skip else await cover_for_platform(platform, file)
+
+    return list(await asyncio.gather(*(prepare(file) for file in files)))
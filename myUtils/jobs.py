@@ -0,0 +1,293 @@
+import asyncio
+import json
+import time
+import uuid
+
+import conf
+from examples.upload_video_to_tiktok import post_video_tiktok
+from examples.upload_video_to_youtobe import post_video_youtobe
+from myUtils.postVideo import post_video_tencent_async, post_video_DouYin_async, post_video_ks_async, \
+    post_video_xhs_async
+from myUtils.publish_progress import PublishProgress, get_job_items
+from utils.browser_pool import get_browser_pool
+from utils.base_social_media import SOCIAL_MEDIA_TYPES
+from utils.db import get_connection, row_cursor, immediate_transaction
+from utils.event_loop import get_loop, spawn
+from utils.log import logger
+from utils.metrics import REGISTRY, PUBLISH_JOBS, PUBLISH_JOBS_FINISHED
+from utils.migrations import ensure_schema
+
+PUBLISH_WORKERS = getattr(conf, "PUBLISH_WORKERS", 2)
+PUBLISH_JOB_LEASE_SECONDS = getattr(conf, "PUBLISH_JOB_LEASE_SECONDS", 120)
+PUBLISH_JOB_MAX_ATTEMPTS = getattr(conf, "PUBLISH_JOB_MAX_ATTEMPTS", 3)
+# 没有新任务通知时，多久扫描一次数据库（同时用于回收租约过期的任务）
+PUBLISH_JOB_POLL_SECONDS = 5
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+
+def enqueue_publish_job(data):
+    """把一次 /postVideo 请求写入任务表，返回任务 ID"""
+    worker_pool = start_publish_workers()
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+        INSERT INTO publish_jobs (type, payload, status)
+        VALUES (?, ?, ?)
+        ''', (data.get('type'), json.dumps(data, ensure_ascii=False), JOB_QUEUED))
+        conn.commit()
+        job_id = cursor.lastrowid
+    worker_pool.notify()
+    return job_id
+
+
+def get_publish_jobs(job_ids=None):
+    """查询任务状态（items 为各个 文件×账号 的结果），job_ids 为空时返回最近的 100 条"""
+    with get_connection() as conn:
+        cursor = row_cursor(conn)
+        if job_ids:
+            placeholders = ",".join("?" for _ in job_ids)
+            cursor.execute(f'''
+            SELECT id, type, status, attempts, error, created_at, started_at, finished_at
+            FROM publish_jobs WHERE id IN ({placeholders}) ORDER BY id
+            ''', list(job_ids))
+        else:
+            cursor.execute('''
+            SELECT id, type, status, attempts, error, created_at, started_at, finished_at
+            FROM publish_jobs ORDER BY id DESC LIMIT 100
+            ''')
+        jobs = [dict(row) for row in cursor.fetchall()]
+    items = get_job_items([job['id'] for job in jobs])
+    for job in jobs:
+        job['items'] = items.get(job['id'], [])
+    return jobs
+
+
+def _pending_files(progress, file_list, account):
+    # TikTok/YouTube 的流程不回报单个文件的结果，整批成功后一起记录，重新执行时跳过已经成功的文件
+    if progress is None:
+        return list(file_list)
+    return [file for file in file_list if not progress.is_done(file, account)]
+
+
+def _record_files(progress, file_list, account):
+    if progress is not None:
+        for file in file_list:
+            progress.record(file, account)
+
+
+async def run_publish(data, browser_pool=None, progress=None):
+    """
+    按平台类型执行一次发布，data 与 /postVideo 的请求体一致；
+    progress（myUtils.publish_progress.PublishProgress）记录每个 文件×账号 的结果并跳过已经成功的组合。
+    """
+    file_list = data.get('fileList', [])
+    account_list = data.get('accountList', [])
+    type = data.get('type')
+    title = data.get('title')
+    tags = data.get('tags')
+    category = data.get('category')
+    enableTimer = data.get('enableTimer')
+    if category == 0:
+        category = None
+    productLink = data.get('productLink', '')
+    productTitle = data.get('productTitle', '')
+    thumbnail_path = data.get('thumbnail', '')
+    is_draft = data.get('isDraft', False)
+
+    videos_per_day = data.get('videosPerDay')
+    daily_times = data.get('dailyTimes')
+    start_days = data.get('startDays')
+    match type:
+        case 1:
+            await post_video_xhs_async(title, file_list, tags, account_list, category, enableTimer, videos_per_day,
+                                       daily_times, start_days, browser_pool=browser_pool, progress=progress)
+        case 2:
+            await post_video_tencent_async(title, file_list, tags, account_list, category, enableTimer, videos_per_day,
+                                           daily_times, start_days, is_draft, browser_pool=browser_pool,
+                                           progress=progress)
+        case 3:
+            await post_video_DouYin_async(title, file_list, tags, account_list, category, enableTimer, videos_per_day,
+                                          daily_times, start_days, thumbnail_path, productLink, productTitle,
+                                          browser_pool=browser_pool, progress=progress)
+        case 4:
+            await post_video_ks_async(title, file_list, tags, account_list, category, enableTimer, videos_per_day,
+                                      daily_times, start_days, browser_pool=browser_pool, progress=progress)
+        case 5:
+            account = account_list[0]  # TikTok 一般单账号
+            file_list = _pending_files(progress, file_list, account)
+            if not file_list:
+                return
+            # TikTok 流程仍是同步实现，放到线程里执行
+            await asyncio.to_thread(
+                post_video_tiktok,
+                file_list=file_list,
+                account_file=account,
+                title=title,
+                tags=tags,
+                enableTimer=enableTimer,
+                videos_per_day=videos_per_day,
+                daily_times=daily_times,
+                start_days=start_days,
+                thumbnail_path=thumbnail_path
+            )
+            _record_files(progress, file_list, account)
+        case 6:
+            file_list = _pending_files(progress, file_list, "")
+            if not file_list:
+                return
+            # 直接运行在共享事件循环上，其中的 ffmpeg 截取用异步子进程，不能有阻塞调用
+            await post_video_youtobe(
+                file_list=file_list,
+                title=title,
+                tags=tags,
+                enableTimer=enableTimer,
+                videos_per_day=videos_per_day,
+                daily_times=daily_times,
+                start_days=start_days,
+                thumbnail_path=thumbnail_path
+            )
+            _record_files(progress, file_list, "")
+        case _:
+            raise ValueError(f"不支持的平台类型: {type}")
+
+
+class PublishWorkerPool(object):
+    """
+    发布任务 worker 池：在后台事件循环（utils.event_loop）里运行 N 个 worker（N 为同时执行的任务数，
+    任务内部的 文件×账号 并发由 utils.concurrency 控制），
+    每个 worker 以租约方式领取 publish_jobs 中的任务，执行期间定期续约，
+    进程崩溃后租约到期的任务会被重新领取（最多 PUBLISH_JOB_MAX_ATTEMPTS 次），已经成功的 文件×账号 不再重复发布。
+    """
+
+    def __init__(self, workers=None):
+        self.workers = workers or PUBLISH_WORKERS
+        self.owner = f"{uuid.uuid1()}"
+        self._loop = None
+        self._future = None
+        self._wakeup = None
+
+    def start(self):
+        if self._future is not None:
+            return
+        ensure_schema()
+        self._loop = get_loop()
+        self._future = spawn(self._run(), "publish workers")
+
+    def notify(self):
+        """有新任务入队，唤醒空闲的 worker"""
+        if self._loop is not None and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def _run(self):
+        self._wakeup = asyncio.Event()
+        workers = [self._worker(f"{self.owner}-{i}") for i in range(self.workers)]
+        await asyncio.gather(*workers)
+
+    async def _worker(self, worker_id):
+        while True:
+            self._wakeup.clear()
+            job = await asyncio.to_thread(self._claim, worker_id)
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=PUBLISH_JOB_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._execute(worker_id, job)
+
+    async def _execute(self, worker_id, job):
+        logger.info(f"[publish job {job['id']}] 开始执行, worker={worker_id}, 第{job['attempts']}次")
+        heartbeat = asyncio.create_task(self._heartbeat(worker_id, job['id']))
+        try:
+            # 同一 worker 循环里的所有任务共用浏览器池和上传并发名额
+            await run_publish(json.loads(job['payload']), await get_browser_pool(), PublishProgress(job['id']))
+        except Exception as e:
+            logger.exception(f"[publish job {job['id']}] 执行失败: {e}")
+            self._finish(worker_id, job['id'], JOB_FAILED, str(e))
+        else:
+            logger.success(f"[publish job {job['id']}] 执行成功")
+            self._finish(worker_id, job['id'], JOB_SUCCEEDED, None)
+        finally:
+            heartbeat.cancel()
+
+    async def _heartbeat(self, worker_id, job_id):
+        while True:
+            await asyncio.sleep(PUBLISH_JOB_LEASE_SECONDS / 3)
+            with get_connection() as conn:
+                conn.execute('''
+                UPDATE publish_jobs SET lease_expires = ?
+                WHERE id = ? AND lease_owner = ?
+                ''', (time.time() + PUBLISH_JOB_LEASE_SECONDS, job_id, worker_id))
+                conn.commit()
+
+    @staticmethod
+    def _claim(worker_id):
+        with immediate_transaction() as conn:
+            now = time.time()
+            while True:
+                row = row_cursor(conn).execute('''
+                SELECT * FROM publish_jobs
+                WHERE status = ? OR (status = ? AND lease_expires < ?)
+                ORDER BY id LIMIT 1
+                ''', (JOB_QUEUED, JOB_RUNNING, now)).fetchone()
+                if row is None:
+                    return None
+                if row['attempts'] >= PUBLISH_JOB_MAX_ATTEMPTS:
+                    # 租约过期且已达到最大尝试次数，直接判定失败
+                    conn.execute('''
+                    UPDATE publish_jobs SET status = ?, error = ?, lease_owner = NULL, finished_at = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                    ''', (JOB_FAILED, "lease expired too many times", row['id']))
+                    continue
+                conn.execute('''
+                UPDATE publish_jobs
+                SET status = ?, lease_owner = ?, lease_expires = ?, attempts = attempts + 1, started_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+                ''', (JOB_RUNNING, worker_id, now + PUBLISH_JOB_LEASE_SECONDS, row['id']))
+                job = dict(row)
+                job['attempts'] += 1
+                return job
+
+    @staticmethod
+    def _finish(worker_id, job_id, status, error):
+        with get_connection() as conn:
+            conn.execute('''
+            UPDATE publish_jobs
+            SET status = ?, error = ?, lease_owner = NULL, lease_expires = NULL, finished_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND lease_owner = ?
+            ''', (status, error, job_id, worker_id))
+            conn.commit()
+            row = conn.execute('SELECT type FROM publish_jobs WHERE id = ?', (job_id,)).fetchone()
+        PUBLISH_JOBS_FINISHED.inc(platform=_platform_name(row[0] if row else None), status=status)
+
+
+_PLATFORM_NAMES = {type: name for name, type in SOCIAL_MEDIA_TYPES.items()}
+
+
+def _platform_name(type):
+    return _PLATFORM_NAMES.get(type, str(type))
+
+
+@REGISTRY.add_collector
+def _collect_publish_jobs():
+    with get_connection() as conn:
+        rows = conn.execute('SELECT type, status, COUNT(*) FROM publish_jobs GROUP BY type, status').fetchall()
+    PUBLISH_JOBS.clear()
+    for type, status, count in rows:
+        PUBLISH_JOBS.set(count, platform=_platform_name(type), status=status)
+
+
+_worker_pool = None
+
+
+def start_publish_workers(workers=None):
+    """启动进程内的发布 worker 池（重复调用只启动一次）"""
+    global _worker_pool
+    if _worker_pool is None:
+        _worker_pool = PublishWorkerPool(workers)
+        _worker_pool.start()
+    return _worker_pool
@@ -1,380 +1,311 @@
 import asyncio
-import sqlite3
-
-from playwright.async_api import async_playwright
-
-from myUtils.auth import check_cookie
-from utils.base_social_media import set_init_script
+import time
 import uuid
+from collections import deque
+from contextlib import AsyncExitStack
 from pathlib import Path
-from conf import BASE_DIR, LOCAL_CHROME_HEADLESS
 
-# 抖音登录
-async def douyin_cookie_gen(id,status_queue):
-    url_changed_event = asyncio.Event()
-    async def on_url_change():
-        # 检查是否是主框架的变化
-        if page.url != original_url:
-            url_changed_event.set()
-    async with async_playwright() as playwright:
-        options = {
-            'headless': LOCAL_CHROME_HEADLESS
-        }
-        # Make sure to run headed.
-        browser = await playwright.chromium.launch(**options)
-        # Setup context however you like.
-        context = await browser.new_context()  # Pass any options
-        context = await set_init_script(context)
-        # Pause the page, and start recording manually.
-        page = await context.new_page()
-        await page.goto("https://creator.douyin.com/")
-        original_url = page.url
-        img_locator = page.get_by_role("img", name="二维码")
-        # 获取 src 属性值
-        src = await img_locator.get_attribute("src")
-        print("✅ 图片地址:", src)
-        status_queue.put(src)
-        # 监听页面的 'framenavigated' 事件，只关注主框架的变化
-        page.on('framenavigated',
-                lambda frame: asyncio.create_task(on_url_change()) if frame == page.main_frame else None)
+import conf
+from conf import BASE_DIR
+from myUtils.cookie_cache import check_cookie_cached
+from utils.base_social_media import set_init_script, SOCIAL_MEDIA_DOUYIN, SOCIAL_MEDIA_TENCENT, SOCIAL_MEDIA_KUAISHOU, \
+    SOCIAL_MEDIA_TIKTOK, SOCIAL_MEDIA_XIAOHONGSHU
+from utils.browser_pool import get_browser_pool
+from utils.db import get_connection
+from utils.log import logger
+from utils.timing import StepTimer
+
+# 同时进行的扫码登录数，超过的排队等待
+LOGIN_MAX_SESSIONS = getattr(conf, "LOGIN_MAX_SESSIONS", 5)
+# 等待扫码的最长时间（秒），排队时间也计算在内
+LOGIN_SCAN_TIMEOUT = getattr(conf, "LOGIN_SCAN_TIMEOUT", 200)
+# 每个平台预先打开、停在二维码页面的页面数，以及它们的有效期（秒，二维码本身也会过期）
+LOGIN_WARM_PAGES = getattr(conf, "LOGIN_WARM_PAGES", 1)
+LOGIN_WARM_PAGE_TTL = getattr(conf, "LOGIN_WARM_PAGE_TTL", 120)
+# 所有平台合计最多保留的预热页面数；一个平台在 LOGIN_WARM_PAGE_TTL 内登录达到 LOGIN_WARM_MIN_DEMAND 次才预热
+LOGIN_WARM_BUDGET = getattr(conf, "LOGIN_WARM_BUDGET", 2)
+LOGIN_WARM_MIN_DEMAND = getattr(conf, "LOGIN_WARM_MIN_DEMAND", 2)
+
+
+# 各平台打开登录页直到二维码出现的步骤，返回二维码图片地址
+async def _douyin_qrcode(page):
+    await page.goto("https://creator.douyin.com/")
+    return await page.get_by_role("img", name="二维码").get_attribute("src")
+
+
+async def _tencent_qrcode(page):
+    await page.goto("https://channels.weixin.qq.com")
+    # 二维码在 iframe 里
+    return await page.frame_locator("iframe").first.get_by_role("img").first.get_attribute("src")
+
+
+async def _ks_qrcode(page):
+    await page.goto("https://cp.kuaishou.com")
+    # 定位并点击“立即登录”按钮（类型为 link）
+    await page.get_by_role("link", name="立即登录").click()
+    await page.get_by_text("扫码登录").click()
+    return await page.get_by_role("img", name="qrcode").get_attribute("src")
+
+
+async def _tiktok_qrcode(page):
+    await page.goto("https://www.tiktok.com/tiktokstudio/upload?lang=en")
+    await page.get_by_text("使用二维码").click()
+    return await page.get_by_role("img", name="qrcode").get_attribute("src")
+
+
+async def _xhs_qrcode(page):
+    await page.goto("https://creator.xiaohongshu.com/")
+    await page.locator('img.css-wemwzq').click()
+    return await page.get_by_role("img").nth(2).get_attribute("src")
+
+
+# 平台类型 -> (平台名, 打开二维码的函数, 上下文参数)
+LOGIN_PLATFORMS = {
+    1: (SOCIAL_MEDIA_XIAOHONGSHU, _xhs_qrcode, {"locale": "en-GB"}),
+    2: (SOCIAL_MEDIA_TENCENT, _tencent_qrcode, {"locale": "en-GB"}),
+    3: (SOCIAL_MEDIA_DOUYIN, _douyin_qrcode, {}),
+    4: (SOCIAL_MEDIA_KUAISHOU, _ks_qrcode, {"locale": "en-GB"}),
+    5: (SOCIAL_MEDIA_TIKTOK, _tiktok_qrcode, {"locale": "en-GB"}),
+}
+
+
+class LoginPage(object):
+    """停在二维码页面的登录页，持有共享浏览器池分配的上下文，close() 时归还；预热的页面使用备用上下文"""
+
+    def __init__(self, stack, context, page, qrcode):
+        self.stack = stack
+        self.context = context
+        self.page = page
+        self.qrcode = qrcode
+        self.original_url = page.url
+        self.created_at = time.monotonic()
+
+    def fresh(self):
+        return not self.page.is_closed() and time.monotonic() - self.created_at < LOGIN_WARM_PAGE_TTL
+
+    async def close(self):
         try:
-            # 等待 URL 变化或超时
-            await asyncio.wait_for(url_changed_event.wait(), timeout=200)  # 最多等待 200 秒
-            print("监听页面跳转成功")
-        except asyncio.TimeoutError:
-            print("监听页面跳转超时")
-            await page.close()
-            await context.close()
-            await browser.close()
-            status_queue.put("500")
-            return None
-        uuid_v1 = uuid.uuid1()
-        print(f"UUID v1: {uuid_v1}")
-        # 确保cookiesFile目录存在
-        cookies_dir = Path(BASE_DIR / "cookiesFile")
-        cookies_dir.mkdir(exist_ok=True)
-        await context.storage_state(path=cookies_dir / f"{uuid_v1}.json")
-        result = await check_cookie(3, f"{uuid_v1}.json")
-        if not result:
-            status_queue.put("500")
-            await page.close()
-            await context.close()
-            await browser.close()
-            return None
-        await page.close()
-        await context.close()
-        await browser.close()
-        with sqlite3.connect(Path(BASE_DIR / "db" / "database.db")) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                                INSERT INTO user_info (type, filePath, userName, status)
-                                VALUES (?, ?, ?, ?)
-                                ''', (3, f"{uuid_v1}.json", id, 1))
-            conn.commit()
-            print("✅ 用户状态已记录")
-        status_queue.put("200")
+            await self.stack.aclose()
+        except Exception as e:
+            logger.warning(f"[login] 关闭登录页失败: {e}")
 
+    async def wait_for_login(self, timeout):
+        """扫码成功后主框架会跳转，等待 URL 变化"""
+        changed = asyncio.Event()
 
-# 视频号登录
-async def get_tencent_cookie(id,status_queue):
-    url_changed_event = asyncio.Event()
-    async def on_url_change():
-        # 检查是否是主框架的变化
-        if page.url != original_url:
-            url_changed_event.set()
-
-    async with async_playwright() as playwright:
-        options = {
-            'args': [
-                '--lang en-GB'
-            ],
-            'headless': LOCAL_CHROME_HEADLESS,  # Set headless option here
-        }
-        # Make sure to run headed.
-        browser = await playwright.chromium.launch(**options)
-        # Setup context however you like.
-        context = await browser.new_context()  # Pass any options
-        # Pause the page, and start recording manually.
-        context = await set_init_script(context)
-        page = await context.new_page()
-        await page.goto("https://channels.weixin.qq.com")
-        original_url = page.url
-
-        # 监听页面的 'framenavigated' 事件，只关注主框架的变化
-        page.on('framenavigated',
-                lambda frame: asyncio.create_task(on_url_change()) if frame == page.main_frame else None)
-
-        # 等待 iframe 出现（最多等 60 秒）
-        iframe_locator = page.frame_locator("iframe").first
-
-        # 获取 iframe 中的第一个 img 元素
-        img_locator = iframe_locator.get_by_role("img").first
-
-        # 获取 src 属性值
-        src = await img_locator.get_attribute("src")
-        print("✅ 图片地址:", src)
-        status_queue.put(src)
+        def on_navigated(frame):
+            if frame == self.page.main_frame and self.page.url != self.original_url:
+                changed.set()
+
+        self.page.on('framenavigated', on_navigated)
+        if self.page.url != self.original_url:
+            changed.set()
+        await asyncio.wait_for(changed.wait(), timeout=timeout)
+
+
+class LoginSessionManager(object):
+    """
+    扫码登录会话管理：所有会话运行在后台事件循环上，共用 utils.browser_pool 的浏览器池，
+    同时进行的会话数受 LOGIN_MAX_SESSIONS 限制；最近登录频繁的平台预先保留 LOGIN_WARM_PAGES 个停在二维码页面的页面
+    （合计不超过 LOGIN_WARM_BUDGET），会话直接取用，取走后在后台补充，超过 LOGIN_WARM_PAGE_TTL 未被使用的页面关闭。
+    预热页面占用的是浏览器池的备用上下文，不阻止浏览器回收，浏览器回收时随之关闭，取用时再转为正常上下文。
+    会话超过 LOGIN_SCAN_TIMEOUT 未完成、或被取消（SSE 客户端断开）时立即结束并归还浏览器上下文。
+    必须在后台事件循环中创建和使用。
+    """
+
+    def __init__(self, max_sessions=None, warm_pages=None):
+        self.max_sessions = max_sessions or LOGIN_MAX_SESSIONS
+        self.warm_pages = LOGIN_WARM_PAGES if warm_pages is None else warm_pages
+        self._semaphore = asyncio.Semaphore(self.max_sessions)
+        self._warm = {type: [] for type in LOGIN_PLATFORMS}
+        self._demand = {type: deque() for type in LOGIN_PLATFORMS}
+        self._refilling = set()
+        self._opening = 0
+        # 后台的补充/过期/关闭任务，保留引用直到完成
+        self._tasks = set()
+        self.active = 0
 
+    async def login(self, type, id, status_queue):
+        """执行一次扫码登录：二维码地址、200（成功）或 500（失败/超时）依次放入 status_queue"""
+        name, _, _ = LOGIN_PLATFORMS[type]
+        timer = StepTimer(name, id)
+        deadline = time.monotonic() + LOGIN_SCAN_TIMEOUT
+        self._demand[type].append(time.monotonic())
+        ok = False
         try:
-            # 等待 URL 变化或超时
-            await asyncio.wait_for(url_changed_event.wait(), timeout=200)  # 最多等待 200 秒
-            print("监听页面跳转成功")
+            timer.step("queue")
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=LOGIN_SCAN_TIMEOUT)
+            self.active += 1
+            try:
+                ok = await self._login(type, id, status_queue, timer, deadline)
+            finally:
+                self.active -= 1
+                self._semaphore.release()
         except asyncio.TimeoutError:
-            status_queue.put("500")
-            print("监听页面跳转超时")
-            await page.close()
-            await context.close()
-            await browser.close()
-            return None
-        uuid_v1 = uuid.uuid1()
-        print(f"UUID v1: {uuid_v1}")
-        # 确保cookiesFile目录存在
-        cookies_dir = Path(BASE_DIR / "cookiesFile")
-        cookies_dir.mkdir(exist_ok=True)
-        await context.storage_state(path=cookies_dir / f"{uuid_v1}.json")
-        result = await check_cookie(2,f"{uuid_v1}.json")
-        if not result:
-            status_queue.put("500")
-            await page.close()
-            await context.close()
-            await browser.close()
-            return None
-        await page.close()
-        await context.close()
-        await browser.close()
-
-        with sqlite3.connect(Path(BASE_DIR / "db" / "database.db")) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                                INSERT INTO user_info (type, filePath, userName, status)
-                                VALUES (?, ?, ?, ?)
-                                ''', (2, f"{uuid_v1}.json", id, 1))
-            conn.commit()
-            print("✅ 用户状态已记录")
-        status_queue.put("200")
-
-# 快手登录
-async def get_ks_cookie(id,status_queue):
-    url_changed_event = asyncio.Event()
-    async def on_url_change():
-        # 检查是否是主框架的变化
-        if page.url != original_url:
-            url_changed_event.set()
-    async with async_playwright() as playwright:
-        options = {
-            'args': [
-                '--lang en-GB'
-            ],
-            'headless': LOCAL_CHROME_HEADLESS,  # Set headless option here
-        }
-        # Make sure to run headed.
-        browser = await playwright.chromium.launch(**options)
-        # Setup context however you like.
-        context = await browser.new_context()  # Pass any options
-        context = await set_init_script(context)
-        # Pause the page, and start recording manually.
-        page = await context.new_page()
-        await page.goto("https://cp.kuaishou.com")
-
-        # 定位并点击“立即登录”按钮（类型为 link）
-        await page.get_by_role("link", name="立即登录").click()
-        await page.get_by_text("扫码登录").click()
-        img_locator = page.get_by_role("img", name="qrcode")
-        # 获取 src 属性值
-        src = await img_locator.get_attribute("src")
-        original_url = page.url
-        print("✅ 图片地址:", src)
-        status_queue.put(src)
-        # 监听页面的 'framenavigated' 事件，只关注主框架的变化
-        page.on('framenavigated',
-                lambda frame: asyncio.create_task(on_url_change()) if frame == page.main_frame else None)
+            logger.warning(f"[login] {name} {id} 等待扫码超时")
+        except asyncio.CancelledError:
+            logger.info(f"[login] {name} {id} 会话已取消")
+            raise
+        except Exception as e:
+            logger.exception(f"[login] {name} {id} 登录失败: {e}")
+        finally:
+            timer.finish(ok=ok)
+            if not ok:
+                status_queue.put("500")
+        return ok
 
+    async def _login(self, type, id, status_queue, timer, deadline):
+        timer.step("get_qrcode")
+        login_page = await self._take_warm(type) or await self._open(type)
         try:
-            # 等待 URL 变化或超时
-            await asyncio.wait_for(url_changed_event.wait(), timeout=200)  # 最多等待 200 秒
+            print("✅ 图片地址:", login_page.qrcode)
+            status_queue.put(login_page.qrcode)
+            self._schedule_refill(type)
+            timer.step("wait_scan")
+            await login_page.wait_for_login(max(deadline - time.monotonic(), 0))
             print("监听页面跳转成功")
-        except asyncio.TimeoutError:
-            status_queue.put("500")
-            print("监听页面跳转超时")
-            await page.close()
-            await context.close()
-            await browser.close()
-            return None
-        uuid_v1 = uuid.uuid1()
-        print(f"UUID v1: {uuid_v1}")
-        # 确保cookiesFile目录存在
-        cookies_dir = Path(BASE_DIR / "cookiesFile")
-        cookies_dir.mkdir(exist_ok=True)
-        await context.storage_state(path=cookies_dir / f"{uuid_v1}.json")
-        result = await check_cookie(4, f"{uuid_v1}.json")
-        if not result:
-            status_queue.put("500")
-            await page.close()
-            await context.close()
-            await browser.close()
-            return None
-        await page.close()
-        await context.close()
-        await browser.close()
-
-        with sqlite3.connect(Path(BASE_DIR / "db" / "database.db")) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                                        INSERT INTO user_info (type, filePath, userName, status)
-                                        VALUES (?, ?, ?, ?)
-                                        ''', (4, f"{uuid_v1}.json", id, 1))
+            timer.step("save_cookie")
+            uuid_v1 = uuid.uuid1()
+            print(f"UUID v1: {uuid_v1}")
+            # 确保cookiesFile目录存在
+            cookies_dir = Path(BASE_DIR / "cookiesFile")
+            cookies_dir.mkdir(exist_ok=True)
+            await login_page.context.storage_state(path=cookies_dir / f"{uuid_v1}.json")
+        finally:
+            await login_page.close()
+        timer.step("check_cookie")
+        if not await check_cookie_cached(type, f"{uuid_v1}.json", await get_browser_pool()):
+            return False
+        with get_connection() as conn:
+            conn.execute('''
+            INSERT INTO user_info (type, filePath, userName, status)
+            VALUES (?, ?, ?, ?)
+            ''', (type, f"{uuid_v1}.json", id, 1))
             conn.commit()
             print("✅ 用户状态已记录")
         status_queue.put("200")
+        return True
 
+    async def _open(self, type, standby=False):
+        """从共享浏览器池分配上下文，打开登录页直到二维码出现"""
+        _, open_qrcode, context_options = LOGIN_PLATFORMS[type]
+        pool = await get_browser_pool()
+        stack = AsyncExitStack()
+        try:
+            context = await stack.enter_async_context(pool.new_context(standby=standby, **context_options))
+            context = await set_init_script(context)
+            page = await context.new_page()
+            qrcode = await open_qrcode(page)
+            return LoginPage(stack, context, page, qrcode)
+        except BaseException:
+            await stack.aclose()
+            raise
 
-async def get_titok_cookie(id,status_queue):
-    url_changed_event = asyncio.Event()
-    async def on_url_change():
-        # 检查是否是主框架的变化
-        if page.url != original_url:
-            url_changed_event.set()
-    async with async_playwright() as playwright:
-        options = {
-            'args': [
-                '--lang en-GB'
-            ],
-            'headless': LOCAL_CHROME_HEADLESS,  # Set headless option here
-        }
-        # Make sure to run headed.
-        browser = await playwright.chromium.launch(**options)
-        # Setup context however you like.
-        context = await browser.new_context()  # Pass any options
-        context = await set_init_script(context)
-        # Pause the page, and start recording manually.
-        page = await context.new_page()
-        await page.goto("https://www.tiktok.com/tiktokstudio/upload?lang=en")
-
-        # 定位并点击“立即登录”按钮（类型为 link）
-        await page.get_by_text("使用二维码").click()
-        img_locator = page.get_by_role("img", name="qrcode")
-        # 获取 src 属性值
-        src = await img_locator.get_attribute("src")
-        original_url = page.url
-        print("✅ 图片地址:", src)
-        status_queue.put(src)
-        # 监听页面的 'framenavigated' 事件，只关注主框架的变化
-        page.on('framenavigated',
-                lambda frame: asyncio.create_task(on_url_change()) if frame == page.main_frame else None)
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
 
-        try:
-            # 等待 URL 变化或超时
-            await asyncio.wait_for(url_changed_event.wait(), timeout=200)  # 最多等待 200 秒
-            print("监听页面跳转成功")
-        except asyncio.TimeoutError:
-            status_queue.put("500")
-            print("监听页面跳转超时")
-            await page.close()
-            await context.close()
-            await browser.close()
-            return None
-        uuid_v1 = uuid.uuid1()
-        print(f"UUID v1: {uuid_v1}")
-        # 确保cookiesFile目录存在
-        cookies_dir = Path(BASE_DIR / "cookiesFile")
-        cookies_dir.mkdir(exist_ok=True)
-        await context.storage_state(path=cookies_dir / f"{uuid_v1}.json")
-        result = await check_cookie(5, f"{uuid_v1}.json")
-        if not result:
-            status_queue.put("500")
-            await page.close()
-            await context.close()
-            await browser.close()
+    async def _take_warm(self, type):
+        pages = self._warm[type]
+        if not pages:
             return None
-        await page.close()
-        await context.close()
-        await browser.close()
-
-        with sqlite3.connect(Path(BASE_DIR / "db" / "database.db")) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                                        INSERT INTO user_info (type, filePath, userName, status)
-                                        VALUES (?, ?, ?, ?)
-                                        ''', (5, f"{uuid_v1}.json", id, 1))
-            conn.commit()
-            print("✅ 用户状态已记录")
-        status_queue.put("200")
+        pool = await get_browser_pool()
+        while pages:
+            login_page = pages.pop(0)
+            # 所在浏览器已被回收时页面已经关闭，claim 失败
+            if login_page.fresh() and await pool.claim(login_page.context):
+                return login_page
+            self._spawn(login_page.close())
+        return None
 
+    def _warm_count(self):
+        return sum(len(pages) for pages in self._warm.values()) + self._opening
 
+    def _wanted(self, type):
+        """最近 LOGIN_WARM_PAGE_TTL 秒内该平台的登录次数达到 LOGIN_WARM_MIN_DEMAND 才值得预热"""
+        demand = self._demand[type]
+        while demand and time.monotonic() - demand[0] > LOGIN_WARM_PAGE_TTL:
+            demand.popleft()
+        return len(demand) >= LOGIN_WARM_MIN_DEMAND
 
-# 小红书登录
-async def xiaohongshu_cookie_gen(id,status_queue):
-    url_changed_event = asyncio.Event()
-
-    async def on_url_change():
-        # 检查是否是主框架的变化
-        if page.url != original_url:
-            url_changed_event.set()
-
-    async with async_playwright() as playwright:
-        options = {
-            'args': [
-                '--lang en-GB'
-            ],
-            'headless': LOCAL_CHROME_HEADLESS,  # Set headless option here
-        }
-        # Make sure to run headed.
-        browser = await playwright.chromium.launch(**options)
-        # Setup context however you like.
-        context = await browser.new_context()  # Pass any options
-        context = await set_init_script(context)
-        # Pause the page, and start recording manually.
-        page = await context.new_page()
-        await page.goto("https://creator.xiaohongshu.com/")
-        await page.locator('img.css-wemwzq').click()
-
-        img_locator = page.get_by_role("img").nth(2)
-        # 获取 src 属性值
-        src = await img_locator.get_attribute("src")
-        original_url = page.url
-        print("✅ 图片地址:", src)
-        status_queue.put(src)
-        # 监听页面的 'framenavigated' 事件，只关注主框架的变化
-        page.on('framenavigated',
-                lambda frame: asyncio.create_task(on_url_change()) if frame == page.main_frame else None)
+    def _schedule_refill(self, type):
+        if self.warm_pages > 0 and type not in self._refilling and self._wanted(type):
+            self._refilling.add(type)
+            self._spawn(self._refill(type))
 
+    async def _refill(self, type):
         try:
-            # 等待 URL 变化或超时
-            await asyncio.wait_for(url_changed_event.wait(), timeout=200)  # 最多等待 200 秒
-            print("监听页面跳转成功")
-        except asyncio.TimeoutError:
-            status_queue.put("500")
-            print("监听页面跳转超时")
-            await page.close()
-            await context.close()
-            await browser.close()
-            return None
-        uuid_v1 = uuid.uuid1()
-        print(f"UUID v1: {uuid_v1}")
-        # 确保cookiesFile目录存在
-        cookies_dir = Path(BASE_DIR / "cookiesFile")
-        cookies_dir.mkdir(exist_ok=True)
-        await context.storage_state(path=cookies_dir / f"{uuid_v1}.json")
-        result = await check_cookie(1, f"{uuid_v1}.json")
-        if not result:
-            status_queue.put("500")
-            await page.close()
-            await context.close()
-            await browser.close()
-            return None
-        await page.close()
-        await context.close()
-        await browser.close()
-
-        with sqlite3.connect(Path(BASE_DIR / "db" / "database.db")) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                           INSERT INTO user_info (type, filePath, userName, status)
-                           VALUES (?, ?, ?, ?)
-                           ''', (1, f"{uuid_v1}.json", id, 1))
-            conn.commit()
-            print("✅ 用户状态已记录")
-        status_queue.put("200")
+            while len(self._warm[type]) < self.warm_pages and self._warm_count() < LOGIN_WARM_BUDGET:
+                self._opening += 1
+                try:
+                    login_page = await self._open(type, standby=True)
+                finally:
+                    self._opening -= 1
+                self._warm[type].append(login_page)
+                self._spawn(self._expire(type, login_page))
+        except Exception as e:
+            logger.warning(f"[login] 预热 {LOGIN_PLATFORMS[type][0]} 登录页失败: {e}")
+        finally:
+            self._refilling.discard(type)
+
+    async def _expire(self, type, login_page):
+        # 到期仍未被取用的页面直接关闭，下一次登录时再按需预热
+        await asyncio.sleep(LOGIN_WARM_PAGE_TTL)
+        if login_page in self._warm[type]:
+            self._warm[type].remove(login_page)
+            await login_page.close()
+
+    def stats(self):
+        return {
+            "max_sessions": self.max_sessions,
+            "active": self.active,
+            "warm_pages": {LOGIN_PLATFORMS[type][0]: len(pages) for type, pages in self._warm.items()},
+        }
+
+    async def close(self):
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        for pages in self._warm.values():
+            while pages:
+                await pages.pop().close()
+
+
+_manager = None
+
+
+def get_login_manager():
+    """返回进程内共享的登录会话管理器，需要在后台事件循环中调用"""
+    global _manager
+    if _manager is None:
+        _manager = LoginSessionManager()
+    return _manager
+
+
+# 抖音登录
+async def douyin_cookie_gen(id,status_queue):
+    return await get_login_manager().login(3, id, status_queue)
+
+
+# 视频号登录
+async def get_tencent_cookie(id,status_queue):
+    return await get_login_manager().login(2, id, status_queue)
+
+
+# 快手登录
+async def get_ks_cookie(id,status_queue):
+    return await get_login_manager().login(4, id, status_queue)
+
+
+async def get_titok_cookie(id,status_queue):
+    return await get_login_manager().login(5, id, status_queue)
+
+
+# 小红书登录
+async def xiaohongshu_cookie_gen(id,status_queue):
+    return await get_login_manager().login(1, id, status_queue)
 
 # a = asyncio.run(xiaohongshu_cookie_gen(4,None))
 # print(a)
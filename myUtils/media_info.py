@@ -0,0 +1,268 @@
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import conf
+from conf import BASE_DIR
+from myUtils.uploads import ingest_file
+from utils.base_social_media import SOCIAL_MEDIA_DOUYIN, SOCIAL_MEDIA_TENCENT, SOCIAL_MEDIA_KUAISHOU, \
+    SOCIAL_MEDIA_XIAOHONGSHU, SOCIAL_MEDIA_TIKTOK, SOCIAL_MEDIA_YOUTUBE
+from utils.db import get_connection, row_cursor
+from utils.event_loop import spawn
+from utils.log import logger
+from utils.migrations import ensure_schema
+
+VIDEO_DIR = Path(BASE_DIR / "videoFile")
+FFPROBE_PATH = getattr(conf, "FFPROBE_PATH", "ffprobe")
+MEDIA_PROBE_TIMEOUT = getattr(conf, "MEDIA_PROBE_TIMEOUT", 60)
+# 现算的内容哈希按 (路径, 大小, 修改时间) 缓存的条数，发布前检查、转码、封面对同一文件只读一遍
+MEDIA_HASH_CACHE_SIZE = getattr(conf, "MEDIA_HASH_CACHE_SIZE", 256)
+
+MEDIA_COLUMNS = ("duration", "width", "height", "video_codec", "audio_codec", "bit_rate", "frame_rate",
+                 "format_name", "error")
+
+GB = 1024 * 1024 * 1024
+
+# 各平台对视频的限制，发布前检查，不符合的文件不再打开浏览器。
+# 取值偏宽松（以平台网页端的公开规则为上限），宁可漏拦也不误拦；conf.MEDIA_LIMITS 中的同名平台配置会覆盖默认值。
+# 支持的键：min_duration / max_duration（秒）、max_bytes、max_width / max_height、
+# min_aspect / max_aspect（宽/高）、video_codecs（允许的编码列表）
+MEDIA_LIMITS = {
+    "default": {"min_duration": 1},
+    SOCIAL_MEDIA_DOUYIN: {"max_duration": 60 * 60, "max_bytes": 16 * GB},
+    SOCIAL_MEDIA_TENCENT: {"max_duration": 8 * 60 * 60, "max_bytes": 20 * GB},
+    SOCIAL_MEDIA_KUAISHOU: {"max_duration": 60 * 60, "max_bytes": 4 * GB},
+    SOCIAL_MEDIA_XIAOHONGSHU: {"max_duration": 4 * 60 * 60, "max_bytes": 20 * GB},
+    SOCIAL_MEDIA_TIKTOK: {"max_duration": 60 * 60, "max_bytes": 10 * GB},
+    SOCIAL_MEDIA_YOUTUBE: {"max_duration": 12 * 60 * 60, "max_bytes": 256 * GB},
+}
+
+
+class MediaProbeError(Exception):
+    """ffprobe 无法识别文件"""
+
+
+def get_media_limits(platform):
+    """合并默认限制、平台限制和 conf.MEDIA_LIMITS 中的覆盖项"""
+    overrides = getattr(conf, "MEDIA_LIMITS", {})
+    limits = {}
+    for source in (MEDIA_LIMITS["default"], overrides.get("default", {}),
+                   MEDIA_LIMITS.get(platform, {}), overrides.get(platform, {})):
+        limits.update(source)
+    return limits
+
+
+def _ratio(value):
+    # ffprobe 的帧率是 "30000/1001" 这样的分数
+    num, _, den = str(value).partition('/')
+    try:
+        num, den = float(num), float(den or 1)
+    except ValueError:
+        return None
+    return round(num / den, 3) if den else None
+
+
+def _int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_ffprobe(data):
+    """把 ffprobe -show_format -show_streams 的 JSON 输出整理成 media_info 的一行"""
+    streams = data.get("streams", [])
+    fmt = data.get("format", {})
+    video = next((s for s in streams if s.get("codec_type") == "video"
+                  and not s.get("disposition", {}).get("attached_pic")), None)
+    audio = next((s for s in streams if s.get("codec_type") == "audio"), None)
+    info = {
+        "duration": None, "width": None, "height": None, "video_codec": None,
+        "audio_codec": audio.get("codec_name") if audio else None,
+        "bit_rate": _int(fmt.get("bit_rate")), "frame_rate": None,
+        "format_name": fmt.get("format_name"), "error": None,
+    }
+    try:
+        info["duration"] = round(float(fmt.get("duration") or (video or {}).get("duration")), 3)
+    except (TypeError, ValueError):
+        pass
+    if video is not None:
+        width, height = _int(video.get("width")), _int(video.get("height"))
+        # 手机竖拍的视频常以横向编码 + 旋转信息保存，按显示方向交换宽高
+        rotation = _int(video.get("tags", {}).get("rotate")) or 0
+        for side_data in video.get("side_data_list", []):
+            rotation = _int(side_data.get("rotation")) or rotation
+        if abs(rotation) % 180 == 90:
+            width, height = height, width
+        info.update(width=width, height=height, video_codec=video.get("codec_name"),
+                    frame_rate=_ratio(video.get("avg_frame_rate") or video.get("r_frame_rate")))
+    return info
+
+
+async def run_ffprobe(path):
+    process = await asyncio.create_subprocess_exec(
+        FFPROBE_PATH, "-v", "error", "-print_format", "json", "-show_format", "-show_streams", str(path),
+        stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=MEDIA_PROBE_TIMEOUT)
+    except BaseException:
+        process.kill()
+        await process.wait()
+        raise
+    if process.returncode != 0:
+        raise MediaProbeError(stderr.decode("utf-8", "replace").strip() or f"ffprobe 退出码 {process.returncode}")
+    return parse_ffprobe(json.loads(stdout))
+
+
+def get_media_info(content_hash):
+    """返回缓存的探测结果（dict），没有探测过返回 None"""
+    if not content_hash:
+        return None
+    ensure_schema()
+    with get_connection() as conn:
+        row = row_cursor(conn).execute('SELECT * FROM media_info WHERE content_hash = ?', (content_hash,)).fetchone()
+    return dict(row) if row is not None else None
+
+
+def _save_media_info(content_hash, info):
+    with get_connection() as conn:
+        conn.execute(f'''
+        INSERT OR REPLACE INTO media_info (content_hash, {", ".join(MEDIA_COLUMNS)}, probed_at)
+        VALUES (?, {", ".join("?" for _ in MEDIA_COLUMNS)}, ?)
+        ''', (content_hash, *(info[column] for column in MEDIA_COLUMNS), time.time()))
+        conn.commit()
+
+
+def _content_hash_of(path):
+    """videoFile 下的文件直接用 file_records 里的哈希，其他文件现算"""
+    path = Path(path)
+    if path.parent == VIDEO_DIR:
+        with get_connection() as conn:
+            row = conn.execute('SELECT content_hash FROM file_records WHERE file_path = ? AND content_hash IS NOT NULL',
+                               (path.name,)).fetchone()
+        if row is not None:
+            return row[0]
+    return ingest_file(path)['content_hash']
+
+
+_hash_cache = OrderedDict()
+_hashing = {}
+_probing = {}
+_ffprobe_missing = False
+
+
+async def content_hash_of(path):
+    """返回文件的内容哈希；现算的结果按 (路径, 大小, 修改时间) 缓存，同一文件同时只算一次"""
+    stat = Path(path).stat()
+    key = (str(Path(path).resolve()), stat.st_size, stat.st_mtime_ns)
+    if key in _hash_cache:
+        _hash_cache.move_to_end(key)
+        return _hash_cache[key]
+    task = _hashing.get(key)
+    if task is None or task.get_loop() is not asyncio.get_running_loop():
+        task = asyncio.ensure_future(asyncio.to_thread(_content_hash_of, path))
+        _hashing[key] = task
+        task.add_done_callback(lambda done: _hashing.pop(key, None))
+    content_hash = await asyncio.shield(task)
+    _hash_cache[key] = content_hash
+    while len(_hash_cache) > MEDIA_HASH_CACHE_SIZE:
+        _hash_cache.popitem(last=False)
+    return content_hash
+
+
+async def probe_media(path, content_hash=None):
+    """
+    返回文件的媒体信息（dict，ffprobe 无法识别时 error 不为空），每份内容只跑一次 ffprobe。
+    没有安装 ffprobe 时返回 None，调用方跳过检查。
+    """
+    ensure_schema()
+    if content_hash is None:
+        content_hash = await content_hash_of(path)
+    info = get_media_info(content_hash)
+    if info is not None:
+        return info
+    if _ffprobe_missing:
+        return None
+    # 同一内容同时只探测一次
+    task = _probing.get(content_hash)
+    if task is None or task.get_loop() is not asyncio.get_running_loop():
+        task = asyncio.ensure_future(_probe(path, content_hash))
+        _probing[content_hash] = task
+        task.add_done_callback(lambda done: _probing.pop(content_hash, None))
+    return await asyncio.shield(task)
+
+
+async def _probe(path, content_hash):
+    global _ffprobe_missing
+    try:
+        info = await run_ffprobe(path)
+    except FileNotFoundError:
+        if Path(path).exists():
+            _ffprobe_missing = True
+            logger.warning(f"[media] 找不到 {FFPROBE_PATH}，跳过视频参数检查")
+            return None
+        raise
+    except (MediaProbeError, ValueError) as e:
+        info = {column: None for column in MEDIA_COLUMNS}
+        info["error"] = str(e)[:500]
+    _save_media_info(content_hash, info)
+    return get_media_info(content_hash)
+
+
+def schedule_probe(path, content_hash=None):
+    """上传完成后在后台事件循环探测，/getFiles 随后就能带上媒体信息"""
+    if _ffprobe_missing or get_media_info(content_hash) is not None:
+        return
+    spawn(probe_media(path, content_hash), f"media probe {Path(path).name}")
+
+
+def check_media_limits(platform, info, size_bytes=None):
+    """返回不符合平台限制的原因列表，符合时为空列表"""
+    if info is None:
+        return []
+    if info.get("error"):
+        return [f"无法识别的视频文件: {info['error']}"]
+    limits = get_media_limits(platform)
+    problems = []
+    if info.get("video_codec") is None:
+        problems.append("没有视频流")
+    if limits.get("video_codecs") and info.get("video_codec") not in limits["video_codecs"]:
+        problems.append(f"视频编码 {info.get('video_codec')} 不在支持列表 {limits['video_codecs']} 中")
+    duration = info.get("duration")
+    if duration is not None:
+        if limits.get("min_duration") is not None and duration < limits["min_duration"]:
+            problems.append(f"时长 {duration}s 短于 {limits['min_duration']}s")
+        if limits.get("max_duration") is not None and duration > limits["max_duration"]:
+            problems.append(f"时长 {duration}s 超过 {limits['max_duration']}s")
+    if size_bytes is not None and limits.get("max_bytes") is not None and size_bytes > limits["max_bytes"]:
+        problems.append(f"文件大小 {size_bytes} 字节超过 {limits['max_bytes']} 字节")
+    width, height = info.get("width"), info.get("height")
+    if width and height:
+        if limits.get("max_width") is not None and width > limits["max_width"]:
+            problems.append(f"宽度 {width} 超过 {limits['max_width']}")
+        if limits.get("max_height") is not None and height > limits["max_height"]:
+            problems.append(f"高度 {height} 超过 {limits['max_height']}")
+        aspect = width / height
+        if limits.get("min_aspect") is not None and aspect < limits["min_aspect"]:
+            problems.append(f"宽高比 {width}x{height} 小于 {limits['min_aspect']}")
+        if limits.get("max_aspect") is not None and aspect > limits["max_aspect"]:
+            problems.append(f"宽高比 {width}x{height} 大于 {limits['max_aspect']}")
+    return problems
+
+
+async def check_media_files(platform, files):
+    """发布前检查一批文件，返回 {文件: 原因}，只包含不符合要求的文件；探测本身出错的文件不拦截"""
+    rejected = {}
+    for file in dict.fromkeys(files):
+        try:
+            info = await probe_media(file)
+            problems = check_media_limits(platform, info, Path(file).stat().st_size)
+        except Exception as e:
+            logger.warning(f"[media] {file} 探测失败，跳过检查: {e}")
+            continue
+        if problems:
+            rejected[file] = "；".join(problems)
+            logger.warning(f"[media] {Path(file).name} 不符合 {platform} 的要求: {rejected[file]}")
+    return rejected
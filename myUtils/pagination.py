@@ -0,0 +1,101 @@
+import base64
+import json
+
+# 列表接口的 keyset 分页：按 (排序列, id) 定位下一页，不用 OFFSET，翻到多深都只走索引
+# 客户端传 limit 时分页返回并带上 nextCursor，不传时返回全部（兼容旧前端），两种情况都是边查边输出
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+
+def encode_cursor(value, row_id):
+    raw = json.dumps([value, row_id], ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        value, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return value, int(row_id)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+
+
+def parse_page_args(args, sort_keys, default_sort='id', default_order='asc'):
+    """
+    从查询参数解析 limit / cursor / sort / order，sort 只能是 sort_keys 中的列（都需要有 (列, id) 索引）。
+    参数不合法时抛出 ValueError。
+    """
+    limit = args.get('limit')
+    if limit is not None:
+        if not limit.isdigit() or int(limit) == 0:
+            raise ValueError("Invalid limit")
+        limit = min(int(limit), MAX_PAGE_SIZE)
+    sort = args.get('sort', default_sort)
+    if sort not in sort_keys:
+        raise ValueError(f"Invalid sort, expected one of {', '.join(sort_keys)}")
+    order = args.get('order', default_order).lower()
+    if order not in ('asc', 'desc'):
+        raise ValueError("Invalid order")
+    cursor = args.get('cursor')
+    if cursor:
+        if limit is None:
+            limit = DEFAULT_PAGE_SIZE
+        cursor = decode_cursor(cursor)
+    return {"limit": limit, "cursor": cursor or None, "sort": sort, "desc": order == 'desc'}
+
+
+def page_query(table, columns, where, params, page):
+    """拼出一页的 SQL，where 为条件片段列表，返回 (sql, params)；多查一行用于判断是否还有下一页"""
+    where = list(where)
+    params = list(params)
+    sort, desc = page["sort"], page["desc"]
+    op = '<' if desc else '>'
+    order = 'DESC' if desc else 'ASC'
+    if page["cursor"] is not None:
+        value, row_id = page["cursor"]
+        if sort == 'id':
+            where.append(f'id {op} ?')
+            params.append(row_id)
+        elif value is None:
+            # SQLite 里 NULL 比任何值都小（升序排在最前，降序排在最后），行值和 NULL 比较的结果也是 NULL，
+            # 排序列可能为 NULL 时要单独处理，否则这些行在第一页之后全部丢失
+            if desc:
+                where.append(f'({sort} IS NULL AND id < ?)')
+            else:
+                where.append(f'({sort} IS NULL AND id > ? OR {sort} IS NOT NULL)')
+            params.append(row_id)
+        elif desc:
+            where.append(f'(({sort}, id) < (?, ?) OR {sort} IS NULL)')
+            params.extend([value, row_id])
+        else:
+            where.append(f'({sort}, id) > (?, ?)')
+            params.extend([value, row_id])
+    sql = f'SELECT {columns} FROM {table}'
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    sql += f' ORDER BY id {order}' if sort == 'id' else f' ORDER BY {sort} {order}, id {order}'
+    if page["limit"]:
+        sql += ' LIMIT ?'
+        params.append(page["limit"] + 1)
+    return sql, params
+
+
+def stream_page(rows, page, to_json, msg=None):
+    """
+    把游标上的行逐条输出为 {"code": 200, "msg": ..., "data": [...], "nextCursor": ...}，
+    rows 需要是 sqlite3.Row（按列名取排序列和 id），to_json 把一行转换成输出的对象。
+    """
+    yield '{"code": 200, "msg": ' + json.dumps(msg) + ', "data": ['
+    count = 0
+    last = None
+    has_more = False
+    for row in rows:
+        if page["limit"] and count == page["limit"]:
+            has_more = True
+            break
+        yield (',' if count else '') + json.dumps(to_json(row), ensure_ascii=False)
+        last = row
+        count += 1
+    next_cursor = encode_cursor(last[page["sort"]], last['id']) if has_more else None
+    yield '], "nextCursor": ' + json.dumps(next_cursor) + '}'
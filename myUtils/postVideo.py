@@ -1,142 +1,218 @@
 import asyncio
-import uuid
+from contextlib import asynccontextmanager
 from pathlib import Path
 
-import requests
-
 from conf import BASE_DIR
+from myUtils.covers import cover_files
+from myUtils.cookie_cache import check_cookies_cached, record_validities
+from myUtils.media_info import check_media_files
+from myUtils.transcode import transcode_files
 from uploader.douyin_uploader.main import DouYinVideo
 from uploader.ks_uploader.main import KSVideo
 from uploader.tencent_uploader.main import TencentVideo
 from uploader.xiaohongshu_uploader.main import XiaoHongShuVideo
+from utils.base_social_media import SOCIAL_MEDIA_DOUYIN, SOCIAL_MEDIA_TENCENT, SOCIAL_MEDIA_KUAISHOU, \
+    SOCIAL_MEDIA_XIAOHONGSHU, SOCIAL_MEDIA_TYPES
+from utils.browser_pool import BrowserPool
+from utils.concurrency import get_upload_limiter
+from utils.download_cache import get_download_cache
+from utils.metrics import PUBLISH_BYTES
 from utils.constant import TencentZoneTypes
 from utils.files_times import generate_schedule_time_next_day
 
 
 def post_video_tencent(title,files,tags,account_file,category=TencentZoneTypes.LIFESTYLE.value,enableTimer=False,videos_per_day = 1, daily_times=None,start_days = 0, is_draft=False):
+    asyncio.run(post_video_tencent_async(title, files, tags, account_file, category, enableTimer, videos_per_day,
+                                         daily_times, start_days, is_draft), debug=False)
+
+
+async def post_video_tencent_async(title,files,tags,account_file,category=TencentZoneTypes.LIFESTYLE.value,enableTimer=False,videos_per_day = 1, daily_times=None,start_days = 0, is_draft=False, browser_pool=None, progress=None):
     # 生成文件的完整路径
     account_file = [Path(BASE_DIR / "cookiesFile" / file) for file in account_file]
-    files = [Path(BASE_DIR / "videoFile" / file) for file in files]
     if enableTimer:
         publish_datetimes = generate_schedule_time_next_day(len(files), videos_per_day, daily_times,start_days)
     else:
         publish_datetimes = [0 for i in range(len(files))]
-    for index, file in enumerate(files):
-        for cookie in account_file:
-            print(f"文件路径{str(file)}")
-            # 打印视频文件名、标题和 hashtag
-            print(f"视频文件名：{file}")
-            print(f"标题：{title}")
-            print(f"Hashtag：{tags}")
-            app = TencentVideo(title, str(file), tags, publish_datetimes[index], cookie, category, is_draft)
-            asyncio.run(app.main(), debug=False)
+
+    def build_app(file, publish_date, cookie, context, cover):
+        return TencentVideo(title, str(file), tags, publish_date, cookie, category, is_draft, context=context)
+
+    await publish_batch(SOCIAL_MEDIA_TENCENT, title, tags, files, account_file, publish_datetimes, build_app,
+                        browser_pool, progress=progress)
 
 
 def post_video_DouYin(title,files,tags,account_file,category=TencentZoneTypes.LIFESTYLE.value,enableTimer=False,videos_per_day = 1, daily_times=None,start_days = 0,
                       thumbnail_path = '',
                       productLink = '', productTitle = ''):
-    # 生成文件的完整路径
-    account_file = [Path(BASE_DIR / "cookiesFile" / file) for file in account_file]
+    asyncio.run(post_video_DouYin_async(title, files, tags, account_file, category, enableTimer, videos_per_day,
+                                        daily_times, start_days, thumbnail_path, productLink, productTitle), debug=False)
 
-    base_dir = Path(BASE_DIR)
-    video_dir = base_dir / "videoFile" / "tmp"
 
-    normalized_files = []
-
-    for f in files:
-        f = f.strip()
-
-        # 远程 URL → 下载
-        if f.startswith("http://") or f.startswith("https://"):
-            print(f"检测到远程视频，开始下载：{f}")
-            local_file = download_video_to_local(f, video_dir)
-            normalized_files.append(local_file)
-            continue
-
-        # 已经是绝对路径
-        if f.startswith("/"):
-            p = Path(f)
-        else:
-            p = base_dir / "videoFile" / f
-
-        if not p.exists():
-            raise FileNotFoundError(f"视频文件不存在：{p}")
-
-        normalized_files.append(p)
-
-    files = normalized_files
+async def post_video_DouYin_async(title,files,tags,account_file,category=TencentZoneTypes.LIFESTYLE.value,enableTimer=False,videos_per_day = 1, daily_times=None,start_days = 0,
+                      thumbnail_path = '',
+                      productLink = '', productTitle = '', browser_pool=None, progress=None):
+    # 生成文件的完整路径
+    account_file = [Path(BASE_DIR / "cookiesFile" / file) for file in account_file]
 
     if enableTimer:
         publish_datetimes = generate_schedule_time_next_day(len(files), videos_per_day, daily_times,start_days)
     else:
         publish_datetimes = [0 for i in range(len(files))]
-    for index, file in enumerate(files):
-        for cookie in account_file:
-            print(f"文件路径{str(file)}")
+
+    def build_app(file, publish_date, cookie, context, cover):
+        # 没有指定封面时用自动生成的竖封面，避免发布时卡在“请设置封面后再发布”
+        return DouYinVideo(title, str(file), tags, publish_date, cookie, thumbnail_path or cover, productLink,
+                           productTitle, context=context)
+
+    await publish_batch(SOCIAL_MEDIA_DOUYIN, title, tags, files, account_file, publish_datetimes, build_app,
+                        browser_pool, auto_cover=not thumbnail_path, progress=progress)
+
+
+@asynccontextmanager
+async def local_video_files(files):
+    """把 videoFile 下的文件名、绝对路径和远程 URL 统一成本地路径；远程 URL 从下载缓存获取，退出时释放引用"""
+    download_cache = get_download_cache()
+    acquired = []
+    try:
+        paths = []
+        for file in files:
+            file = str(file).strip()
+            if file.startswith("http://") or file.startswith("https://"):
+                print(f"检测到远程视频，从下载缓存获取：{file}")
+                path = await download_cache.acquire(file)
+                acquired.append(path)
+            else:
+                path = Path(BASE_DIR / "videoFile" / file)
+                if not path.exists():
+                    raise FileNotFoundError(f"视频文件不存在：{path}")
+            paths.append(path)
+        yield paths
+    finally:
+        for path in acquired:
+            download_cache.release(path)
+
+
+async def publish_batch(platform, title, tags, files, account_file, publish_datetimes, build_app, browser_pool=None,
+                        auto_cover=False, progress=None):
+    """
+    在同一个事件循环里并发执行 文件×账号 的上传。
+    files 为 videoFile 下的文件名、绝对路径或远程 URL，远程视频经过下载缓存，同一批次的所有账号共用一份。
+    并发受 utils.concurrency 的总数/平台/账号限制，同一账号的上传按提交顺序串行；
+    浏览器上下文从浏览器池获取，未传入 browser_pool 时为本批次临时启动一个池。
+    cookie 已失效（以缓存的校验结果为准）的账号、不符合平台限制（myUtils.media_info）的视频直接跳过并计为失败；
+    平台配置了转码（myUtils.transcode）时上传转码后的版本；auto_cover 为真时按 myUtils.covers 为每个视频准备封面，
+    build_app(file, publish_date, cookie, context, cover) 的 cover 为封面路径，没有封面时为 None。
+    传入 progress（myUtils.publish_progress.PublishProgress）时记录每个 文件×账号 的结果，已经成功的组合直接跳过。
+    任意一次上传失败不影响其他上传，全部结束后再统一抛出异常。
+    """
+    if progress is not None:
+        # 任务被重新领取时，所有账号都已成功的文件不再下载、检查和转码
+        keep = [index for index, file in enumerate(files)
+                if not all(progress.is_done(file, cookie.name) for cookie in account_file)]
+        files = [files[index] for index in keep]
+        publish_datetimes = [publish_datetimes[index] for index in keep]
+    sources = list(files)
+    async with local_video_files(files) as files:
+        # 时长、大小等不符合平台要求的视频在打开浏览器前就判定失败
+        rejected_files = await check_media_files(platform, files)
+        if files and len(rejected_files) == len(set(files)):
+            raise RuntimeError(f"{len(files)} 个视频都不符合平台要求: {'; '.join(rejected_files.values())}")
+        # 平台需要的编码/分辨率与源文件不同时先转码（同一源文件 + 配置只转一次），已有转码结果的直接使用
+        files = await transcode_files(platform, files, skip=rejected_files)
+        covers = await cover_files(platform, files, skip=rejected_files) if auto_cover else [None] * len(files)
+        if browser_pool is None:
+            async with BrowserPool() as pool:
+                await _publish_batch(platform, title, tags, sources, files, covers, account_file, publish_datetimes,
+                                     build_app, rejected_files, pool, progress)
+        else:
+            await _publish_batch(platform, title, tags, sources, files, covers, account_file, publish_datetimes,
+                                 build_app, rejected_files, browser_pool, progress)
+
+
+async def _publish_batch(platform, title, tags, sources, files, covers, account_file, publish_datetimes, build_app,
+                         rejected_files, browser_pool, progress):
+    limiter = get_upload_limiter()
+    type = SOCIAL_MEDIA_TYPES[platform]
+    # 缓存命中时不开页面；超时（None）的账号仍然尝试上传
+    validity = await check_cookies_cached([(type, cookie) for cookie in account_file], browser_pool)
+    invalid_accounts = {cookie for cookie, valid in zip(account_file, validity) if valid is False}
+
+    async def publish_one(index, file, cookie):
+        if cookie in invalid_accounts:
+            raise RuntimeError(f"cookie 已失效，跳过账号：{cookie.name}")
+        if file in rejected_files:
+            raise RuntimeError(f"视频不符合平台要求，跳过：{Path(file).name}，{rejected_files[file]}")
+        async with limiter.slot(platform, cookie):
             # 打印视频文件名、标题和 hashtag
             print(f"视频文件名：{file}")
             print(f"标题：{title}")
             print(f"Hashtag：{tags}")
-            app = DouYinVideo(title, str(file), tags, publish_datetimes[index], cookie, thumbnail_path, productLink, productTitle)
-            try:
-                asyncio.run(app.main(), debug=False)
-            finally:
-                if file.parent.name == "tmp":
-                    file.unlink(missing_ok=True)
-
+            async with browser_pool.new_context(storage_state=cookie) as context:
+                # 出错那一步的耗时由上传器的 finish_timer_on_error 记为失败
+                app = build_app(file, publish_datetimes[index], cookie, context, covers[index])
+                await app.main()
+            # 上传成功说明 cookie 有效，上传器会重新保存 cookie 文件，按新内容记一次有效
+            record_validities([(type, cookie, True)])
+            PUBLISH_BYTES.inc(Path(file).stat().st_size, platform=platform)
+
+    async def publish_tracked(index, file, cookie):
+        if progress is None:
+            return await publish_one(index, file, cookie)
+        if progress.is_done(sources[index], cookie.name):
+            return
+        try:
+            await publish_one(index, file, cookie)
+        except Exception as e:
+            progress.record(sources[index], cookie.name, str(e) or repr(e))
+            raise
+        progress.record(sources[index], cookie.name)
+
+    tasks = [publish_tracked(index, file, cookie) for index, file in enumerate(files) for cookie in account_file]
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    failures = [result for result in results if isinstance(result, BaseException)]
+    if failures:
+        raise RuntimeError(f"{len(failures)}/{len(results)} 个上传任务失败，首个错误: {failures[0]!r}") from failures[0]
 
-def download_video_to_local(url: str, save_dir: Path) -> Path:
-    save_dir.mkdir(parents=True, exist_ok=True)
 
-    # 尽量保留 mp4 后缀
-    suffix = Path(url).suffix or ".mp4"
-    filename = f"{uuid.uuid4().hex}{suffix}"
-    local_path = save_dir / filename
-
-    with requests.get(url, stream=True, timeout=60) as r:
-        r.raise_for_status()
-        with open(local_path, "wb") as f:
-            for chunk in r.iter_content(chunk_size=1024 * 1024):
-                if chunk:
-                    f.write(chunk)
+def post_video_ks(title,files,tags,account_file,category=TencentZoneTypes.LIFESTYLE.value,enableTimer=False,videos_per_day = 1, daily_times=None,start_days = 0):
+    asyncio.run(post_video_ks_async(title, files, tags, account_file, category, enableTimer, videos_per_day,
+                                    daily_times, start_days), debug=False)
 
-    return local_path
 
-def post_video_ks(title,files,tags,account_file,category=TencentZoneTypes.LIFESTYLE.value,enableTimer=False,videos_per_day = 1, daily_times=None,start_days = 0):
+async def post_video_ks_async(title,files,tags,account_file,category=TencentZoneTypes.LIFESTYLE.value,enableTimer=False,videos_per_day = 1, daily_times=None,start_days = 0, browser_pool=None, progress=None):
     # 生成文件的完整路径
     account_file = [Path(BASE_DIR / "cookiesFile" / file) for file in account_file]
-    files = [Path(BASE_DIR / "videoFile" / file) for file in files]
     if enableTimer:
         publish_datetimes = generate_schedule_time_next_day(len(files), videos_per_day, daily_times,start_days)
     else:
         publish_datetimes = [0 for i in range(len(files))]
-    for index, file in enumerate(files):
-        for cookie in account_file:
-            print(f"文件路径{str(file)}")
-            # 打印视频文件名、标题和 hashtag
-            print(f"视频文件名：{file}")
-            print(f"标题：{title}")
-            print(f"Hashtag：{tags}")
-            app = KSVideo(title, str(file), tags, publish_datetimes[index], cookie)
-            asyncio.run(app.main(), debug=False)
+
+    def build_app(file, publish_date, cookie, context, cover):
+        return KSVideo(title, str(file), tags, publish_date, cookie, context=context)
+
+    await publish_batch(SOCIAL_MEDIA_KUAISHOU, title, tags, files, account_file, publish_datetimes, build_app,
+                        browser_pool, progress=progress)
+
 
 def post_video_xhs(title,files,tags,account_file,category=TencentZoneTypes.LIFESTYLE.value,enableTimer=False,videos_per_day = 1, daily_times=None,start_days = 0):
+    asyncio.run(post_video_xhs_async(title, files, tags, account_file, category, enableTimer, videos_per_day,
+                                     daily_times, start_days), debug=False)
+
+
+async def post_video_xhs_async(title,files,tags,account_file,category=TencentZoneTypes.LIFESTYLE.value,enableTimer=False,videos_per_day = 1, daily_times=None,start_days = 0, browser_pool=None, progress=None):
     # 生成文件的完整路径
     account_file = [Path(BASE_DIR / "cookiesFile" / file) for file in account_file]
-    files = [Path(BASE_DIR / "videoFile" / file) for file in files]
     file_num = len(files)
     if enableTimer:
         publish_datetimes = generate_schedule_time_next_day(file_num, videos_per_day, daily_times,start_days)
     else:
-        publish_datetimes = 0
-    for index, file in enumerate(files):
-        for cookie in account_file:
-            # 打印视频文件名、标题和 hashtag
-            print(f"视频文件名：{file}")
-            print(f"标题：{title}")
-            print(f"Hashtag：{tags}")
-            app = XiaoHongShuVideo(title, file, tags, publish_datetimes, cookie)
-            asyncio.run(app.main(), debug=False)
+        publish_datetimes = [0 for i in range(file_num)]
+
+    def build_app(file, publish_date, cookie, context, cover):
+        return XiaoHongShuVideo(title, file, tags, publish_date, cookie, context=context)
+
+    await publish_batch(SOCIAL_MEDIA_XIAOHONGSHU, title, tags, files, account_file, publish_datetimes, build_app,
+                        browser_pool, progress=progress)
 
 
 
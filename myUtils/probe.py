@@ -0,0 +1,131 @@
+import asyncio
+import json
+import weakref
+from urllib.parse import urlsplit
+
+import httpx
+
+import conf
+from utils.log import logger
+
+# 探测模式：先用 HTTP 请求各平台的账号信息接口判断 cookie 是否有效，结果不明确时再回退到浏览器检查
+COOKIE_PROBE_MODE = getattr(conf, "COOKIE_PROBE_MODE", False)
+# 各平台接口的 base url，可以指向本地 stub，key 为平台类型
+COOKIE_PROBE_BASE_URLS = getattr(conf, "COOKIE_PROBE_BASE_URLS", {})
+COOKIE_PROBE_TIMEOUT = getattr(conf, "COOKIE_PROBE_TIMEOUT", 5)
+
+USER_AGENT = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+              "(KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36")
+
+
+def _douyin_result(body):
+    # status_code 0 为已登录，8 为未登录
+    if body.get("status_code") == 0 and body.get("user"):
+        return True
+    if body.get("status_code") == 8:
+        return False
+    return None
+
+
+def _tencent_result(body):
+    # errCode 0 为已登录，300333/300334 为登录态失效
+    if body.get("errCode") == 0:
+        return True
+    if body.get("errCode") in (300333, 300334):
+        return False
+    return None
+
+
+def _ks_result(body):
+    # result 1 为成功，109 为未登录
+    if body.get("result") == 1:
+        return True
+    if body.get("result") == 109:
+        return False
+    return None
+
+
+def _xhs_result(body):
+    # code -100 为登录已过期
+    if body.get("success") and body.get("code") == 0:
+        return True
+    if body.get("code") == -100:
+        return False
+    return None
+
+
+# 平台类型 -> (默认 base url, 接口路径, 请求方法, 结果判断)，TikTok 没有可用的轻量接口，始终走浏览器
+PROBE_ENDPOINTS = {
+    1: ("https://creator.xiaohongshu.com", "/api/galaxy/user/info", "GET", _xhs_result),
+    2: ("https://channels.weixin.qq.com", "/cgi-bin/mmfinderassistant-bin/auth/auth_data", "POST", _tencent_result),
+    3: ("https://creator.douyin.com", "/web/api/media/user/info/", "GET", _douyin_result),
+    4: ("https://cp.kuaishou.com", "/rest/v2/creator/pc/authority/account/current", "POST", _ks_result),
+}
+
+
+def load_cookie_header(account_file, host):
+    """从 playwright 的 storage_state 文件中取出发往 host 的 cookie，拼成 Cookie 请求头"""
+    with open(account_file, encoding="utf-8") as f:
+        cookies = json.load(f).get("cookies", [])
+    pairs = []
+    for cookie in cookies:
+        domain = cookie.get("domain", "").lstrip(".")
+        if host == domain or host.endswith("." + domain):
+            pairs.append(f"{cookie['name']}={cookie['value']}")
+    return "; ".join(pairs)
+
+
+_clients = weakref.WeakKeyDictionary()
+
+
+def get_probe_client():
+    """返回当前事件循环共享的 httpx 客户端，同一循环内的探测复用连接"""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(
+            timeout=COOKIE_PROBE_TIMEOUT,
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+            headers={"User-Agent": USER_AGENT},
+        )
+        _clients[loop] = client
+    return client
+
+
+async def probe_cookie(type, account_file):
+    """
+    用 HTTP 请求判断 cookie 是否有效。
+    返回 True/False；接口异常、返回内容无法判断（包括不带未登录码的 401/403）或平台不支持时返回 None，
+    由调用方回退到浏览器检查。
+    """
+    endpoint = PROBE_ENDPOINTS.get(type)
+    if endpoint is None:
+        return None
+    default_base_url, path, method, parse_result = endpoint
+    base_url = COOKIE_PROBE_BASE_URLS.get(type, default_base_url)
+    # cookie 按平台真实域名挑选，base url 指向 stub 时也能带上
+    origin = f"https://{urlsplit(default_base_url).hostname}"
+    try:
+        headers = {
+            "Cookie": load_cookie_header(account_file, urlsplit(default_base_url).hostname),
+            "Referer": origin + "/",
+            "Origin": origin,
+        }
+        if method == "POST":
+            response = await get_probe_client().post(base_url + path, json={}, headers=headers)
+        else:
+            response = await get_probe_client().get(base_url + path, headers=headers)
+        try:
+            body = response.json()
+        except ValueError:
+            body = None
+        if not isinstance(body, dict):
+            return None
+        result = parse_result(body)
+        if response.status_code != 200:
+            # 401/403 常是风控、WAF 拦截而不是登录失效，只有响应体里带着平台明确的未登录码时才判定失效
+            return False if result is False else None
+        return result
+    except (OSError, ValueError, httpx.HTTPError) as e:
+        logger.warning(f"[probe] type={type}, file={account_file} 探测失败，回退到浏览器检查: {e}")
+        return None
@@ -0,0 +1,53 @@
+import time
+
+from utils.db import get_connection, row_cursor
+
+ITEM_SUCCEEDED = "succeeded"
+ITEM_FAILED = "failed"
+
+
+class PublishProgress(object):
+    """
+    一个发布任务里每个 (文件, 账号) 的结果，保存在 publish_job_items。
+    任务租约过期被重新领取时，已经成功的组合直接跳过，不会再发布到同一个账号。
+    file 为 fileList 中的原始值，account 为 cookie 文件名（YouTube 没有账号，为空字符串）。
+    """
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        with get_connection() as conn:
+            rows = conn.execute('SELECT file, account FROM publish_job_items WHERE job_id = ? AND status = ?',
+                                (job_id, ITEM_SUCCEEDED)).fetchall()
+        self._done = {tuple(row) for row in rows}
+
+    def is_done(self, file, account):
+        return (str(file), str(account)) in self._done
+
+    def record(self, file, account, error=None):
+        """记录一个组合的结果，error 为空表示成功"""
+        file, account = str(file), str(account)
+        with get_connection() as conn:
+            conn.execute('''
+            INSERT OR REPLACE INTO publish_job_items (job_id, file, account, status, error, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ''', (self.job_id, file, account, ITEM_FAILED if error else ITEM_SUCCEEDED, error, time.time()))
+            conn.commit()
+        if not error:
+            self._done.add((file, account))
+
+
+def get_job_items(job_ids):
+    """返回 {任务 ID: [{file, account, status, error}]}"""
+    if not job_ids:
+        return {}
+    placeholders = ",".join("?" for _ in job_ids)
+    with get_connection() as conn:
+        rows = row_cursor(conn).execute(f'''
+        SELECT job_id, file, account, status, error FROM publish_job_items
+        WHERE job_id IN ({placeholders}) ORDER BY job_id, file, account
+        ''', list(job_ids)).fetchall()
+    items = {}
+    for row in rows:
+        item = dict(row)
+        items.setdefault(item.pop('job_id'), []).append(item)
+    return items
@@ -0,0 +1,196 @@
+import asyncio
+import hashlib
+import json
+import os
+import weakref
+from pathlib import Path
+
+import conf
+from conf import BASE_DIR
+from myUtils.media_info import probe_media
+from utils.base_social_media import SOCIAL_MEDIA_TENCENT, SOCIAL_MEDIA_TIKTOK, SOCIAL_MEDIA_YOUTUBE
+from utils.log import logger
+
+# 转码输出目录：transcoded/ab/{源文件sha256}_{配置名}_{配置摘要}.mp4，同一源文件 + 同一配置只转一次
+TRANSCODE_DIR = Path(BASE_DIR / "videoFile" / "transcoded")
+FFMPEG_PATH = getattr(conf, "FFMPEG_PATH", "ffmpeg")
+# 转码可用的 CPU 核数，以及同时运行的 ffmpeg 进程数；每个进程分到 CPU 预算 / 进程数 个线程
+TRANSCODE_CPU_BUDGET = getattr(conf, "TRANSCODE_CPU_BUDGET", os.cpu_count() or 2)
+TRANSCODE_WORKERS = getattr(conf, "TRANSCODE_WORKERS", max(1, TRANSCODE_CPU_BUDGET // 4))
+TRANSCODE_TIMEOUT = getattr(conf, "TRANSCODE_TIMEOUT", 3600)
+
+# 转码配置：源文件的编码、长边、帧率、码率都在 accept_* / max_* 范围内时直接上传原文件，否则按配置转码
+#   video_codec / crf / preset / max_bitrate（bit/s）：x264 参数，max_bitrate 同时作为 VBV 上限
+#   max_long_side：长边像素上限（横竖屏通用），max_fps：帧率上限
+#   audio_codec / audio_bitrate：音频参数；accept_*_codecs 为不需要重新编码的源编码（ffprobe 的 codec_name）
+TRANSCODE_PROFILES = {
+    "h264_1080p": {
+        "video_codec": "libx264", "accept_video_codecs": ["h264"], "crf": 23, "preset": "medium",
+        "max_bitrate": 8000000, "max_long_side": 1920, "max_fps": 60,
+        "audio_codec": "aac", "accept_audio_codecs": ["aac"], "audio_bitrate": "128k",
+    },
+    "youtube_2160p": {
+        "video_codec": "libx264", "accept_video_codecs": ["h264", "hevc", "vp9", "av1"], "crf": 20, "preset": "medium",
+        "max_bitrate": 45000000, "max_long_side": 3840, "max_fps": 60,
+        "audio_codec": "aac", "accept_audio_codecs": ["aac", "opus", "mp3"], "audio_bitrate": "192k",
+    },
+}
+TRANSCODE_PROFILES.update(getattr(conf, "TRANSCODE_PROFILES", {}))
+# 平台 -> 转码配置名，没有配置的平台直接上传原文件
+# 视频号的网页端用 Playwright 自带的 Chromium 时 HEVC 等编码预览会报错，统一转成 H.264
+TRANSCODE_PLATFORM_PROFILES = {
+    SOCIAL_MEDIA_TENCENT: "h264_1080p",
+    SOCIAL_MEDIA_TIKTOK: "h264_1080p",
+    SOCIAL_MEDIA_YOUTUBE: "youtube_2160p",
+}
+TRANSCODE_PLATFORM_PROFILES.update(getattr(conf, "TRANSCODE_PLATFORM_PROFILES", {}))
+
+
+def profile_digest(profile):
+    """配置内容的摘要，修改配置后旧的转码结果自然失效"""
+    return hashlib.sha1(json.dumps(profile, sort_keys=True).encode("utf-8")).hexdigest()[:8]
+
+
+def needs_transcode(profile, info):
+    """按探测结果判断源文件是否需要转码，返回原因列表"""
+    reasons = []
+    if info.get("video_codec") not in profile.get("accept_video_codecs", []):
+        reasons.append(f"视频编码 {info.get('video_codec')}")
+    long_side = max(info.get("width") or 0, info.get("height") or 0)
+    if profile.get("max_long_side") and long_side > profile["max_long_side"]:
+        reasons.append(f"分辨率 {info.get('width')}x{info.get('height')}")
+    if profile.get("max_fps") and (info.get("frame_rate") or 0) > profile["max_fps"] + 0.5:
+        reasons.append(f"帧率 {info.get('frame_rate')}")
+    if profile.get("max_bitrate") and (info.get("bit_rate") or 0) > profile["max_bitrate"] * 1.1:
+        reasons.append(f"码率 {info.get('bit_rate')}")
+    if info.get("audio_codec") is not None and info["audio_codec"] not in profile.get("accept_audio_codecs", []):
+        reasons.append(f"音频编码 {info['audio_codec']}")
+    return reasons
+
+
+def ffmpeg_command(profile, info, source, output, threads):
+    """根据配置和源文件的探测结果拼出 ffmpeg 命令"""
+    video_filters = []
+    width, height = info.get("width"), info.get("height")
+    max_long_side = profile.get("max_long_side")
+    if width and height and max_long_side and max(width, height) > max_long_side:
+        scale = max_long_side / max(width, height)
+        # x264 要求宽高为偶数
+        video_filters.append(f"scale={round(width * scale / 2) * 2}:{round(height * scale / 2) * 2}")
+    if profile.get("max_fps") and (info.get("frame_rate") or 0) > profile["max_fps"] + 0.5:
+        video_filters.append(f"fps={profile['max_fps']}")
+    command = [FFMPEG_PATH, "-nostdin", "-y", "-v", "error", "-i", str(source),
+               "-map", "0:v:0", "-map", "0:a:0?", "-threads", str(threads)]
+    video_ok = (info.get("video_codec") in profile.get("accept_video_codecs", []) and not video_filters
+                and not (profile.get("max_bitrate") and (info.get("bit_rate") or 0) > profile["max_bitrate"] * 1.1))
+    if video_ok:
+        # 只有音频不符合时视频直接复制，不重新编码
+        command += ["-c:v", "copy"]
+    else:
+        command += ["-c:v", profile.get("video_codec", "libx264"), "-preset", profile.get("preset", "medium"),
+                    "-crf", str(profile.get("crf", 23)), "-pix_fmt", "yuv420p"]
+        if profile.get("max_bitrate"):
+            command += ["-maxrate", str(profile["max_bitrate"]), "-bufsize", str(profile["max_bitrate"] * 2)]
+        if video_filters:
+            command += ["-vf", ",".join(video_filters)]
+    if info.get("audio_codec") in profile.get("accept_audio_codecs", []):
+        command += ["-c:a", "copy"]
+    else:
+        command += ["-c:a", profile.get("audio_codec", "aac"), "-b:a", profile.get("audio_bitrate", "128k")]
+    command += ["-movflags", "+faststart", "-f", "mp4", str(output)]
+    return command
+
+
+_semaphores = weakref.WeakKeyDictionary()
+_running = {}
+_ffmpeg_missing = False
+
+
+def ffmpeg_slot():
+    """同一事件循环里的所有 ffmpeg 进程（转码、封面）共用 TRANSCODE_WORKERS 个名额"""
+    loop = asyncio.get_running_loop()
+    semaphore = _semaphores.get(loop)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(TRANSCODE_WORKERS)
+        _semaphores[loop] = semaphore
+    return semaphore
+
+
+async def _run_ffmpeg(command, part, output):
+    """运行 ffmpeg 写入 part，成功后改名为 output"""
+    async with ffmpeg_slot():
+        process = await asyncio.create_subprocess_exec(
+            *command, stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE)
+        try:
+            _, stderr = await asyncio.wait_for(process.communicate(), timeout=TRANSCODE_TIMEOUT)
+        except BaseException:
+            process.kill()
+            await process.wait()
+            part.unlink(missing_ok=True)
+            raise
+    if process.returncode != 0:
+        part.unlink(missing_ok=True)
+        raise RuntimeError(stderr.decode("utf-8", "replace").strip()[-500:] or f"ffmpeg 退出码 {process.returncode}")
+    os.replace(part, output)
+
+
+async def transcode_for_platform(platform, path):
+    """
+    返回上传到 platform 时应该使用的文件：平台没有转码配置、源文件已经符合配置、
+    或者无法转码（没有 ffmpeg/ffprobe、转码失败）时返回源文件本身，否则返回（必要时先生成）转码结果。
+    """
+    global _ffmpeg_missing
+    profile_name = TRANSCODE_PLATFORM_PROFILES.get(platform)
+    if not profile_name or _ffmpeg_missing:
+        return path
+    profile = TRANSCODE_PROFILES[profile_name]
+    info = await probe_media(path)
+    if info is None or info.get("error"):
+        return path
+    reasons = needs_transcode(profile, info)
+    if not reasons:
+        return path
+    content_hash = info["content_hash"]
+    output = TRANSCODE_DIR / content_hash[:2] / f"{content_hash}_{profile_name}_{profile_digest(profile)}.mp4"
+    if output.exists():
+        return output
+    # 同一输出同时只转一次，其余发布等待同一个进程
+    task = _running.get(output)
+    if task is None or task.get_loop() is not asyncio.get_running_loop():
+        output.parent.mkdir(parents=True, exist_ok=True)
+        threads = max(1, TRANSCODE_CPU_BUDGET // TRANSCODE_WORKERS)
+        logger.info(f"[transcode] {Path(path).name} -> {profile_name}（{'，'.join(reasons)}）")
+        part = output.with_name(output.name + ".part")
+        task = asyncio.ensure_future(_run_ffmpeg(ffmpeg_command(profile, info, path, part, threads), part, output))
+        _running[output] = task
+        task.add_done_callback(lambda done: _running.pop(output, None))
+    try:
+        await asyncio.shield(task)
+    except FileNotFoundError:
+        _ffmpeg_missing = True
+        logger.warning(f"[transcode] 找不到 {FFMPEG_PATH}，直接上传原文件")
+        return path
+    except Exception as e:
+        logger.warning(f"[transcode] {Path(path).name} 转码失败，直接上传原文件: {e}")
+        return path
+    return output
+
+
+async def cut_clip(source, output, seconds):
+    """流复制截取 source 的前 seconds 秒到 output（测试发布用），与转码共用 ffmpeg 名额"""
+    output = Path(output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    part = output.with_name(output.name + ".part")
+    command = [FFMPEG_PATH, "-nostdin", "-y", "-v", "error", "-i", str(source), "-t", str(seconds),
+               "-c", "copy", "-movflags", "+faststart", "-f", "mp4", str(part)]
+    await _run_ffmpeg(command, part, output)
+    return output
+
+
+async def transcode_files(platform, files, skip=()):
+    """并发准备一批文件的平台版本，返回与 files 一一对应的路径；skip 中的文件原样返回，已有转码结果的文件不用等待"""
+    async def prepare(file):
+        return file if file in skip else await transcode_for_platform(platform, file)
+
+    return list(await asyncio.gather(*(prepare(file) for file in files)))
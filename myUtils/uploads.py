@@ -0,0 +1,386 @@
+import asyncio
+import hashlib
+import os
+import re
+import threading
+import time
+import uuid
+from pathlib import Path
+
+import conf
+from conf import BASE_DIR
+from utils.db import get_connection, row_cursor
+from utils.event_loop import spawn
+from utils.log import logger
+from utils.metrics import UPLOAD_BYTES
+from utils.migrations import ensure_schema
+
+VIDEO_DIR = Path(BASE_DIR / "videoFile")
+# 未完成的上传先写到 .parts 目录，complete 时再改名到 videoFile 下
+PARTS_DIR = VIDEO_DIR / ".parts"
+# 按内容 sha256 存放的文件：blobs/ab/abcdef...，videoFile 下每条 file_records 对应的文件是它的硬链接
+BLOB_DIR = VIDEO_DIR / "blobs"
+
+# 客户端每个分片的建议大小和服务端允许的最大分片（字节）
+UPLOAD_CHUNK_SIZE = getattr(conf, "UPLOAD_CHUNK_SIZE", 8 * 1024 * 1024)
+UPLOAD_CHUNK_MAX_SIZE = getattr(conf, "UPLOAD_CHUNK_MAX_SIZE", 64 * 1024 * 1024)
+# 超过这个时间（小时）没有新分片的上传会被清理
+UPLOAD_SESSION_TTL_HOURS = getattr(conf, "UPLOAD_SESSION_TTL_HOURS", 24)
+# 后台清理没有引用的 blob 的间隔（秒）
+UPLOAD_BLOB_SWEEP_INTERVAL = getattr(conf, "UPLOAD_BLOB_SWEEP_INTERVAL", 3600)
+# 从请求流读取、写入磁盘的块大小，内存占用只和它有关
+STREAM_BLOCK_SIZE = 1024 * 1024
+# 容器格式识别只需要文件头
+SNIFF_SIZE = 512
+
+UPLOAD_UPLOADING = "uploading"
+UPLOAD_DONE = "done"
+
+
+class UploadError(Exception):
+    """分片上传的请求错误，status 为对应的 HTTP 状态码"""
+
+    def __init__(self, msg, status=400, received=None):
+        super().__init__(msg)
+        self.status = status
+        self.received = received
+
+
+_locks = {}
+_locks_guard = threading.Lock()
+# 分片上传进行中的 sha256 状态：upload_id -> (hasher, 已计算到的偏移)，进程重启后丢失，complete 时再补算
+_hashers = {}
+
+def sniff_container(head):
+    """根据文件头识别视频容器格式，识别不了返回 None"""
+    if len(head) >= 12 and head[4:8] == b'ftyp':
+        brand = head[8:12]
+        if brand == b'qt  ':
+            return "mov"
+        if brand.startswith(b'3g'):
+            return "3gp"
+        return "mp4"
+    if head.startswith(b'\x1a\x45\xdf\xa3'):
+        return "webm" if b'webm' in head[:64] else "mkv"
+    if head.startswith(b'RIFF') and head[8:12] == b'AVI ':
+        return "avi"
+    if head.startswith(b'FLV'):
+        return "flv"
+    if len(head) > 188 and head[0] == 0x47 and head[188] == 0x47:
+        return "mpegts"
+    return None
+
+
+class IngestWriter(object):
+    """写文件的同时计算 sha256、字节数并保留文件头用于识别容器，大文件只读一遍"""
+
+    def __init__(self, f):
+        self.f = f
+        self.hasher = hashlib.sha256()
+        self.size = 0
+        self.head = b''
+
+    def write(self, block):
+        self.f.write(block)
+        self.hasher.update(block)
+        self.size += len(block)
+        if len(self.head) < SNIFF_SIZE:
+            self.head += block[:SNIFF_SIZE - len(self.head)]
+
+    def result(self):
+        return {
+            "content_hash": self.hasher.hexdigest(),
+            "size_bytes": self.size,
+            "container": sniff_container(self.head),
+        }
+
+
+def save_stream(stream, path):
+    """把上传流写到 path，返回 {content_hash, size_bytes, container}"""
+    with open(path, 'wb') as f:
+        writer = IngestWriter(f)
+        while True:
+            block = stream.read(STREAM_BLOCK_SIZE)
+            if not block:
+                break
+            writer.write(block)
+    return writer.result()
+
+
+def ingest_file(path):
+    """对已经在磁盘上的文件补算 {content_hash, size_bytes, container}"""
+    with open(path, 'rb') as f:
+        return save_stream(f, os.devnull)
+
+
+def record_file(conn, filename, final_filename, info):
+    """写入一条 file_records 记录，info 为 save_stream / ingest_file 的结果"""
+    cursor = conn.execute('''
+    INSERT INTO file_records (filename, filesize, file_path, content_hash, size_bytes, container, uuid)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (filename, round(float(info['size_bytes']) / (1024 * 1024), 2), final_filename,
+          info['content_hash'], info['size_bytes'], info['container'], final_filename.split('_', 1)[0]))
+    return cursor.lastrowid
+
+
+def blob_path(content_hash):
+    return BLOB_DIR / content_hash[:2] / content_hash
+
+
+def store_blob(path, content_hash):
+    """
+    把刚写好的 path 纳入内容寻址存储：
+    blob 不存在时把 path 硬链接为 blob；已存在时把 path 换成指向 blob 的硬链接，重复内容只占一份磁盘。
+    文件系统不支持硬链接时保留 path 原样（不去重）。
+    """
+    blob = blob_path(content_hash)
+    blob.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        os.link(path, blob)
+        return
+    except FileExistsError:
+        pass
+    except OSError as e:
+        logger.warning(f"[uploads] 无法创建硬链接，跳过去重: {e}")
+        return
+    # 先链接到临时名再原子替换，替换前 path 一直是完整文件
+    tmp = Path(f"{path}.link")
+    try:
+        tmp.unlink(missing_ok=True)
+        os.link(blob, tmp)
+        os.replace(tmp, path)
+    except OSError as e:
+        tmp.unlink(missing_ok=True)
+        logger.warning(f"[uploads] 链接已有文件失败，保留新文件: {e}")
+
+
+def find_blob(content_hash, size=None):
+    """已有相同内容时返回 {content_hash, size_bytes, container}，否则返回 None"""
+    if not content_hash or not re.fullmatch(r'[0-9a-f]{64}', content_hash):
+        return None
+    blob = blob_path(content_hash)
+    try:
+        size_bytes = blob.stat().st_size
+        with open(blob, 'rb') as f:
+            head = f.read(SNIFF_SIZE)
+    except OSError:
+        return None
+    if size is not None and int(size) != size_bytes:
+        return None
+    return {"content_hash": content_hash, "size_bytes": size_bytes, "container": sniff_container(head)}
+
+
+def link_existing_upload(content_hash, size, filename, record=True):
+    """
+    秒传：服务端已有相同内容时直接生成 {uuid}_{filename} 的硬链接并写入 file_records，
+    返回最终文件名；没有相同内容时返回 None，客户端再正常上传。
+    """
+    _check_filename(filename)
+    info = find_blob(content_hash, size)
+    if info is None:
+        return None
+    final_filename = f"{uuid.uuid1()}_{filename}"
+    try:
+        os.link(blob_path(content_hash), VIDEO_DIR / final_filename)
+    except OSError as e:
+        logger.warning(f"[uploads] 秒传链接失败，改为正常上传: {e}")
+        return None
+    if record:
+        with get_connection() as conn:
+            record_file(conn, filename, final_filename, info)
+            conn.commit()
+    return final_filename
+
+
+def release_blob(conn, content_hash):
+    """删除 file_records 记录后调用：没有记录再引用这份内容时删除 blob"""
+    if not content_hash:
+        return
+    (refs,) = conn.execute('SELECT COUNT(*) FROM file_records WHERE content_hash = ?', (content_hash,)).fetchone()
+    if refs == 0:
+        blob_path(content_hash).unlink(missing_ok=True)
+
+
+def cleanup_orphan_blobs():
+    """删除 videoFile 下已经没有硬链接指向的 blob（链接数为 1，例如文件被直接从磁盘删除）"""
+    for blob in BLOB_DIR.glob('*/*'):
+        try:
+            if blob.stat().st_nlink <= 1:
+                blob.unlink()
+                logger.info(f"[uploads] 删除没有引用的 blob {blob.name}")
+        except OSError:
+            pass
+
+
+async def _sweep_blobs(interval):
+    while True:
+        try:
+            await asyncio.to_thread(cleanup_orphan_blobs)
+        except Exception as e:
+            logger.exception(f"[uploads] 清理 blob 失败: {e}")
+        await asyncio.sleep(interval)
+
+
+_blob_sweeper = None
+
+
+def start_blob_sweeper(interval=None):
+    """在后台事件循环上定期执行 cleanup_orphan_blobs（重复调用只启动一次）"""
+    global _blob_sweeper
+    if _blob_sweeper is None:
+        _blob_sweeper = spawn(_sweep_blobs(interval or UPLOAD_BLOB_SWEEP_INTERVAL), "blob sweeper")
+    return _blob_sweeper
+
+
+def _session_lock(upload_id):
+    # 同一个上传的分片串行写入
+    with _locks_guard:
+        return _locks.setdefault(upload_id, threading.Lock())
+
+
+def _forget(upload_id):
+    """上传完成、过期或不存在时丢掉它在内存里的锁和 sha256 状态"""
+    with _locks_guard:
+        _locks.pop(upload_id, None)
+    _hashers.pop(upload_id, None)
+
+
+def _check_filename(filename):
+    if not filename or '/' in filename or '\\' in filename or '..' in filename:
+        raise UploadError("Invalid filename")
+
+
+def _part_path(upload_id):
+    return PARTS_DIR / f"{upload_id}.part"
+
+
+def get_upload_session(upload_id):
+    ensure_schema()
+    with get_connection() as conn:
+        row = row_cursor(conn).execute('SELECT * FROM upload_sessions WHERE id = ?', (upload_id,)).fetchone()
+    return dict(row) if row else None
+
+
+def create_upload_session(filename, size):
+    """登记一次分片上传并创建空的分片文件，返回上传会话"""
+    _check_filename(filename)
+    if size is None or int(size) < 0:
+        raise UploadError("Invalid file size")
+    cleanup_expired_uploads()
+    upload_id = str(uuid.uuid1())
+    now = time.time()
+    PARTS_DIR.mkdir(parents=True, exist_ok=True)
+    _part_path(upload_id).touch()
+    _hashers[upload_id] = (hashlib.sha256(), 0)
+    with get_connection() as conn:
+        conn.execute('''
+        INSERT INTO upload_sessions (id, filename, final_filename, size, received, status, created_at, updated_at)
+        VALUES (?, ?, ?, ?, 0, ?, ?, ?)
+        ''', (upload_id, filename, f"{upload_id}_{filename}", int(size), UPLOAD_UPLOADING, now, now))
+        conn.commit()
+    return get_upload_session(upload_id)
+
+
+def append_chunk(upload_id, offset, stream, length=None, route="/uploadChunk"):
+    """
+    把请求流中的一个分片直接写到分片文件的 offset 处，返回写入后的 received。
+    offset 必须等于已确认的 received，否则抛出 409，客户端按返回的 received 续传。
+    连接中途断开时，已经落盘的部分也会记入 received。
+    """
+    with _session_lock(upload_id):
+        session = get_upload_session(upload_id)
+        if session is None:
+            _forget(upload_id)
+            raise UploadError("Upload not found", 404)
+        if session['status'] != UPLOAD_UPLOADING:
+            raise UploadError("Upload already completed", 409, session['received'])
+        if offset != session['received']:
+            raise UploadError("Offset mismatch", 409, session['received'])
+        if length is not None and (length > UPLOAD_CHUNK_MAX_SIZE or offset + length > session['size']):
+            raise UploadError("Chunk too large", 413, session['received'])
+
+        written = 0
+        # 分片按顺序到达时在写入的同时更新 sha256，否则放弃增量状态，complete 时整体补算
+        hasher, hashed = _hashers.pop(upload_id, (None, None))
+        if hashed != offset:
+            hasher = None
+        try:
+            with open(_part_path(upload_id), 'r+b') as f:
+                f.seek(offset)
+                while True:
+                    block = stream.read(STREAM_BLOCK_SIZE)
+                    if not block:
+                        break
+                    if offset + written + len(block) > session['size'] or written + len(block) > UPLOAD_CHUNK_MAX_SIZE:
+                        raise UploadError("Chunk exceeds declared size", 413)
+                    f.write(block)
+                    if hasher is not None:
+                        hasher.update(block)
+                    written += len(block)
+        finally:
+            if hasher is not None:
+                _hashers[upload_id] = (hasher, offset + written)
+            received = offset + written
+            with get_connection() as conn:
+                conn.execute('UPDATE upload_sessions SET received = ?, updated_at = ? WHERE id = ?',
+                             (received, time.time(), upload_id))
+                conn.commit()
+            UPLOAD_BYTES.inc(written, route=route)
+        return received
+
+
+def complete_upload(upload_id, record=True):
+    """
+    所有字节到齐后把分片文件移动到 videoFile 下，record 为 True 时写入 file_records（与 /uploadSave 一致）。
+    返回完成后的上传会话。重复调用是安全的：上次在移动文件之后中断时，这次只补完剩下的记录。
+    """
+    with _session_lock(upload_id):
+        session = get_upload_session(upload_id)
+        if session is None:
+            _forget(upload_id)
+            raise UploadError("Upload not found", 404)
+        if session['status'] == UPLOAD_DONE:
+            return session
+        if session['received'] != session['size']:
+            raise UploadError("Upload incomplete", 409, session['received'])
+        final_path = VIDEO_DIR / session['final_filename']
+        part_path = _part_path(upload_id)
+        hasher, hashed = _hashers.pop(upload_id, (None, None))
+        if part_path.exists():
+            if hasher is not None and hashed == session['size']:
+                with open(part_path, 'rb') as f:
+                    head = f.read(SNIFF_SIZE)
+                info = {"content_hash": hasher.hexdigest(), "size_bytes": session['size'],
+                        "container": sniff_container(head)}
+            else:
+                info = ingest_file(part_path)
+            os.replace(part_path, final_path)
+        elif final_path.exists():
+            # 上次在改名之后、更新会话之前中断（例如进程退出），文件已经在 videoFile 下
+            info = ingest_file(final_path)
+        else:
+            raise UploadError("Upload file missing", 410)
+        # 只有写入 file_records 的文件纳入 blob 存储，release_blob 按记录数释放
+        if record:
+            store_blob(final_path, info['content_hash'])
+        with get_connection() as conn:
+            conn.execute('UPDATE upload_sessions SET status = ?, updated_at = ? WHERE id = ?',
+                         (UPLOAD_DONE, time.time(), upload_id))
+            if record:
+                record_file(conn, session['filename'], session['final_filename'], info)
+            conn.commit()
+    _forget(upload_id)
+    return get_upload_session(upload_id)
+
+
+def cleanup_expired_uploads():
+    """删除长时间没有新分片的上传及其分片文件，已完成的会话记录也一并清理"""
+    ensure_schema()
+    deadline = time.time() - UPLOAD_SESSION_TTL_HOURS * 3600
+    with get_connection() as conn:
+        rows = conn.execute('SELECT id FROM upload_sessions WHERE updated_at < ?', (deadline,)).fetchall()
+        for (upload_id,) in rows:
+            _part_path(upload_id).unlink(missing_ok=True)
+            _forget(upload_id)
+        conn.execute('DELETE FROM upload_sessions WHERE updated_at < ?', (deadline,))
+        conn.commit()
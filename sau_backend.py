@@ -1,30 +1,46 @@
-import asyncio
 import os
-import sqlite3
-import threading
-import time
 import uuid
 from pathlib import Path
-from queue import Queue
+from queue import Queue, Empty
 from flask_cors import CORS
 
-from examples.upload_video_to_tiktok import post_video_tiktok
-from examples.upload_video_to_youtobe import post_video_youtobe
-from myUtils.auth import check_cookie
+from myUtils.cookie_cache import check_cookies_cached, start_cookie_refresher
 from flask import Flask, request, jsonify, Response, render_template, send_from_directory
+from werkzeug.exceptions import RequestEntityTooLarge
+import conf
 from conf import BASE_DIR
+from myUtils.pagination import parse_page_args, page_query, stream_page
 from myUtils.login import get_tencent_cookie, douyin_cookie_gen, get_ks_cookie, xiaohongshu_cookie_gen, get_titok_cookie
-from myUtils.postVideo import post_video_tencent, post_video_DouYin, post_video_ks, post_video_xhs
+from myUtils.jobs import enqueue_publish_job, get_publish_jobs, start_publish_workers
+from myUtils.media_info import schedule_probe
+from myUtils.uploads import UploadError, UPLOAD_CHUNK_SIZE, create_upload_session, append_chunk, complete_upload, \
+    get_upload_session, save_stream, record_file, store_blob, release_blob, \
+    link_existing_upload, start_blob_sweeper, UPLOAD_CHUNK_MAX_SIZE
 from uploader.tk_uploader.main import tiktok_setup
+from utils.base_social_media import SOCIAL_MEDIA_TYPES
+from utils.db import get_connection, row_cursor
+from utils.event_loop import run_coroutine, spawn
+from utils.metrics import UPLOAD_BYTES, SSE_CONNECTIONS, render_metrics
+from utils.migrations import ensure_schema
+from utils.timing import get_step_metrics
 
 active_queues = {}
+# SSE 登录流：没有新消息时多久发一次心跳（同时用于发现客户端已断开），以及表示登录结束的状态码
+SSE_HEARTBEAT_SECONDS = 15
+SSE_TERMINAL_MESSAGES = ("200", "500")
+# /getFile 返回文件的浏览器缓存时间（秒）
+FILE_CACHE_MAX_AGE = 365 * 24 * 3600
 app = Flask(__name__)
 
 #允许所有来源跨域访问
 CORS(app)
 
-# 限制上传文件大小为160MB
-app.config['MAX_CONTENT_LENGTH'] = 160 * 1024 * 1024
+# 由前置的 nginx/apache 通过 X-Sendfile 直接发送文件，需要代理侧同时配置
+app.config['USE_X_SENDFILE'] = getattr(conf, "USE_X_SENDFILE", False)
+
+# 限制 /upload、/uploadSave 等整体上传的请求体大小，大文件请走分片上传（/uploadInit）；
+# /uploadChunk 单独按 UPLOAD_CHUNK_MAX_SIZE 限制
+app.config['MAX_CONTENT_LENGTH'] = getattr(conf, "UPLOAD_MAX_CONTENT_LENGTH", 160 * 1024 * 1024)
 
 # 获取当前目录（假设 index.html 和 assets 在这里）
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -68,7 +84,10 @@ def upload_file():
         uuid_v1 = uuid.uuid1()
         print(f"UUID v1: {uuid_v1}")
         filepath = Path(BASE_DIR / "videoFile" / f"{uuid_v1}_{file.filename}")
-        file.save(filepath)
+        # 不写 file_records 的文件不纳入 blob 存储，否则没有记录引用的 blob 永远不会被释放
+        info = save_stream(file.stream, filepath)
+        UPLOAD_BYTES.inc(info['size_bytes'], route="/upload")
+        schedule_probe(filepath, info['content_hash'])
         return jsonify({"code":200,"msg": "File uploaded successfully", "data": f"{uuid_v1}_{file.filename}"}), 200
     except Exception as e:
         return jsonify({"code":200,"msg": str(e),"data":None}), 500
@@ -88,8 +107,18 @@ def get_file():
     # 拼接完整路径
     file_path = str(Path(BASE_DIR / "videoFile"))
 
-    # 返回文件
-    return send_from_directory(file_path,filename)
+    # 有内容哈希时用它作为强 ETag，否则由 werkzeug 按修改时间和大小生成
+    with get_connection() as conn:
+        row = conn.execute('SELECT content_hash FROM file_records WHERE file_path = ? AND content_hash IS NOT NULL',
+                           (filename,)).fetchone()
+    etag = row[0] if row else True
+
+    # 返回文件：conditional 处理 Range / If-None-Match / If-Modified-Since，
+    # 文件名带 UUID，内容不会变，浏览器可以长期缓存；文件体由 wsgi.file_wrapper（或 X-Sendfile）发送
+    response = send_from_directory(file_path, filename, conditional=True, etag=etag, max_age=FILE_CACHE_MAX_AGE)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
 
 
 @app.route('/uploadSave', methods=['POST'])
@@ -125,15 +154,14 @@ def upload_save():
         final_filename = f"{uuid_v1}_{filename}"
         filepath = Path(BASE_DIR / "videoFile" / f"{uuid_v1}_{filename}")
 
-        # 保存文件
-        file.save(filepath)
+        # 保存文件，写入的同时计算 sha256、大小和容器格式
+        info = save_stream(file.stream, filepath)
+        store_blob(filepath, info['content_hash'])
+        UPLOAD_BYTES.inc(info['size_bytes'], route="/uploadSave")
+        schedule_probe(filepath, info['content_hash'])
 
-        with sqlite3.connect(Path(BASE_DIR / "db" / "database.db")) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                                INSERT INTO file_records (filename, filesize, file_path)
-            VALUES (?, ?, ?)
-                                ''', (filename, round(float(os.path.getsize(filepath)) / (1024 * 1024),2), final_filename))
+        with get_connection() as conn:
+            record_file(conn, filename, final_filename, info)
             conn.commit()
             print("✅ 上传文件已记录")
 
@@ -154,38 +182,154 @@ def upload_save():
             "data": None
         }), 500
 
+def upload_session_data(session):
+    return {
+        "uploadId": session['id'],
+        "filename": session['filename'],
+        "filepath": session['final_filename'],
+        "size": session['size'],
+        "received": session['received'],
+        "status": session['status'],
+        "chunkSize": UPLOAD_CHUNK_SIZE
+    }
+
+
+@app.errorhandler(RequestEntityTooLarge)
+def request_too_large(e):
+    return jsonify({"code": 413, "msg": "File too large, please use chunked upload", "data": None}), 413
+
+
+def upload_error_response(e):
+    return jsonify({
+        "code": e.status,
+        "msg": str(e),
+        "data": {"received": e.received} if e.received is not None else None
+    }), e.status
+
+
+# 秒传：上传前先提交 sha256，请求体 {"hash": "...", "size": 123, "filename": "a.mp4", "customFilename": "可选", "record": true}
+# 服务端已有相同内容时直接生成文件（record 为 true 时同时写入文件记录），data.exists 为 false 时客户端再正常上传
+@app.route('/uploadCheck', methods=['POST'])
+def upload_check():
+    data = request.get_json(silent=True) or {}
+    filename = data.get('filename', '')
+    custom_filename = data.get('customFilename')
+    if custom_filename:
+        filename = custom_filename + "." + filename.split('.')[-1]
+    try:
+        final_filename = link_existing_upload(str(data.get('hash', '')).lower(), data.get('size'), filename,
+                                              data.get('record', True))
+    except UploadError as e:
+        return upload_error_response(e)
+    except (TypeError, ValueError):
+        return jsonify({"code": 400, "msg": "Invalid file size", "data": None}), 400
+    if final_filename is None:
+        return jsonify({"code": 200, "msg": None, "data": {"exists": False}}), 200
+    schedule_probe(Path(BASE_DIR / "videoFile" / final_filename), str(data.get('hash', '')).lower())
+    return jsonify({
+        "code": 200,
+        "msg": "File uploaded and saved successfully",
+        "data": {"exists": True, "filename": filename, "filepath": final_filename}
+    }), 200
+
+
+# 分片上传：初始化，请求体 {"filename": "a.mp4", "size": 123, "customFilename": "可选"}
+@app.route('/uploadInit', methods=['POST'])
+def upload_init():
+    data = request.get_json(silent=True) or {}
+    filename = data.get('filename', '')
+    custom_filename = data.get('customFilename')
+    if custom_filename:
+        filename = custom_filename + "." + filename.split('.')[-1]
+    try:
+        session = create_upload_session(filename, data.get('size'))
+    except UploadError as e:
+        return upload_error_response(e)
+    except (TypeError, ValueError):
+        return jsonify({"code": 400, "msg": "Invalid file size", "data": None}), 400
+    return jsonify({"code": 200, "msg": None, "data": upload_session_data(session)}), 200
+
+
+# 分片上传：写入一个分片，PUT /uploadChunk?uploadId=xxx&offset=0，请求体为分片的原始字节
+@app.route('/uploadChunk', methods=['PUT'])
+def upload_chunk():
+    upload_id = request.args.get('uploadId', '')
+    offset = request.args.get('offset', '')
+    if not offset.isdigit():
+        return jsonify({"code": 400, "msg": "Invalid offset", "data": None}), 400
+    request.max_content_length = UPLOAD_CHUNK_MAX_SIZE
+    try:
+        # 直接从请求流读取并写盘，不经过 request.files / request.data 缓冲
+        received = append_chunk(upload_id, int(offset), request.stream, request.content_length)
+    except UploadError as e:
+        return upload_error_response(e)
+    return jsonify({"code": 200, "msg": None, "data": {"uploadId": upload_id, "received": received}}), 200
+
+
+# 分片上传：查询进度，断线后客户端从 received 继续上传
+@app.route('/uploadStatus', methods=['GET'])
+def upload_status():
+    session = get_upload_session(request.args.get('uploadId', ''))
+    if session is None:
+        return jsonify({"code": 404, "msg": "Upload not found", "data": None}), 404
+    return jsonify({"code": 200, "msg": None, "data": upload_session_data(session)}), 200
+
+
+# 分片上传：完成，文件移动到 videoFile 并写入文件记录，record=false 时只保存文件（同 /upload）
+@app.route('/uploadComplete', methods=['POST'])
+def upload_complete():
+    data = request.get_json(silent=True) or {}
+    try:
+        session = complete_upload(data.get('uploadId', ''), data.get('record', True))
+    except UploadError as e:
+        return upload_error_response(e)
+    schedule_probe(Path(BASE_DIR / "videoFile" / session['final_filename']))
+    return jsonify({
+        "code": 200,
+        "msg": "File uploaded and saved successfully",
+        "data": upload_session_data(session)
+    }), 200
+
+def stream_rows(sql, params, page, to_json, msg=None):
+    """先执行查询（SQL 出错时还能正常返回 500），再把结果逐行流式输出"""
+    rows = row_cursor().execute(sql, params)
+
+    def generate():
+        try:
+            yield from stream_page(rows, page, to_json, msg)
+        finally:
+            rows.close()
+
+    return Response(generate(), mimetype='application/json')
+
+
+# 素材列表：?limit=50&cursor=...&sort=upload_time|filesize|id&order=desc&since=2025-01-01&until=...&container=mp4
+# 传 limit 时分页返回，data 之外带 nextCursor（没有下一页时为 null）；不传 limit 返回全部
+# 每条记录带 duration / width / height / video_codec / audio_codec / bit_rate / frame_rate（上传后后台 ffprobe 探测）
 @app.route('/getFiles', methods=['GET'])
 def get_all_files():
     try:
-        # 使用 with 自动管理数据库连接
-        with sqlite3.connect(Path(BASE_DIR / "db" / "database.db")) as conn:
-            conn.row_factory = sqlite3.Row  # 允许通过列名访问结果
-            cursor = conn.cursor()
-
-            # 查询所有记录
-            cursor.execute("SELECT * FROM file_records")
-            rows = cursor.fetchall()
-
-            # 将结果转为字典列表，并提取UUID
-            data = []
-            for row in rows:
-                row_dict = dict(row)
-                # 从 file_path 中提取 UUID (文件名的第一部分，下划线前)
-                if row_dict.get('file_path'):
-                    file_path_parts = row_dict['file_path'].split('_', 1)  # 只分割第一个下划线
-                    if len(file_path_parts) > 0:
-                        row_dict['uuid'] = file_path_parts[0]  # UUID 部分
-                    else:
-                        row_dict['uuid'] = ''
-                else:
-                    row_dict['uuid'] = ''
-                data.append(row_dict)
-
-            return jsonify({
-                "code": 200,
-                "msg": "success",
-                "data": data
-            }), 200
+        page = parse_page_args(request.args, ('id', 'upload_time', 'filesize'))
+        where, params = [], []
+        if request.args.get('since'):
+            where.append('upload_time >= ?')
+            params.append(request.args['since'])
+        if request.args.get('until'):
+            where.append('upload_time < ?')
+            params.append(request.args['until'])
+        if request.args.get('container'):
+            where.append('container = ?')
+            params.append(request.args['container'])
+        # 带上 ffprobe 探测结果（时长、分辨率、编码、码率），还没探测完的为 null
+        sql, params = page_query(
+            'file_records LEFT JOIN media_info ON media_info.content_hash = file_records.content_hash',
+            'file_records.*, media_info.duration, media_info.width, media_info.height, media_info.video_codec, '
+            'media_info.audio_codec, media_info.bit_rate, media_info.frame_rate',
+            where, params, page)
+    except ValueError as e:
+        return jsonify({"code": 400, "msg": str(e), "data": None}), 400
+    try:
+        return stream_rows(sql, params, page, dict, "success")
     except Exception as e:
         return jsonify({
             "code": 500,
@@ -194,28 +338,31 @@ def get_all_files():
         }), 500
 
 
+# 账号列表：?limit=50&cursor=...&order=asc&platform=3|douyin&status=1，分页方式同 /getFiles
 @app.route("/getAccounts", methods=['GET'])
 def getAccounts():
     """快速获取所有账号信息，不进行cookie验证"""
     try:
-        with sqlite3.connect(Path(BASE_DIR / "db" / "database.db")) as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            cursor.execute('''
-            SELECT * FROM user_info''')
-            rows = cursor.fetchall()
-            rows_list = [list(row) for row in rows]
-
-            print("\n📋 当前数据表内容（快速获取）：")
-            for row in rows:
-                print(row)
-
-            return jsonify(
-                {
-                    "code": 200,
-                    "msg": None,
-                    "data": rows_list
-                }), 200
+        page = parse_page_args(request.args, ('id',))
+        where, params = [], []
+        platform = request.args.get('platform')
+        if platform:
+            platform_type = int(platform) if platform.isdigit() else SOCIAL_MEDIA_TYPES.get(platform)
+            if platform_type is None:
+                raise ValueError("Invalid platform")
+            where.append('type = ?')
+            params.append(platform_type)
+        status = request.args.get('status')
+        if status:
+            if not status.isdigit():
+                raise ValueError("Invalid status")
+            where.append('status = ?')
+            params.append(int(status))
+        sql, params = page_query('user_info', '*', where, params, page)
+    except ValueError as e:
+        return jsonify({"code": 400, "msg": str(e), "data": None}), 400
+    try:
+        return stream_rows(sql, params, page, list)
     except Exception as e:
         print(f"获取账号列表时出错: {str(e)}")
         return jsonify({
@@ -226,29 +373,30 @@ def getAccounts():
 
 
 @app.route("/getValidAccounts",methods=['GET'])
-async def getValidAccounts():
-    with sqlite3.connect(Path(BASE_DIR / "db" / "database.db")) as conn:
+def getValidAccounts():
+    with get_connection() as conn:
         cursor = conn.cursor()
         cursor.execute('''
         SELECT * FROM user_info''')
         rows = cursor.fetchall()
         rows_list = [list(row) for row in rows]
-        print("\n📋 当前数据表内容：")
-        for row in rows:
-            print(row)
-        for row in rows_list:
-            flag = await check_cookie(row[1],row[2])
-            if not flag:
+        # 优先使用缓存的校验结果，缓存不新鲜的账号在后台事件循环上用共享浏览器池并发校验
+        results = run_coroutine(check_cookies_cached([(row[1], row[2]) for row in rows_list]))
+        invalid_ids = []
+        for row, flag in zip(rows_list, results):
+            # None 表示检查超时，状态未知，保持原状态
+            if flag is False:
                 row[4] = 0
-                cursor.execute('''
-                UPDATE user_info 
-                SET status = ? 
-                WHERE id = ?
-                ''', (0,row[0]))
-                conn.commit()
-                print("✅ 用户状态已更新")
-        for row in rows:
-            print(row)
+                invalid_ids.append((0, row[0]))
+        if invalid_ids:
+            # 所有状态变更在一个事务里写入
+            cursor.executemany('''
+            UPDATE user_info 
+            SET status = ? 
+            WHERE id = ?
+            ''', invalid_ids)
+            conn.commit()
+            print(f"✅ 用户状态已更新: {len(invalid_ids)} 个账号失效")
         return jsonify(
                         {
                             "code": 200,
@@ -269,9 +417,8 @@ def delete_file():
 
     try:
         # 获取数据库连接
-        with sqlite3.connect(Path(BASE_DIR / "db" / "database.db")) as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
+        with get_connection() as conn:
+            cursor = row_cursor(conn)
 
             # 查询要删除的记录
             cursor.execute("SELECT * FROM file_records WHERE id = ?", (file_id,))
@@ -298,8 +445,9 @@ def delete_file():
             else:
                 print(f"⚠️ 实际文件不存在: {file_path}")
 
-            # 删除数据库记录
+            # 删除数据库记录，最后一条引用这份内容的记录删除后一并删除 blob
             cursor.execute("DELETE FROM file_records WHERE id = ?", (file_id,))
+            release_blob(conn, record.get('content_hash'))
             conn.commit()
 
         return jsonify({
@@ -324,9 +472,8 @@ def delete_account():
 
     try:
         # 获取数据库连接
-        with sqlite3.connect(Path(BASE_DIR / "db" / "database.db")) as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
+        with get_connection() as conn:
+            cursor = row_cursor(conn)
 
             # 查询要删除的记录
             cursor.execute("SELECT * FROM user_info WHERE id = ?", (account_id,))
@@ -373,11 +520,15 @@ def login():
 
     def on_close():
         print(f"清理队列: {id}")
-        del active_queues[id]
-    # 启动异步任务线程
-    thread = threading.Thread(target=run_async_function, args=(type,id,status_queue), daemon=True)
-    thread.start()
-    response = Response(sse_stream(status_queue,), mimetype='text/event-stream')
+        # 同一个账号名重复登录时，只清理自己的队列
+        if active_queues.get(id) is status_queue:
+            del active_queues[id]
+        # 客户端断开时结束登录会话，立即归还浏览器上下文和并发名额
+        if future is not None and not future.done():
+            future.cancel()
+    # 登录会话交给后台事件循环上的 LoginSessionManager 执行
+    future = run_async_function(type, id, status_queue)
+    response = Response(sse_stream(status_queue, on_close, future), mimetype='text/event-stream')
     response.headers['Cache-Control'] = 'no-cache'
     response.headers['X-Accel-Buffering'] = 'no'  # 关键：禁用 Nginx 缓冲
     response.headers['Content-Type'] = 'text/event-stream'
@@ -389,69 +540,17 @@ def postVideo():
     # 获取JSON数据
     data = request.get_json()
 
-    # 从JSON数据中提取fileList和accountList
-    file_list = data.get('fileList', [])
-    account_list = data.get('accountList', [])
-    type = data.get('type')
-    title = data.get('title')
-    tags = data.get('tags')
-    category = data.get('category')
-    enableTimer = data.get('enableTimer')
-    if category == 0:
-        category = None
-    productLink = data.get('productLink', '')
-    productTitle = data.get('productTitle', '')
-    thumbnail_path = data.get('thumbnail', '')
-    is_draft = data.get('isDraft', False)  # 新增参数：是否保存为草稿
-
-    videos_per_day = data.get('videosPerDay')
-    daily_times = data.get('dailyTimes')
-    start_days = data.get('startDays')
     # 打印获取到的数据（仅作为示例）
-    print("File List:", file_list)
-    print("Account List:", account_list)
-    match type:
-        case 1:
-            post_video_xhs(title, file_list, tags, account_list, category, enableTimer, videos_per_day, daily_times,
-                               start_days)
-        case 2:
-            post_video_tencent(title, file_list, tags, account_list, category, enableTimer, videos_per_day, daily_times,
-                               start_days, is_draft)
-        case 3:
-            post_video_DouYin(title, file_list, tags, account_list, category, enableTimer, videos_per_day, daily_times,
-                      start_days, thumbnail_path, productLink, productTitle)
-        case 4:
-            post_video_ks(title, file_list, tags, account_list, category, enableTimer, videos_per_day, daily_times,
-                      start_days)
-        case 5:
-            post_video_tiktok(
-                file_list=file_list,
-                account_file=account_list[0],  # TikTok 一般单账号
-                title=title,
-                tags=tags,
-                enableTimer=enableTimer,
-                videos_per_day=videos_per_day,
-                daily_times=daily_times,
-                start_days=start_days,
-                thumbnail_path=thumbnail_path
-            )
-        case 6:
-            asyncio.run(post_video_youtobe(
-                file_list=file_list,
-                title=title,
-                tags=tags,
-                enableTimer=enableTimer,
-                videos_per_day=videos_per_day,
-                daily_times=daily_times,
-                start_days=start_days,
-                thumbnail_path=thumbnail_path
-            ))
+    print("File List:", data.get('fileList', []))
+    print("Account List:", data.get('accountList', []))
+    # 写入发布任务表，由后台 worker 执行，接口立即返回任务 ID
+    job_id = enqueue_publish_job(data)
     # 返回响应给客户端
     return jsonify(
         {
             "code": 200,
             "msg": None,
-            "data": None
+            "data": {"jobId": job_id}
         }), 200
 
 
@@ -466,9 +565,8 @@ def updateUserinfo():
     userName = data.get('userName')
     try:
         # 获取数据库连接
-        with sqlite3.connect(Path(BASE_DIR / "db" / "database.db")) as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
+        with get_connection() as conn:
+            cursor = row_cursor(conn)
 
             # 更新数据库记录
             cursor.execute('''
@@ -498,45 +596,70 @@ def postVideoBatch():
 
     if not isinstance(data_list, list):
         return jsonify({"error": "Expected a JSON array"}), 400
+    job_ids = []
     for data in data_list:
-        # 从JSON数据中提取fileList和accountList
-        file_list = data.get('fileList', [])
-        account_list = data.get('accountList', [])
-        type = data.get('type')
-        title = data.get('title')
-        tags = data.get('tags')
-        category = data.get('category')
-        enableTimer = data.get('enableTimer')
-        if category == 0:
-            category = None
-        productLink = data.get('productLink', '')
-        productTitle = data.get('productTitle', '')
-
-        videos_per_day = data.get('videosPerDay')
-        daily_times = data.get('dailyTimes')
-        start_days = data.get('startDays')
         # 打印获取到的数据（仅作为示例）
-        print("File List:", file_list)
-        print("Account List:", account_list)
-        match type:
-            case 1:
-                return
-            case 2:
-                post_video_tencent(title, file_list, tags, account_list, category, enableTimer, videos_per_day, daily_times,
-                                   start_days)
-            case 3:
-                post_video_DouYin(title, file_list, tags, account_list, category, enableTimer, videos_per_day, daily_times,
-                          start_days, productLink, productTitle)
-            case 4:
-                post_video_ks(title, file_list, tags, account_list, category, enableTimer, videos_per_day, daily_times,
-                          start_days)
+        print("File List:", data.get('fileList', []))
+        print("Account List:", data.get('accountList', []))
+        job_ids.append(enqueue_publish_job(data))
     # 返回响应给客户端
     return jsonify(
         {
             "code": 200,
             "msg": None,
+            "data": {"jobIds": job_ids}
+        }), 200
+
+
+# 发布任务状态查询，ids 为逗号分隔的任务 ID，不传则返回最近的任务
+@app.route('/getPublishJobs', methods=['GET'])
+def getPublishJobs():
+    ids = request.args.get('ids', '')
+    job_ids = [int(i) for i in ids.split(',') if i.strip().isdigit()]
+    try:
+        jobs = get_publish_jobs(job_ids)
+        summary = {}
+        for job in jobs:
+            summary[job['status']] = summary.get(job['status'], 0) + 1
+        return jsonify({
+            "code": 200,
+            "msg": None,
+            "data": {
+                "total": len(jobs),
+                "summary": summary,
+                "jobs": jobs
+            }
+        }), 200
+    except Exception as e:
+        return jsonify({
+            "code": 500,
+            "msg": f"获取发布任务失败: {str(e)}",
             "data": None
+        }), 500
+
+# Prometheus 指标（文本格式）
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+# 上传/登录各步骤耗时统计，hours 为统计的时间范围（默认最近 7 天），platform 可选
+@app.route('/getStepMetrics', methods=['GET'])
+def getStepMetrics():
+    hours = request.args.get('hours', '168')
+    platform = request.args.get('platform')
+    try:
+        steps = get_step_metrics(float(hours), platform)
+        return jsonify({
+            "code": 200,
+            "msg": None,
+            "data": steps
         }), 200
+    except Exception as e:
+        return jsonify({
+            "code": 500,
+            "msg": f"获取耗时统计失败: {str(e)}",
+            "data": None
+        }), 500
 
 # Cookie文件上传API
 @app.route('/uploadCookie', methods=['POST'])
@@ -576,9 +699,8 @@ def upload_cookie():
             }), 400
 
         # 从数据库获取账号的文件路径
-        with sqlite3.connect(Path(BASE_DIR / "db" / "database.db")) as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
+        with get_connection() as conn:
+            cursor = row_cursor(conn)
             cursor.execute('SELECT filePath FROM user_info WHERE id = ?', (account_id,))
             result = cursor.fetchone()
 
@@ -659,45 +781,59 @@ def download_cookie():
         }), 500
 
 
-# 包装函数：在线程中运行异步函数
+# 各平台的扫码登录协程，key 为 /login 的 type
+LOGIN_COROUTINES = {
+    '1': xiaohongshu_cookie_gen,
+    '2': get_tencent_cookie,
+    '3': douyin_cookie_gen,
+    '4': get_ks_cookie,
+    '5': get_titok_cookie,
+}
+
+
+# 包装函数：在后台事件循环中运行登录协程，返回 concurrent.futures.Future；不支持的平台直接返回 500
 def run_async_function(type,id,status_queue):
-    match type:
-        case '1':
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            loop.run_until_complete(xiaohongshu_cookie_gen(id, status_queue))
-            loop.close()
-        case '2':
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            loop.run_until_complete(get_tencent_cookie(id,status_queue))
-            loop.close()
-        case '3':
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            loop.run_until_complete(douyin_cookie_gen(id,status_queue))
-            loop.close()
-        case '4':
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            loop.run_until_complete(get_ks_cookie(id,status_queue))
-            loop.close()
-        case '5':
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            loop.run_until_complete(get_titok_cookie(id, status_queue))
-            loop.close()
+    login_coroutine = LOGIN_COROUTINES.get(type)
+    if login_coroutine is None:
+        status_queue.put("500")
+        return None
+    return spawn(login_coroutine(id, status_queue), f"login type={type} id={id}")
 
 
 # SSE 流生成器函数
-def sse_stream(status_queue):
-    while True:
-        if not status_queue.empty():
-            msg = status_queue.get()
+def sse_stream(status_queue, on_close=None, worker=None):
+    """
+    阻塞等待队列消息并推送，收到 200/500 后结束；
+    空闲时定期发送注释行心跳，客户端断开时写入失败、生成器被关闭，随即清理队列。
+    worker 为执行登录协程的 Future，协程已结束且没有剩余消息时也结束。
+    """
+    SSE_CONNECTIONS.inc()
+    try:
+        while True:
+            try:
+                msg = status_queue.get(timeout=SSE_HEARTBEAT_SECONDS)
+            except Empty:
+                if worker is not None and worker.done() and status_queue.empty():
+                    break
+                yield ": heartbeat\n\n"
+                continue
             yield f"data: {msg}\n\n"
-        else:
-            # 避免 CPU 占满
-            time.sleep(0.1)
+            if str(msg) in SSE_TERMINAL_MESSAGES:
+                break
+    finally:
+        # 正常结束或客户端断开后生成器被关闭
+        SSE_CONNECTIONS.dec()
+        if on_close is not None:
+            on_close()
+
+def start_services():
+    """数据库迁移 + 后台事件循环上的发布 worker、cookie 刷新和 blob 清理，开发服务器和 wsgi.py 共用"""
+    ensure_schema()
+    start_publish_workers()
+    start_cookie_refresher()
+    start_blob_sweeper()
+
 
 if __name__ == '__main__':
+    start_services()
     app.run(host='0.0.0.0' ,port=5409)
@@ -7,9 +7,9 @@ export const accountApi = {
     return http.get('/getValidAccounts')
   },
 
-  // 获取账号列表（不带验证，快速加载）
-  getAccounts() {
-    return http.get('/getAccounts')
+  // 获取账号列表（不带验证，快速加载），params 可选：{ limit, cursor, order, platform, status }
+  getAccounts(params) {
+    return http.get('/getAccounts', params)
   },
 
   // 添加账号
@@ -2,9 +2,9 @@ import { http } from '@/utils/request'
 
 // 素材管理API
 export const materialApi = {
-  // 获取所有素材
-  getAllMaterials: () => {
-    return http.get('/getFiles')
+  // 获取素材，params 可选：{ limit, cursor, sort, order, since, until, container }，传 limit 时分页（响应带 nextCursor）
+  getAllMaterials: (params) => {
+    return http.get('/getFiles', params)
   },
   
   // 上传素材
@@ -8,8 +8,9 @@ import time
 import asyncio
 
 from conf import LOCAL_CHROME_PATH, LOCAL_CHROME_HEADLESS
-from utils.base_social_media import set_init_script
+from utils.base_social_media import set_init_script, set_resource_blocking, SOCIAL_MEDIA_BAIJIAHAO, wait_for_upload, UPLOAD_DONE
 from utils.log import baijiahao_logger
+from utils.timing import StepTimer, finish_timer_on_error
 from utils.network import async_retry
 
 
@@ -63,7 +64,7 @@ async def baijiahao_setup(account_file, handle=False):
     return True
 
 class BaiJiaHaoVideo(object):
-    def __init__(self, title, file_path, tags, publish_date: datetime, account_file, proxy_setting=None):
+    def __init__(self, title, file_path, tags, publish_date: datetime, account_file, proxy_setting=None, context=None):
         self.title = title  # 视频标题
         self.file_path = file_path
         self.tags = tags
@@ -73,6 +74,7 @@ class BaiJiaHaoVideo(object):
         self.local_executable_path = LOCAL_CHROME_PATH
         self.headless = LOCAL_CHROME_HEADLESS
         self.proxy_setting = proxy_setting
+        self.context = context  # 浏览器池分配的上下文，为空时自行启动浏览器
 
     async def set_schedule_time(self, page, publish_date):
         """
@@ -118,14 +120,23 @@ class BaiJiaHaoVideo(object):
         return
         print("视频出错了，重新上传中")
 
-    async def upload(self, playwright: Playwright) -> None:
-        # 使用 Chromium 浏览器启动一个浏览器实例
-        browser = await playwright.chromium.launch(headless=self.headless, executable_path=self.local_executable_path, proxy=self.proxy_setting)
-        # 创建一个浏览器上下文，使用指定的 cookie 文件
-        context = await browser.new_context(storage_state=f"{self.account_file}", user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/127.0.4324.150 Safari/537.36')
+    @finish_timer_on_error
+    async def upload(self, playwright: Playwright = None) -> None:
+        browser = None
+        if self.context:
+            # 池分配的上下文，代理和 UA 需在 pool.new_context(proxy=..., user_agent=...) 时传入
+            context = self.context
+        else:
+            # 使用 Chromium 浏览器启动一个浏览器实例
+            browser = await playwright.chromium.launch(headless=self.headless, executable_path=self.local_executable_path, proxy=self.proxy_setting)
+            # 创建一个浏览器上下文，使用指定的 cookie 文件
+            context = await browser.new_context(storage_state=f"{self.account_file}", user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/127.0.4324.150 Safari/537.36')
         # context = await set_init_script(context)
+        context = await set_resource_blocking(context, SOCIAL_MEDIA_BAIJIAHAO)
         await context.grant_permissions(['geolocation'])
 
+        self.timer = StepTimer(SOCIAL_MEDIA_BAIJIAHAO, self.account_file)
+        self.timer.step("goto")
         # 创建一个新的页面
         page = await context.new_page()
         # 访问指定的 URL
@@ -135,6 +146,7 @@ class BaiJiaHaoVideo(object):
         baijiahao_logger.info('正在打开主页...')
         await page.wait_for_url("https://baijiahao.baidu.com/builder/rc/edit?type=videoV2", timeout=60000)
 
+        self.timer.step("set_input_files")
         # 点击 "上传视频" 按钮
         await page.locator("div[class^='video-main-container'] input").set_input_files(self.file_path)
 
@@ -148,17 +160,20 @@ class BaiJiaHaoVideo(object):
                 baijiahao_logger.info("正在等待进入视频发布页面...")
                 await asyncio.sleep(0.1)
 
+        self.timer.step("fill_title_tags")
         # 填充标题和话题
         # 这里为了避免页面变化，故使用相对位置定位：作品标题父级右侧第一个元素的input子元素
         await asyncio.sleep(1)
         baijiahao_logger.info("正在填充标题和话题...")
         await self.add_title_tags(page)
 
+        self.timer.step("wait_upload")
         upload_status = await self.uploading_video(page)
         if not upload_status:
             baijiahao_logger.error(f"发现上传出错了... 文件:{self.file_path}")
             raise
 
+        self.timer.step("wait_cover")
         # 判断视频封面图是否生成成功
         while True:
             baijiahao_logger.info("正在确认封面完成, 准备去点击定时/发布...")
@@ -169,6 +184,7 @@ class BaiJiaHaoVideo(object):
                 baijiahao_logger.info("等待封面生成...")
                 await asyncio.sleep(3)
 
+        self.timer.step("click_publish")
         await self.publish_video(page, self.publish_date)
         await page.wait_for_timeout(2000)
         if await page.locator('div.passMod_dialog-container >> text=百度安全验证:visible').count():
@@ -177,33 +193,33 @@ class BaiJiaHaoVideo(object):
         await page.wait_for_url("https://baijiahao.baidu.com/builder/rc/clue**", timeout=5000)
         baijiahao_logger.success("视频发布成功")
 
+        self.timer.step("save_cookie")
         await context.storage_state(path=self.account_file)  # 保存cookie
         baijiahao_logger.info('cookie更新完毕！')
+        self.timer.finish()
         await asyncio.sleep(2)  # 这里延迟是为了方便眼睛直观的观看
-        # 关闭浏览器上下文和浏览器实例
-        await context.close()
-        await browser.close()
+        # 关闭浏览器上下文和浏览器实例（池分配的上下文由浏览器池负责关闭）
+        if browser:
+            await context.close()
+            await browser.close()
 
 
     @async_retry(timeout=300)  # 例如，最多重试3次，超时时间为180秒
     async def uploading_video(self, page):
-        while True:
-            upload_failed = await page.locator('div .cover-overlay:has-text("上传失败")').count()
-            if upload_failed:
-                baijiahao_logger.error("发现上传出错了...")
-                # await self.handle_upload_error(page)  # 假设这是处理上传错误的函数
-                return False
-
-            uploading = await page.locator('div .cover-overlay:has-text("上传中")').count()
-            if uploading:
-                baijiahao_logger.info("正在上传视频中...")
-                await asyncio.sleep(2)  # 等待2秒再次检查
-                continue
-
-            # 检查上传是否成功
-            if not uploading and not upload_failed:
-                baijiahao_logger.success("视频上传完毕")
-                return True
+        baijiahao_logger.info("正在上传视频中...")
+        # “上传中”消失代表上传结束，出现“上传失败”代表出错
+        status = await wait_for_upload(
+            page,
+            done=page.locator('div .cover-overlay:has-text("上传中")'),
+            error=page.locator('div .cover-overlay:has-text("上传失败")'),
+            done_state="detached",
+        )
+        if status != UPLOAD_DONE or await page.locator('div .cover-overlay:has-text("上传失败")').count():
+            baijiahao_logger.error("发现上传出错了...")
+            # await self.handle_upload_error(page)  # 假设这是处理上传错误的函数
+            return False
+        baijiahao_logger.success("视频上传完毕")
+        return True
 
     async def set_schedule_publish(self, page, publish_date):
         while True:
@@ -245,6 +261,9 @@ class BaiJiaHaoVideo(object):
         await title_container.fill(self.title[:30])
 
     async def main(self):
+        if self.context:
+            await self.upload()
+            return
         async with async_playwright() as playwright:
             await self.upload(playwright)
 
@@ -6,8 +6,10 @@ import os
 import asyncio
 
 from conf import LOCAL_CHROME_PATH, LOCAL_CHROME_HEADLESS
-from utils.base_social_media import set_init_script
+from utils.base_social_media import set_init_script, set_resource_blocking, SOCIAL_MEDIA_DOUYIN, wait_for_upload, UPLOAD_DONE, \
+    UPLOAD_RESPONSE_URL, upload_retry_backoff
 from utils.log import douyin_logger
+from utils.timing import StepTimer, finish_timer_on_error
 
 
 async def cookie_auth(account_file):
@@ -64,7 +66,7 @@ async def douyin_cookie_gen(account_file):
 
 
 class DouYinVideo(object):
-    def __init__(self, title, file_path, tags, publish_date: datetime, account_file, thumbnail_path=None, productLink='', productTitle=''):
+    def __init__(self, title, file_path, tags, publish_date: datetime, account_file, thumbnail_path=None, productLink='', productTitle='', context=None):
         self.title = title  # 视频标题
         self.file_path = file_path
         self.tags = tags
@@ -76,6 +78,7 @@ class DouYinVideo(object):
         self.thumbnail_path = thumbnail_path
         self.productLink = productLink
         self.productTitle = productTitle
+        self.context = context  # 浏览器池分配的上下文，为空时自行启动浏览器
 
     async def set_schedule_time_douyin(self, page, publish_date):
         # 选择包含特定文本内容的 label 元素
@@ -97,17 +100,25 @@ class DouYinVideo(object):
         douyin_logger.info('视频出错了，重新上传中')
         await page.locator('div.progress-div [class^="upload-btn-input"]').set_input_files(self.file_path)
 
-    async def upload(self, playwright: Playwright) -> None:
-        # 使用 Chromium 浏览器启动一个浏览器实例
-        if self.local_executable_path:
-            browser = await playwright.chromium.launch(headless=self.headless, executable_path=self.local_executable_path)
+    @finish_timer_on_error
+    async def upload(self, playwright: Playwright = None) -> None:
+        browser = None
+        if self.context:
+            context = self.context
         else:
-            browser = await playwright.chromium.launch(headless=self.headless)
-        # 创建一个浏览器上下文，使用指定的 cookie 文件
-        context = await browser.new_context(storage_state=f"{self.account_file}")
+            # 使用 Chromium 浏览器启动一个浏览器实例
+            if self.local_executable_path:
+                browser = await playwright.chromium.launch(headless=self.headless, executable_path=self.local_executable_path)
+            else:
+                browser = await playwright.chromium.launch(headless=self.headless)
+            # 创建一个浏览器上下文，使用指定的 cookie 文件
+            context = await browser.new_context(storage_state=f"{self.account_file}")
         context = await set_init_script(context)
+        context = await set_resource_blocking(context, SOCIAL_MEDIA_DOUYIN)
 
         # 创建一个新的页面
+        self.timer = StepTimer(SOCIAL_MEDIA_DOUYIN, self.account_file)
+        self.timer.step("goto")
         page = await context.new_page()
         # 访问指定的 URL
         await page.goto("https://creator.douyin.com/creator-micro/content/upload")
@@ -116,8 +127,10 @@ class DouYinVideo(object):
         douyin_logger.info(f'[-] 正在打开主页...')
         await page.wait_for_url("https://creator.douyin.com/creator-micro/content/upload")
         # 点击 "上传视频" 按钮
+        self.timer.step("set_input_files")
         await page.locator("div[class^='container'] input").set_input_files(self.file_path)
 
+        self.timer.step("enter_publish_page")
         # 等待页面跳转到指定的 URL 2025.01.08修改在原有基础上兼容两种页面
         while True:
             try:
@@ -138,6 +151,7 @@ class DouYinVideo(object):
                 except:
                     print("  [-] 超时未进入视频发布页面，重新尝试...")
                     await asyncio.sleep(0.5)  # 等待 0.5 秒后重新尝试
+        self.timer.step("fill_title_tags")
         # 填充标题和话题
         # 检查是否存在包含输入框的元素
         # 这里为了避免页面变化，故使用相对位置定位：作品标题父级右侧第一个元素的input子元素
@@ -159,33 +173,36 @@ class DouYinVideo(object):
             await page.type(css_selector, "#" + tag)
             await page.press(css_selector, "Space")
         douyin_logger.info(f'总共添加{len(self.tags)}个话题')
+        self.timer.step("wait_upload")
+        douyin_logger.info("  [-] 正在上传视频中...")
+        attempt = 0
         while True:
-            # 判断重新上传按钮是否存在，如果不存在，代表视频正在上传，则等待
-            try:
-                #  新版：定位重新上传
-                number = await page.locator('[class^="long-card"] div:has-text("重新上传")').count()
-                if number > 0:
-                    douyin_logger.success("  [-]视频上传完毕")
-                    break
-                else:
-                    douyin_logger.info("  [-] 正在上传视频中...")
-                    await asyncio.sleep(2)
-
-                    if await page.locator('div.progress-div > div:has-text("上传失败")').count():
-                        douyin_logger.error("  [-] 发现上传出错了... 准备重试")
-                        await self.handle_upload_error(page)
-            except:
-                douyin_logger.info("  [-] 正在上传视频中...")
-                await asyncio.sleep(2)
+            # 出现重新上传按钮代表视频上传完毕
+            status = await wait_for_upload(
+                page,
+                done=page.locator('[class^="long-card"] div:has-text("重新上传")'),
+                error=page.locator('div.progress-div > div:has-text("上传失败")'),
+                response_url=UPLOAD_RESPONSE_URL,
+            )
+            if status == UPLOAD_DONE:
+                douyin_logger.success("  [-]视频上传完毕")
+                break
+            attempt += 1
+            douyin_logger.error(f"  [-] 发现上传出错了... 准备第{attempt}次重试")
+            await upload_retry_backoff(attempt)
+            await self.handle_upload_error(page)
 
+        self.timer.step("set_product_link")
         if self.productLink and self.productTitle:
             douyin_logger.info(f'  [-] 正在设置商品链接...')
             await self.set_product_link(page, self.productLink, self.productTitle)
             douyin_logger.info(f'  [+] 完成设置商品链接...')
         
+        self.timer.step("set_thumbnail")
         #上传视频封面
         await self.set_thumbnail(page, self.thumbnail_path)
 
+        self.timer.step("set_location")
         # 更换可见元素
         await self.set_location(page, "")
 
@@ -198,9 +215,11 @@ class DouYinVideo(object):
             if 'semi-switch-checked' not in await page.eval_on_selector(third_part_element, 'div => div.className'):
                 await page.locator(third_part_element).locator('input.semi-switch-native-control').click()
 
+        self.timer.step("set_schedule_time")
         if self.publish_date != 0:
             await self.set_schedule_time_douyin(page, self.publish_date)
 
+        self.timer.step("click_publish")
         # 判断视频是否发布成功
         while True:
             # 判断视频是否发布成功
@@ -219,12 +238,15 @@ class DouYinVideo(object):
                 await page.screenshot(full_page=True)
                 await asyncio.sleep(0.5)
 
+        self.timer.step("save_cookie")
         await context.storage_state(path=self.account_file)  # 保存cookie
         douyin_logger.success('  [-]cookie更新完毕！')
+        self.timer.finish()
         await asyncio.sleep(2)  # 这里延迟是为了方便眼睛直观的观看
-        # 关闭浏览器上下文和浏览器实例
-        await context.close()
-        await browser.close()
+        # 关闭浏览器上下文和浏览器实例（池分配的上下文由浏览器池负责关闭）
+        if browser:
+            await context.close()
+            await browser.close()
 
     async def handle_auto_video_cover(self, page):
         """
@@ -388,6 +410,9 @@ class DouYinVideo(object):
             return False
 
     async def main(self):
+        if self.context:
+            await self.upload()
+            return
         async with async_playwright() as playwright:
             await self.upload(playwright)
 
@@ -6,9 +6,10 @@ import os
 import asyncio
 
 from conf import LOCAL_CHROME_PATH, LOCAL_CHROME_HEADLESS
-from utils.base_social_media import set_init_script
+from utils.base_social_media import set_init_script, set_resource_blocking, SOCIAL_MEDIA_KUAISHOU, wait_for_upload
 from utils.files_times import get_absolute_path
 from utils.log import kuaishou_logger
+from utils.timing import StepTimer, finish_timer_on_error
 
 
 async def cookie_auth(account_file):
@@ -62,7 +63,7 @@ async def get_ks_cookie(account_file):
 
 
 class KSVideo(object):
-    def __init__(self, title, file_path, tags, publish_date: datetime, account_file):
+    def __init__(self, title, file_path, tags, publish_date: datetime, account_file, context=None):
         self.title = title  # 视频标题
         self.file_path = file_path
         self.tags = tags
@@ -71,26 +72,35 @@ class KSVideo(object):
         self.date_format = '%Y-%m-%d %H:%M'
         self.local_executable_path = LOCAL_CHROME_PATH
         self.headless = LOCAL_CHROME_HEADLESS
+        self.context = context  # 浏览器池分配的上下文，为空时自行启动浏览器
 
     async def handle_upload_error(self, page):
         kuaishou_logger.error("视频出错了，重新上传中")
         await page.locator('div.progress-div [class^="upload-btn-input"]').set_input_files(self.file_path)
 
-    async def upload(self, playwright: Playwright) -> None:
-        # 使用 Chromium 浏览器启动一个浏览器实例
-        print(self.local_executable_path)
-        if self.local_executable_path:
-            browser = await playwright.chromium.launch(
-                headless=self.headless,
-                executable_path=self.local_executable_path,
-            )
+    @finish_timer_on_error
+    async def upload(self, playwright: Playwright = None) -> None:
+        browser = None
+        if self.context:
+            context = self.context
         else:
-            browser = await playwright.chromium.launch(
-                headless=self.headless
-            )  # 创建一个浏览器上下文，使用指定的 cookie 文件
-        context = await browser.new_context(storage_state=f"{self.account_file}")
+            # 使用 Chromium 浏览器启动一个浏览器实例
+            print(self.local_executable_path)
+            if self.local_executable_path:
+                browser = await playwright.chromium.launch(
+                    headless=self.headless,
+                    executable_path=self.local_executable_path,
+                )
+            else:
+                browser = await playwright.chromium.launch(
+                    headless=self.headless
+                )  # 创建一个浏览器上下文，使用指定的 cookie 文件
+            context = await browser.new_context(storage_state=f"{self.account_file}")
         context = await set_init_script(context)
+        context = await set_resource_blocking(context, SOCIAL_MEDIA_KUAISHOU)
         # 创建一个新的页面
+        self.timer = StepTimer(SOCIAL_MEDIA_KUAISHOU, self.account_file)
+        self.timer.step("goto")
         page = await context.new_page()
         # 访问指定的 URL
         await page.goto("https://cp.kuaishou.com/article/publish/video")
@@ -98,6 +108,7 @@ class KSVideo(object):
         # 等待页面跳转到指定的 URL，没进入，则自动等待到超时
         kuaishou_logger.info('正在打开主页...')
         await page.wait_for_url("https://cp.kuaishou.com/article/publish/video")
+        self.timer.step("set_input_files")
         # 点击 "上传视频" 按钮
         upload_button = page.locator("button[class^='_upload-btn']")
         await upload_button.wait_for(state='visible')  # 确保按钮可见
@@ -119,6 +130,7 @@ class KSVideo(object):
         if await new_feature_button.count() > 0:
             await new_feature_button.click()
 
+        self.timer.step("fill_title_tags")
         kuaishou_logger.info("正在填充标题和话题...")
         await page.get_by_text("描述").locator("xpath=following-sibling::div").click()
         kuaishou_logger.info("clear existing title")
@@ -135,33 +147,21 @@ class KSVideo(object):
             await page.keyboard.type(f"#{tag} ")
             await asyncio.sleep(2)
 
-        max_retries = 60  # 设置最大重试次数,最大等待时间为 2 分钟
-        retry_count = 0
-
-        while retry_count < max_retries:
-            try:
-                # 获取包含 '上传中' 文本的元素数量
-                number = await page.locator("text=上传中").count()
-
-                if number == 0:
-                    kuaishou_logger.success("视频上传完毕")
-                    break
-                else:
-                    if retry_count % 5 == 0:
-                        kuaishou_logger.info("正在上传视频中...")
-                    await asyncio.sleep(2)
-            except Exception as e:
-                kuaishou_logger.error(f"检查上传状态时发生错误: {e}")
-                await asyncio.sleep(2)  # 等待 2 秒后重试
-            retry_count += 1
-
-        if retry_count == max_retries:
-            kuaishou_logger.warning("超过最大重试次数，视频上传可能未完成。")
+        self.timer.step("wait_upload")
+        # “上传中”消失代表上传完毕，最多等待 2 分钟
+        kuaishou_logger.info("正在上传视频中...")
+        try:
+            await wait_for_upload(page, done=page.locator("text=上传中"), done_state="detached", timeout=120)
+            kuaishou_logger.success("视频上传完毕")
+        except Exception as e:
+            kuaishou_logger.warning(f"等待上传完成失败，视频上传可能未完成: {e}")
 
         # 定时任务
+        self.timer.step("set_schedule_time")
         if self.publish_date != 0:
             await self.set_schedule_time(page, self.publish_date)
 
+        self.timer.step("click_publish")
         # 判断视频是否发布成功
         while True:
             try:
@@ -186,14 +186,20 @@ class KSVideo(object):
                 await page.screenshot(full_page=True)
                 await asyncio.sleep(1)
 
+        self.timer.step("save_cookie")
         await context.storage_state(path=self.account_file)  # 保存cookie
         kuaishou_logger.info('cookie更新完毕！')
+        self.timer.finish()
         await asyncio.sleep(2)  # 这里延迟是为了方便眼睛直观的观看
-        # 关闭浏览器上下文和浏览器实例
-        await context.close()
-        await browser.close()
+        # 关闭浏览器上下文和浏览器实例（池分配的上下文由浏览器池负责关闭）
+        if browser:
+            await context.close()
+            await browser.close()
 
     async def main(self):
+        if self.context:
+            await self.upload()
+            return
         async with async_playwright() as playwright:
             await self.upload(playwright)
 
@@ -6,9 +6,11 @@ import os
 import asyncio
 
 from conf import LOCAL_CHROME_PATH, LOCAL_CHROME_HEADLESS
-from utils.base_social_media import set_init_script
+from utils.base_social_media import set_init_script, set_resource_blocking, SOCIAL_MEDIA_TENCENT, wait_for_upload, UPLOAD_DONE, \
+    upload_retry_backoff
 from utils.files_times import get_absolute_path
 from utils.log import tencent_logger
+from utils.timing import StepTimer, finish_timer_on_error
 
 
 def format_str_for_short_title(origin_title: str) -> str:
@@ -82,7 +84,7 @@ async def weixin_setup(account_file, handle=False):
 
 
 class TencentVideo(object):
-    def __init__(self, title, file_path, tags, publish_date: datetime, account_file, category=None, is_draft=False):
+    def __init__(self, title, file_path, tags, publish_date: datetime, account_file, category=None, is_draft=False, context=None):
         self.title = title  # 视频标题
         self.file_path = file_path
         self.tags = tags
@@ -92,6 +94,7 @@ class TencentVideo(object):
         self.headless = LOCAL_CHROME_HEADLESS
         self.is_draft = is_draft  # 是否保存为草稿
         self.local_executable_path = LOCAL_CHROME_PATH or None
+        self.context = context  # 浏览器池分配的上下文，为空时自行启动浏览器
 
     async def set_schedule_time_tencent(self, page, publish_date):
         label_element = page.locator("label").filter(has_text="定时").nth(1)
@@ -135,14 +138,22 @@ class TencentVideo(object):
         file_input = page.locator('input[type="file"]')
         await file_input.set_input_files(self.file_path)
 
-    async def upload(self, playwright: Playwright) -> None:
-        # 使用 Chromium (这里使用系统内浏览器，用chromium 会造成h264错误
-        browser = await playwright.chromium.launch(headless=self.headless, executable_path=self.local_executable_path)
-        # 创建一个浏览器上下文，使用指定的 cookie 文件
-        context = await browser.new_context(storage_state=f"{self.account_file}")
+    @finish_timer_on_error
+    async def upload(self, playwright: Playwright = None) -> None:
+        browser = None
+        if self.context:
+            context = self.context
+        else:
+            # 使用 Chromium (这里使用系统内浏览器，用chromium 会造成h264错误
+            browser = await playwright.chromium.launch(headless=self.headless, executable_path=self.local_executable_path)
+            # 创建一个浏览器上下文，使用指定的 cookie 文件
+            context = await browser.new_context(storage_state=f"{self.account_file}")
         context = await set_init_script(context)
+        context = await set_resource_blocking(context, SOCIAL_MEDIA_TENCENT)
 
         # 创建一个新的页面
+        self.timer = StepTimer(SOCIAL_MEDIA_TENCENT, self.account_file)
+        self.timer.step("goto")
         page = await context.new_page()
         # 访问指定的 URL
         await page.goto("https://channels.weixin.qq.com/platform/post/create")
@@ -150,8 +161,10 @@ class TencentVideo(object):
         # 等待页面跳转到指定的 URL，没进入，则自动等待到超时
         await page.wait_for_url("https://channels.weixin.qq.com/platform/post/create")
         # await page.wait_for_selector('input[type="file"]', timeout=10000)
+        self.timer.step("set_input_files")
         file_input = page.locator('input[type="file"]')
         await file_input.set_input_files(self.file_path)
+        self.timer.step("fill_title_tags")
         # 填充标题和话题
         await self.add_title_tags(page)
         # 添加商品
@@ -160,21 +173,28 @@ class TencentVideo(object):
         await self.add_collection(page)
         # 原创选择
         await self.add_original(page)
+        self.timer.step("wait_upload")
         # 检测上传状态
         await self.detect_upload_status(page)
+        self.timer.step("set_schedule_time")
         if self.publish_date != 0:
             await self.set_schedule_time_tencent(page, self.publish_date)
+        self.timer.step("add_short_title")
         # 添加短标题
         await self.add_short_title(page)
 
+        self.timer.step("click_publish")
         await self.click_publish(page)
 
+        self.timer.step("save_cookie")
         await context.storage_state(path=f"{self.account_file}")  # 保存cookie
         tencent_logger.success('  [-]cookie更新完毕！')
+        self.timer.finish()
         await asyncio.sleep(2)  # 这里延迟是为了方便眼睛直观的观看
-        # 关闭浏览器上下文和浏览器实例
-        await context.close()
-        await browser.close()
+        # 关闭浏览器上下文和浏览器实例（池分配的上下文由浏览器池负责关闭）
+        if browser:
+            await context.close()
+            await browser.close()
 
     async def add_short_title(self, page):
         short_title_element = page.get_by_text("短标题", exact=True).locator("..").locator(
@@ -220,25 +240,25 @@ class TencentVideo(object):
                 await asyncio.sleep(0.5)
 
     async def detect_upload_status(self, page):
+        tencent_logger.info("  [-] 正在上传视频中...")
+        attempt = 0
         while True:
-            # 匹配删除按钮，代表视频上传完毕，如果不存在，代表视频正在上传，则等待
-            try:
-                # 匹配删除按钮，代表视频上传完毕
-                if "weui-desktop-btn_disabled" not in await page.get_by_role("button", name="发表").get_attribute(
-                        'class'):
-                    tencent_logger.info("  [-]视频上传完毕")
-                    break
-                else:
-                    tencent_logger.info("  [-] 正在上传视频中...")
-                    await asyncio.sleep(2)
-                    # 出错了视频出错
-                    if await page.locator('div.status-msg.error').count() and await page.locator(
-                            'div.media-status-content div.tag-inner:has-text("删除")').count():
-                        tencent_logger.error("  [-] 发现上传出错了...准备重试")
-                        await self.handle_upload_error(page)
-            except:
-                tencent_logger.info("  [-] 正在上传视频中...")
-                await asyncio.sleep(2)
+            # 发表按钮可点击，代表视频上传完毕
+            status = await wait_for_upload(
+                page,
+                done=page.get_by_role("button", name="发表").and_(
+                    page.locator("button:not(.weui-desktop-btn_disabled)")),
+                error=page.locator('div.status-msg.error'),
+            )
+            if status == UPLOAD_DONE:
+                tencent_logger.info("  [-]视频上传完毕")
+                break
+            # 错误一直可见时也计入重试次数，不会无限循环
+            attempt += 1
+            await upload_retry_backoff(attempt)
+            if await page.locator('div.media-status-content div.tag-inner:has-text("删除")').count():
+                tencent_logger.error(f"  [-] 发现上传出错了...准备第{attempt}次重试")
+                await self.handle_upload_error(page)
 
     async def add_title_tags(self, page):
         await page.locator("div.input-editor").click()
@@ -281,5 +301,8 @@ class TencentVideo(object):
                 await page.locator('button:has-text("声明原创"):visible').click()
 
     async def main(self):
+        if self.context:
+            await self.upload()
+            return
         async with async_playwright() as playwright:
             await self.upload(playwright)
@@ -8,9 +8,11 @@ import asyncio
 
 from conf import LOCAL_CHROME_PATH, LOCAL_CHROME_HEADLESS
 from uploader.tk_uploader.tk_config import Tk_Locator
-from utils.base_social_media import set_init_script
+from utils.base_social_media import set_init_script, set_resource_blocking, SOCIAL_MEDIA_TIKTOK, wait_for_upload, UPLOAD_DONE, \
+    UPLOAD_RESPONSE_URL, upload_retry_backoff
 from utils.files_times import get_absolute_path
 from utils.log import tiktok_logger
+from utils.timing import StepTimer, finish_timer_on_error
 
 
 async def cookie_auth(account_file):
@@ -71,7 +73,7 @@ async def get_tiktok_cookie(account_file):
 
 
 class TiktokVideo(object):
-    def __init__(self, title, file_path, tags, publish_date, account_file, thumbnail_path=None):
+    def __init__(self, title, file_path, tags, publish_date, account_file, thumbnail_path=None, context=None):
         self.title = title
         self.file_path = file_path
         self.tags = tags
@@ -81,6 +83,7 @@ class TiktokVideo(object):
         self.local_executable_path = LOCAL_CHROME_PATH
         self.headless = LOCAL_CHROME_HEADLESS
         self.locator_base = None
+        self.context = context  # context handed out by the browser pool; launch our own browser when None
 
     async def set_schedule_time(self, page, publish_date):
         schedule_input_element = self.locator_base.get_by_label('Schedule')
@@ -146,10 +149,18 @@ class TiktokVideo(object):
         file_chooser = await fc_info.value
         await file_chooser.set_files(self.file_path)
 
-    async def upload(self, playwright: Playwright) -> None:
-        browser = await playwright.chromium.launch(headless=self.headless, executable_path=self.local_executable_path)
-        context = await browser.new_context(storage_state=f"{self.account_file}")
+    @finish_timer_on_error
+    async def upload(self, playwright: Playwright = None) -> None:
+        browser = None
+        if self.context:
+            context = self.context
+        else:
+            browser = await playwright.chromium.launch(headless=self.headless, executable_path=self.local_executable_path)
+            context = await browser.new_context(storage_state=f"{self.account_file}")
         # context = await set_init_script(context)
+        context = await set_resource_blocking(context, SOCIAL_MEDIA_TIKTOK)
+        self.timer = StepTimer(SOCIAL_MEDIA_TIKTOK, self.account_file)
+        self.timer.step("goto")
         page = await context.new_page()
 
         # change language to eng first
@@ -167,6 +178,7 @@ class TiktokVideo(object):
 
         await self.choose_base_locator(page)
 
+        self.timer.step("set_input_files")
         upload_button = self.locator_base.locator(
             'button:has-text("Select video"):visible')
         await upload_button.wait_for(state='visible')  # 确保按钮可见
@@ -176,25 +188,33 @@ class TiktokVideo(object):
         file_chooser = await fc_info.value
         await file_chooser.set_files(self.file_path)
 
+        self.timer.step("fill_title_tags")
         await self.add_title_tags(page)
         # detect upload status
+        self.timer.step("wait_upload")
         await self.detect_upload_status(page)
+        self.timer.step("set_thumbnail")
         if self.thumbnail_path:
             tiktok_logger.info(f'[+] Uploading thumbnail file {self.title}.png')
             await self.upload_thumbnails(page)
 
+        self.timer.step("set_schedule_time")
         if self.publish_date != 0:
             await self.set_schedule_time(page, self.publish_date)
 
+        self.timer.step("click_publish")
         await self.click_publish(page)
         tiktok_logger.success(f"video_id: {await self.get_last_video_id(page)}")
 
+        self.timer.step("save_cookie")
         await context.storage_state(path=f"{self.account_file}")  # save cookie
         tiktok_logger.info('  [-] update cookie！')
+        self.timer.finish()
         await asyncio.sleep(2)  # close delay for look the video status
-        # close all
-        await context.close()
-        await browser.close()
+        # close all (the pool closes the contexts it hands out)
+        if browser:
+            await context.close()
+            await browser.close()
 
     async def add_title_tags(self, page):
 
@@ -297,23 +317,23 @@ class TiktokVideo(object):
 
 
     async def detect_upload_status(self, page):
+        tiktok_logger.info("  [-] video uploading...")
+        attempt = 0
         while True:
-            try:
-                # if await self.locator_base.locator('div.btn-post > button').get_attribute("disabled") is None:
-                if await self.locator_base.locator(
-                        'div.button-group > button >> text=Post').get_attribute("disabled") is None:
-                    tiktok_logger.info("  [-]video uploaded.")
-                    break
-                else:
-                    tiktok_logger.info("  [-] video uploading...")
-                    await asyncio.sleep(2)
-                    if await self.locator_base.locator(
-                            'button[aria-label="Select file"]').count():
-                        tiktok_logger.info("  [-] found some error while uploading now retry...")
-                        await self.handle_upload_error(page)
-            except:
-                tiktok_logger.info("  [-] video uploading...")
-                await asyncio.sleep(2)
+            # Post 按钮可点击代表上传完成，重新出现 Select file 按钮代表上传出错
+            status = await wait_for_upload(
+                page,
+                done=self.locator_base.locator('div.button-group > button:not([disabled]) >> text=Post'),
+                error=self.locator_base.locator('button[aria-label="Select file"]'),
+                response_url=UPLOAD_RESPONSE_URL,
+            )
+            if status == UPLOAD_DONE:
+                tiktok_logger.info("  [-]video uploaded.")
+                break
+            attempt += 1
+            tiktok_logger.info(f"  [-] found some error while uploading now retry ({attempt})...")
+            await upload_retry_backoff(attempt)
+            await self.handle_upload_error(page)
 
     async def choose_base_locator(self, page):
         # await page.wait_for_selector('div.upload-container')
@@ -323,5 +343,8 @@ class TiktokVideo(object):
             self.locator_base = page.locator(Tk_Locator.default) 
 
     async def main(self):
+        if self.context:
+            await self.upload()
+            return
         async with async_playwright() as playwright:
             await self.upload(playwright)
@@ -6,8 +6,9 @@ import os
 import asyncio
 
 from conf import LOCAL_CHROME_PATH, LOCAL_CHROME_HEADLESS
-from utils.base_social_media import set_init_script
+from utils.base_social_media import set_init_script, set_resource_blocking, SOCIAL_MEDIA_XIAOHONGSHU, wait_for_upload
 from utils.log import xiaohongshu_logger
+from utils.timing import StepTimer, finish_timer_on_error
 
 
 async def cookie_auth(account_file):
@@ -64,7 +65,7 @@ async def xiaohongshu_cookie_gen(account_file):
 
 
 class XiaoHongShuVideo(object):
-    def __init__(self, title, file_path, tags, publish_date: datetime, account_file, thumbnail_path=None):
+    def __init__(self, title, file_path, tags, publish_date: datetime, account_file, thumbnail_path=None, context=None):
         self.title = title  # 视频标题
         self.file_path = file_path
         self.tags = tags
@@ -74,6 +75,7 @@ class XiaoHongShuVideo(object):
         self.local_executable_path = LOCAL_CHROME_PATH
         self.headless = LOCAL_CHROME_HEADLESS
         self.thumbnail_path = thumbnail_path
+        self.context = context  # 浏览器池分配的上下文，为空时自行启动浏览器
 
     async def set_schedule_time_xiaohongshu(self, page, publish_date):
         print("  [-] 正在设置定时发布时间...")
@@ -106,21 +108,30 @@ class XiaoHongShuVideo(object):
         xiaohongshu_logger.info('视频出错了，重新上传中')
         await page.locator('div.progress-div [class^="upload-btn-input"]').set_input_files(self.file_path)
 
-    async def upload(self, playwright: Playwright) -> None:
-        # 使用 Chromium 浏览器启动一个浏览器实例
-        if self.local_executable_path:
-            browser = await playwright.chromium.launch(headless=self.headless, executable_path=self.local_executable_path)
+    @finish_timer_on_error
+    async def upload(self, playwright: Playwright = None) -> None:
+        browser = None
+        if self.context:
+            context = self.context
         else:
-            browser = await playwright.chromium.launch(headless=self.headless)
-        # 创建一个浏览器上下文，使用指定的 cookie 文件
-        context = await browser.new_context(
-            viewport={"width": 1600, "height": 900},
-            storage_state=f"{self.account_file}"
-        )
+            # 使用 Chromium 浏览器启动一个浏览器实例
+            if self.local_executable_path:
+                browser = await playwright.chromium.launch(headless=self.headless, executable_path=self.local_executable_path)
+            else:
+                browser = await playwright.chromium.launch(headless=self.headless)
+            # 创建一个浏览器上下文，使用指定的 cookie 文件
+            context = await browser.new_context(
+                viewport={"width": 1600, "height": 900},
+                storage_state=f"{self.account_file}"
+            )
         context = await set_init_script(context)
+        context = await set_resource_blocking(context, SOCIAL_MEDIA_XIAOHONGSHU)
 
         # 创建一个新的页面
+        self.timer = StepTimer(SOCIAL_MEDIA_XIAOHONGSHU, self.account_file)
+        self.timer.step("goto")
         page = await context.new_page()
+        await page.set_viewport_size({"width": 1600, "height": 900})
         # 访问指定的 URL
         await page.goto("https://creator.xiaohongshu.com/publish/publish?from=homepage&target=video")
         xiaohongshu_logger.info(f'[+]正在上传-------{self.title}.mp4')
@@ -128,40 +139,22 @@ class XiaoHongShuVideo(object):
         xiaohongshu_logger.info(f'[-] 正在打开主页...')
         await page.wait_for_url("https://creator.xiaohongshu.com/publish/publish?from=homepage&target=video")
         # 点击 "上传视频" 按钮
+        self.timer.step("set_input_files")
         await page.locator("div[class^='upload-content'] input[class='upload-input']").set_input_files(self.file_path)
 
         # 等待页面跳转到指定的 URL 2025.01.08修改在原有基础上兼容两种页面
-        while True:
-            try:
-                # 等待upload-input元素出现
-                upload_input = await page.wait_for_selector('input.upload-input', timeout=3000)
-                # 获取下一个兄弟元素
-                preview_new = await upload_input.query_selector(
-                    'xpath=following-sibling::div[contains(@class, "preview-new")]')
-                if preview_new:
-                    # 在preview-new元素中查找包含"上传成功"的stage元素
-                    stage_elements = await preview_new.query_selector_all('div.stage')
-                    upload_success = False
-                    for stage in stage_elements:
-                        text_content = await page.evaluate('(element) => element.textContent', stage)
-                        if '上传成功' in text_content:
-                            upload_success = True
-                            break
-                    if upload_success:
-                        xiaohongshu_logger.info("[+] 检测到上传成功标识!")
-                        break  # 成功检测到上传成功后跳出循环
-                    else:
-                        print("  [-] 未找到上传成功标识，继续等待...")
-                else:
-                    print("  [-] 未找到预览元素，继续等待...")
-                    await asyncio.sleep(1)
-            except Exception as e:
-                print(f"  [-] 检测过程出错: {str(e)}，重新尝试...")
-                await asyncio.sleep(0.5)  # 等待0.5秒后重新尝试
+        # upload-input 后面的 preview-new 元素中出现包含"上传成功"的 stage 即上传完成
+        self.timer.step("wait_upload")
+        await wait_for_upload(
+            page,
+            done=page.locator('input.upload-input ~ div[class*="preview-new"] div.stage:has-text("上传成功")'),
+        )
+        xiaohongshu_logger.info("[+] 检测到上传成功标识!")
 
         # 填充标题和话题
         # 检查是否存在包含输入框的元素
         # 这里为了避免页面变化，故使用相对位置定位：作品标题父级右侧第一个元素的input子元素
+        self.timer.step("fill_title_tags")
         await asyncio.sleep(1)
         xiaohongshu_logger.info(f'  [-] 正在填充标题和话题...')
         title_container = page.locator('div.plugin.title-container').locator('input.d-text')
@@ -214,9 +207,11 @@ class XiaoHongShuVideo(object):
         #     if 'semi-switch-checked' not in await page.eval_on_selector(third_part_element, 'div => div.className'):
         #         await page.locator(third_part_element).locator('input.semi-switch-native-control').click()
 
+        self.timer.step("set_schedule_time")
         if self.publish_date != 0:
             await self.set_schedule_time_xiaohongshu(page, self.publish_date)
 
+        self.timer.step("click_publish")
         # 判断视频是否发布成功
         while True:
             try:
@@ -236,12 +231,15 @@ class XiaoHongShuVideo(object):
                 await page.screenshot(full_page=True)
                 await asyncio.sleep(0.5)
 
+        self.timer.step("save_cookie")
         await context.storage_state(path=self.account_file)  # 保存cookie
         xiaohongshu_logger.success('  [-]cookie更新完毕！')
+        self.timer.finish()
         await asyncio.sleep(2)  # 这里延迟是为了方便眼睛直观的观看
-        # 关闭浏览器上下文和浏览器实例
-        await context.close()
-        await browser.close()
+        # 关闭浏览器上下文和浏览器实例（池分配的上下文由浏览器池负责关闭）
+        if browser:
+            await context.close()
+            await browser.close()
     
     async def set_thumbnail(self, page: Page, thumbnail_path: str):
         if thumbnail_path:
@@ -362,6 +360,9 @@ class XiaoHongShuVideo(object):
             return False
 
     async def main(self):
+        if self.context:
+            await self.upload()
+            return
         async with async_playwright() as playwright:
             await self.upload(playwright)
 
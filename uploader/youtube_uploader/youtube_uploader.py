@@ -5,7 +5,9 @@ from pathlib import Path
 from playwright.async_api import async_playwright, Playwright
 
 from conf import LOCAL_CHROME_PATH
+from utils.base_social_media import SOCIAL_MEDIA_YOUTUBE
 from utils.log import tiktok_logger
+from utils.timing import StepTimer, finish_timer_on_error
 
 
 class YouTubeVideoUploader:
@@ -16,7 +18,8 @@ class YouTubeVideoUploader:
         description: str,
         file_path: str,
         account_file: str,
-        is_public: bool = True
+        is_public: bool = True,
+        context=None
     ):
         self.title = title
         self.description = description
@@ -26,35 +29,51 @@ class YouTubeVideoUploader:
 
         self.executable_path = LOCAL_CHROME_PATH
         self.headless = False  # ⚠️ YouTube 强烈建议 False
+        self.context = context  # 浏览器池分配的上下文，为空时自行启动浏览器
 
     # -----------------------------
     # 主入口
     # -----------------------------
-    async def upload(self, playwright: Playwright):
-        browser = await playwright.chromium.launch(
-            headless=self.headless,
-            executable_path=self.executable_path,
-        )
+    @finish_timer_on_error
+    async def upload(self, playwright: Playwright = None):
+        browser = None
+        if self.context:
+            context = self.context
+        else:
+            browser = await playwright.chromium.launch(
+                headless=self.headless,
+                executable_path=self.executable_path,
+            )
 
-        context = await browser.new_context(
-            storage_state=self.account_file
-        )
+            context = await browser.new_context(
+                storage_state=self.account_file
+            )
+        self.timer = StepTimer(SOCIAL_MEDIA_YOUTUBE, self.account_file)
+        self.timer.step("goto")
         page = await context.new_page()
 
         await self.open_upload_dialog(page)
+        self.timer.step("set_input_files")
         await self.upload_video_file(page)
+        self.timer.step("fill_title_tags")
         await self.fill_title_description(page)
+        self.timer.step("click_next_steps")
         await self.click_next_steps(page)
+        self.timer.step("click_publish")
         await self.set_visibility_and_publish(page)
 
         # 保存 cookie（防失效）
+        self.timer.step("save_cookie")
         await context.storage_state(path=self.account_file)
+        self.timer.finish()
 
         tiktok_logger.success("[YouTube] video upload finished")
 
         await asyncio.sleep(3)
-        await context.close()
-        await browser.close()
+        # 池分配的上下文由浏览器池负责关闭
+        if browser:
+            await context.close()
+            await browser.close()
 
     # -----------------------------
     # Step 1: 打开上传弹窗
@@ -150,6 +169,9 @@ class YouTubeVideoUploader:
     # 运行入口
     # -----------------------------
     async def main(self):
+        if self.context:
+            await self.upload()
+            return
         async with async_playwright() as playwright:
             await self.upload(playwright)
 
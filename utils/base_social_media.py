@@ -1,6 +1,9 @@
+import asyncio
+import re
 from pathlib import Path
 from typing import List
 
+import conf
 from conf import BASE_DIR
 
 SOCIAL_MEDIA_DOUYIN = "douyin"
@@ -8,6 +11,19 @@ SOCIAL_MEDIA_TENCENT = "tencent"
 SOCIAL_MEDIA_TIKTOK = "tiktok"
 SOCIAL_MEDIA_BILIBILI = "bilibili"
 SOCIAL_MEDIA_KUAISHOU = "kuaishou"
+SOCIAL_MEDIA_XIAOHONGSHU = "xiaohongshu"
+SOCIAL_MEDIA_BAIJIAHAO = "baijiahao"
+SOCIAL_MEDIA_YOUTUBE = "youtube"
+
+# 平台名 -> 平台类型（与 user_info.type、/postVideo 的 type 一致）
+SOCIAL_MEDIA_TYPES = {
+    SOCIAL_MEDIA_XIAOHONGSHU: 1,
+    SOCIAL_MEDIA_TENCENT: 2,
+    SOCIAL_MEDIA_DOUYIN: 3,
+    SOCIAL_MEDIA_KUAISHOU: 4,
+    SOCIAL_MEDIA_TIKTOK: 5,
+    SOCIAL_MEDIA_YOUTUBE: 6,
+}
 
 
 def get_supported_social_media() -> List[str]:
@@ -22,3 +38,133 @@ async def set_init_script(context):
     stealth_js_path = Path(BASE_DIR / "utils/stealth.min.js")
     await context.add_init_script(path=stealth_js_path)
     return context
+
+
+# 上传页面的资源拦截：自动化不需要字体和统计埋点
+RESOURCE_BLOCKING = getattr(conf, "RESOURCE_BLOCKING", True)
+# 各平台的拦截规则，types 为拦截的资源类型，deny/allow 为 URL 正则（allow 优先），conf 中的同名平台配置会覆盖默认值。
+# 图片（image）和视频预览（media）默认不拦截：有的上传页要等封面/预览加载完才启用发布按钮，
+# 确认某个平台不受影响后再在该平台的 types 里加上，例如 {"types": ["font", "image", "media"]}
+RESOURCE_BLOCK_PROFILES = {
+    "default": {
+        "types": ["font"],
+        "deny": [r"google-analytics\.com", r"googletagmanager\.com", r"doubleclick\.net", r"hm\.baidu\.com",
+                 r"cnzz\.com", r"sentry\.io"],
+        "allow": [],
+    },
+    SOCIAL_MEDIA_DOUYIN: {"deny": [r"mcs\.snssdk\.com", r"mon\.snssdk\.com", r"mcs\.zijieapi\.com", r"mon\.zijieapi\.com"]},
+    SOCIAL_MEDIA_TIKTOK: {"deny": [r"mcs[-\w]*\.tiktokv\.com", r"mon[-\w]*\.byteoversea\.com"]},
+    SOCIAL_MEDIA_TENCENT: {"deny": [r"aegis\.qq\.com", r"beacon\.qq\.com"]},
+    SOCIAL_MEDIA_KUAISHOU: {"deny": [r"log-sdk\.ksapisrv\.com"]},
+    SOCIAL_MEDIA_XIAOHONGSHU: {"deny": [r"apm-fe\.xiaohongshu\.com", r"t2\.xiaohongshu\.com"]},
+    SOCIAL_MEDIA_BAIJIAHAO: {},
+}
+
+
+def get_resource_block_profile(platform):
+    """合并默认规则、平台规则和 conf.RESOURCE_BLOCK_PROFILES 中的覆盖项"""
+    overrides = getattr(conf, "RESOURCE_BLOCK_PROFILES", {})
+    profile = dict(RESOURCE_BLOCK_PROFILES["default"])
+    for source in (overrides.get("default", {}), RESOURCE_BLOCK_PROFILES.get(platform, {}), overrides.get(platform, {})):
+        for key, value in source.items():
+            # 平台的 deny/allow 在默认列表上追加，types 直接覆盖
+            profile[key] = profile.get(key, []) + list(value) if key in ("deny", "allow") else list(value)
+    return profile
+
+
+async def set_resource_blocking(context, platform):
+    """按平台规则给上下文挂上请求拦截，被拦截的请求直接 abort，不发到网络"""
+    if not RESOURCE_BLOCKING:
+        return context
+    profile = get_resource_block_profile(platform)
+    types = set(profile["types"])
+    deny = re.compile("|".join(profile["deny"])) if profile["deny"] else None
+    allow = re.compile("|".join(profile["allow"])) if profile["allow"] else None
+    if not types and deny is None:
+        return context
+
+    async def handle(route):
+        request = route.request
+        if allow is None or not allow.search(request.url):
+            if request.resource_type in types or (deny is not None and deny.search(request.url)):
+                await route.abort()
+                return
+        await route.fallback()
+
+    await context.route("**/*", handle)
+    return context
+
+
+# 等待上传完成的最长时间（秒）
+UPLOAD_WAIT_TIMEOUT = getattr(conf, "UPLOAD_WAIT_TIMEOUT", 1800)
+# “上传中”这类标记消失才算完成时，等标记出现的时间（秒），超过仍没出现说明上传在开始等待前已经结束
+UPLOAD_MARKER_TIMEOUT = getattr(conf, "UPLOAD_MARKER_TIMEOUT", 5)
+# 上传出错后重新上传的最多次数
+UPLOAD_MAX_RETRIES = getattr(conf, "UPLOAD_MAX_RETRIES", 3)
+
+UPLOAD_DONE = "done"
+UPLOAD_ERROR = "error"
+# 抖音/TikTok（字节系）视频上传的申请/提交接口，返回 4xx/5xx 说明上传失败，作为 wait_for_upload 的 response_url
+UPLOAD_RESPONSE_URL = r"ApplyUploadInner|CommitUploadInner"
+
+
+async def _wait_for_done(done, done_state, timeout):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    if done_state in ("detached", "hidden"):
+        # “上传中”这类标记消失才算完成时，先短暂等它出现，避免标记还没渲染就被判定为完成；
+        # 小文件常在填写标题、话题时就已传完，标记不会再出现，直接算完成
+        marker_timeout = min(UPLOAD_MARKER_TIMEOUT, timeout)
+        try:
+            await asyncio.wait_for(done.first.wait_for(state="attached", timeout=(marker_timeout + 1) * 1000),
+                                   marker_timeout)
+        except asyncio.TimeoutError:
+            return
+    # playwright 的 timeout=0 表示不限时，至少留 1ms
+    await done.first.wait_for(state=done_state, timeout=max((deadline - loop.time()) * 1000, 1))
+
+
+async def wait_for_upload(page, done, error=None, response_url=None, done_state="attached", timeout=None):
+    """
+    等待上传完成或出错，返回 UPLOAD_DONE / UPLOAD_ERROR，超时抛出 TimeoutError。
+    done / error 为 Locator（page 或 frame_locator 下的都可以），done 达到 done_state 即完成
+    （done_state 为 detached/hidden 时先等 done 出现，UPLOAD_MARKER_TIMEOUT 内没出现直接算完成），error 可见即出错；
+    response_url 为上传接口 URL 的正则，匹配的请求返回 4xx/5xx 时立即判定出错。完成和出错同时发生时以出错为准。
+    元素等待由 playwright 在页面内完成，状态变化后下一帧就能返回，不用反复 sleep 轮询。
+    """
+    timeout = timeout or UPLOAD_WAIT_TIMEOUT
+    failed_response = asyncio.get_running_loop().create_future()
+
+    def on_response(response):
+        if response.status >= 400 and re.search(response_url, response.url) and not failed_response.done():
+            failed_response.set_result(response)
+
+    waiters = {asyncio.ensure_future(_wait_for_done(done, done_state, timeout)): UPLOAD_DONE}
+    if error is not None:
+        # 页面里常有隐藏的错误节点（如视频号的 div.status-msg.error），要等它可见
+        waiters[asyncio.ensure_future(error.first.wait_for(state="visible", timeout=timeout * 1000))] = UPLOAD_ERROR
+    if response_url:
+        page.on("response", on_response)
+        waiters[failed_response] = UPLOAD_ERROR
+    try:
+        finished, _ = await asyncio.wait(waiters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        if not finished:
+            raise TimeoutError(f"等待上传完成超时（{timeout}s）")
+        # finished 是集合，先看出错的 waiter，结果不依赖迭代顺序
+        finished = sorted(finished, key=lambda waiter: waiters[waiter] != UPLOAD_ERROR)
+        for waiter in finished:
+            if waiter.exception() is None:
+                return waiters[waiter]
+        raise finished[0].exception()
+    finally:
+        for waiter in waiters:
+            waiter.cancel()
+        if response_url:
+            page.remove_listener("response", on_response)
+
+
+async def upload_retry_backoff(attempt):
+    """第 attempt 次上传出错后等待再重试（2、4、8…秒，最多 30 秒），超过 UPLOAD_MAX_RETRIES 次抛出异常"""
+    if attempt > UPLOAD_MAX_RETRIES:
+        raise RuntimeError(f"视频上传失败，已重试 {UPLOAD_MAX_RETRIES} 次")
+    await asyncio.sleep(min(2 ** attempt, 30))
@@ -0,0 +1,272 @@
+import asyncio
+import os
+import uuid
+import weakref
+from contextlib import asynccontextmanager
+
+from playwright.async_api import async_playwright
+
+import conf
+from utils.log import logger
+from utils.metrics import REGISTRY, BROWSER_POOL_BROWSERS, BROWSER_POOL_ACTIVE_CONTEXTS, BROWSER_RSS_BYTES
+
+try:
+    import psutil
+except ImportError:  # psutil 可选，没有时只按任务数回收
+    psutil = None
+
+BROWSER_POOL_SIZE = getattr(conf, "BROWSER_POOL_SIZE", 2)
+BROWSER_POOL_MAX_JOBS = getattr(conf, "BROWSER_POOL_MAX_JOBS", 20)
+BROWSER_POOL_MAX_RSS_MB = getattr(conf, "BROWSER_POOL_MAX_RSS_MB", 2048)
+
+# 所有存活的浏览器池，供 /metrics 汇总
+_live_pools = weakref.WeakSet()
+
+
+# 启动浏览器时带上这个开关（Chromium 忽略不认识的开关），按命令行从子进程中找到池里每个浏览器的主进程，
+# 内存只统计这些浏览器的进程树，不包括 ffmpeg/ffprobe、独立启动的浏览器和其他池
+BROWSER_TAG_SWITCH = "--sau-browser-pool"
+
+
+def _find_browser_process(tag):
+    marker = f"{BROWSER_TAG_SWITCH}={tag}"
+    for child in psutil.Process(os.getpid()).children(recursive=True):
+        try:
+            if marker in child.cmdline():
+                return child
+        except psutil.Error:
+            continue
+    return None
+
+
+def process_tree_rss_bytes(process):
+    """process 及其所有子进程（渲染、GPU 等）的 RSS 总和"""
+    total = 0
+    for member in [process, *process.children(recursive=True)]:
+        try:
+            total += member.memory_info().rss
+        except psutil.Error:
+            continue
+    return total
+
+
+class _PooledBrowser(object):
+    def __init__(self, browser, tag):
+        self.browser = browser
+        self.tag = tag
+        self.process = None  # 浏览器主进程（psutil.Process），第一次统计内存时查找
+        self.jobs = 0  # 已分配过的上下文数
+        self.active = 0  # 正在使用的上下文数
+        self.standby = 0  # 备用上下文数（如预热的登录页），不阻止回收，浏览器关闭时随之关闭
+        self.retired = False  # 达到回收条件，等空闲后关闭
+
+    def rss_bytes(self):
+        """这个浏览器进程树的 RSS 总和，没有 psutil 或找不到进程时返回 None"""
+        if psutil is None:
+            return None
+        try:
+            if self.process is None or not self.process.is_running():
+                self.process = _find_browser_process(self.tag)
+            if self.process is None:
+                return None
+            return process_tree_rss_bytes(self.process)
+        except psutil.Error:
+            return None
+
+
+class BrowserPool(object):
+    """
+    进程级 Chromium 池：一次启动 N 个浏览器，按账号的 storage_state 分配全新的 BrowserContext，
+    浏览器在服务满 max_jobs 次、或自身进程树的 RSS 超过分摊到它的上限（max_rss_mb / size）后，等空闲时关闭重启。
+    standby=True 分配的备用上下文不计入空闲判断，浏览器回收时直接随之关闭；真正要用时调用 claim() 转为正常上下文。
+
+    用法:
+        async with BrowserPool() as pool:
+            async with pool.new_context(storage_state=account_file) as context:
+                await DouYinVideo(..., context=context).main()
+    """
+
+    def __init__(self, size=None, max_jobs=None, max_rss_mb=None, headless=None, executable_path=None):
+        self.size = size or BROWSER_POOL_SIZE
+        self.max_jobs = max_jobs or BROWSER_POOL_MAX_JOBS
+        self.max_rss_mb = max_rss_mb or BROWSER_POOL_MAX_RSS_MB
+        self.headless = conf.LOCAL_CHROME_HEADLESS if headless is None else headless
+        self.executable_path = executable_path if executable_path is not None else (conf.LOCAL_CHROME_PATH or None)
+        self._playwright_manager = None
+        self._playwright = None
+        self._browsers = []
+        # 备用上下文 -> 所在浏览器
+        self._standby = {}
+        self._lock = asyncio.Lock()
+        self._closed = False
+        _live_pools.add(self)
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    @property
+    def started(self):
+        return self._playwright is not None and not self._closed
+
+    async def start(self):
+        async with self._lock:
+            if self._playwright is None:
+                self._playwright_manager = async_playwright()
+                self._playwright = await self._playwright_manager.start()
+                self._closed = False
+            while len(self._browsers) < self.size:
+                self._browsers.append(await self._launch())
+        return self
+
+    async def close(self):
+        async with self._lock:
+            self._closed = True
+            for slot in self._browsers:
+                await self._close_browser(slot)
+            self._browsers = []
+            if self._playwright_manager is not None:
+                await self._playwright_manager.__aexit__(None, None, None)
+            self._playwright_manager = None
+            self._playwright = None
+
+    @asynccontextmanager
+    async def new_context(self, storage_state=None, standby=False, **options):
+        """分配一个全新的 BrowserContext，退出时关闭上下文并归还浏览器"""
+        if not self.started:
+            await self.start()
+        slot = await self._acquire(standby)
+        try:
+            if storage_state is not None:
+                options["storage_state"] = str(storage_state)
+            context = await slot.browser.new_context(**options)
+        except Exception:
+            await self._release(slot, standby)
+            raise
+        if standby:
+            self._standby[context] = slot
+        try:
+            yield context
+        finally:
+            try:
+                await context.close()
+            except Exception:
+                pass
+            # 已经 claim() 的上下文按正常上下文归还
+            await self._release(slot, self._standby.pop(context, None) is not None)
+
+    async def claim(self, context):
+        """把备用上下文转为正常上下文（计入任务数和空闲判断），不是备用上下文时返回 False"""
+        async with self._lock:
+            slot = self._standby.pop(context, None)
+            if slot is None:
+                return False
+            slot.standby -= 1
+            slot.active += 1
+            slot.jobs += 1
+            if slot.jobs >= self.max_jobs:
+                slot.retired = True
+            return True
+
+    def stats(self):
+        return {
+            "size": self.size,
+            "browsers": len(self._browsers),
+            "active_contexts": sum(slot.active for slot in self._browsers),
+            "standby_contexts": sum(slot.standby for slot in self._browsers),
+            "rss_mb": self.rss_mb(),
+        }
+
+    def rss_bytes(self):
+        """池内所有浏览器进程树的 RSS 总和，没有 psutil 时返回 None"""
+        if psutil is None:
+            return None
+        return sum(slot.rss_bytes() or 0 for slot in self._browsers)
+
+    def rss_mb(self):
+        total = self.rss_bytes()
+        if total is None:
+            return None
+        return round(total / (1024 * 1024), 1)
+
+    async def _launch(self):
+        tag = uuid.uuid4().hex
+        options = {"headless": self.headless, "args": [f"{BROWSER_TAG_SWITCH}={tag}"]}
+        if self.executable_path:
+            options["executable_path"] = self.executable_path
+        browser = await self._playwright.chromium.launch(**options)
+        return _PooledBrowser(browser, tag)
+
+    async def _acquire(self, standby=False):
+        async with self._lock:
+            live = [slot for slot in self._browsers if not slot.retired and slot.browser.is_connected()]
+            if len(live) < self.size:
+                slot = await self._launch()
+                self._browsers.append(slot)
+                live.append(slot)
+            # 选择当前负载最小的浏览器
+            slot = min(live, key=lambda s: s.active)
+            if standby:
+                slot.standby += 1
+                return slot
+            slot.active += 1
+            slot.jobs += 1
+            if slot.jobs >= self.max_jobs:
+                slot.retired = True
+            return slot
+
+    async def _release(self, slot, standby=False):
+        async with self._lock:
+            if standby:
+                slot.standby -= 1
+            else:
+                slot.active -= 1
+            if not slot.retired and not standby:
+                rss = slot.rss_bytes()
+                limit_mb = self.max_rss_mb / self.size
+                if rss is not None and rss > limit_mb * 1024 * 1024:
+                    logger.info(f"[browser pool] 浏览器 RSS {round(rss / (1024 * 1024), 1)}MB "
+                                f"超过单个浏览器上限 {round(limit_mb, 1)}MB，回收浏览器")
+                    slot.retired = True
+            if (slot.retired or not slot.browser.is_connected()) and slot.active == 0:
+                await self._close_browser(slot)
+                if slot in self._browsers:
+                    self._browsers.remove(slot)
+
+    @staticmethod
+    async def _close_browser(slot):
+        try:
+            await slot.browser.close()
+        except Exception:
+            pass
+
+
+@REGISTRY.add_collector
+def _collect_browser_pools():
+    pools = [pool for pool in list(_live_pools) if pool.started]
+    BROWSER_POOL_BROWSERS.set(sum(len(pool._browsers) for pool in pools))
+    BROWSER_POOL_ACTIVE_CONTEXTS.set(sum(slot.active for pool in pools for slot in pool._browsers))
+    if psutil is not None:
+        BROWSER_RSS_BYTES.set(sum(pool.rss_bytes() or 0 for pool in pools))
+
+
+_pool = None
+_pool_loop = None
+
+
+async def get_browser_pool():
+    """
+    返回进程级共享的浏览器池（懒启动）。
+    池绑定在创建它的事件循环上，只适合在长期运行的事件循环中使用。
+    """
+    global _pool, _pool_loop
+    loop = asyncio.get_running_loop()
+    if _pool is None or _pool_loop is not loop or _pool_loop.is_closed():
+        _pool = BrowserPool()
+        _pool_loop = loop
+    if not _pool.started:
+        await _pool.start()
+    return _pool
@@ -0,0 +1,57 @@
+import asyncio
+import weakref
+from contextlib import asynccontextmanager
+
+import conf
+
+# 同时进行的上传任务总数
+UPLOAD_CONCURRENCY = getattr(conf, "UPLOAD_CONCURRENCY", 4)
+# 各平台同时进行的上传任务数，未配置的平台只受总数限制
+UPLOAD_PLATFORM_CONCURRENCY = getattr(conf, "UPLOAD_PLATFORM_CONCURRENCY", {})
+
+
+class UploadLimiter(object):
+    """
+    上传并发控制：总数、按平台、按账号三级限制。
+    同一个账号（cookie 文件）同一时间只允许一个页面在操作，避免两个标签页互相踩状态。
+    """
+
+    def __init__(self, global_limit=None, platform_limits=None):
+        self._global = asyncio.Semaphore(global_limit or UPLOAD_CONCURRENCY)
+        self._platform_limits = platform_limits if platform_limits is not None else UPLOAD_PLATFORM_CONCURRENCY
+        self._platforms = {}
+        self._accounts = {}
+
+    @asynccontextmanager
+    async def slot(self, platform, account):
+        # 先拿账号锁，排队等同一账号时不占用平台和全局名额
+        account_lock = self._accounts.setdefault(str(account), asyncio.Lock())
+        async with account_lock:
+            platform_sem = self._platform_semaphore(platform)
+            if platform_sem is None:
+                async with self._global:
+                    yield
+            else:
+                async with platform_sem, self._global:
+                    yield
+
+    def _platform_semaphore(self, platform):
+        limit = self._platform_limits.get(platform)
+        if not limit:
+            return None
+        if platform not in self._platforms:
+            self._platforms[platform] = asyncio.Semaphore(limit)
+        return self._platforms[platform]
+
+
+_limiters = weakref.WeakKeyDictionary()
+
+
+def get_upload_limiter():
+    """返回当前事件循环共享的上传并发控制器，同一循环内的所有批次共用一套名额"""
+    loop = asyncio.get_running_loop()
+    limiter = _limiters.get(loop)
+    if limiter is None:
+        limiter = UploadLimiter()
+        _limiters[loop] = limiter
+    return limiter
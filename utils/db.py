@@ -0,0 +1,79 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+import conf
+from conf import BASE_DIR
+from utils.metrics import TimedConnection
+
+# 数据库访问：每个线程复用一个长连接（WAL 模式），不再每次查询都 sqlite3.connect
+# 用法与原来的 with sqlite3.connect(...) as conn 一致：with 块正常结束时提交，出异常时回滚，但不会关闭连接
+#     with get_connection() as conn:
+#         conn.execute(...)
+# 需要按列名取值时用 row_cursor(conn)，不要修改共享连接的 row_factory
+
+DB_PATH = Path(BASE_DIR / "db" / "database.db")
+
+# WAL 下读写互不阻塞；synchronous=NORMAL 在 WAL 下不会损坏数据库，只可能丢失断电前最后几个事务
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,              # 遇到写锁时最多等待的毫秒数，避免直接报 database is locked
+    "mmap_size": 256 * 1024 * 1024,
+    "temp_store": "MEMORY",
+    "cache_size": -16000,              # 负数单位为 KiB
+}
+SQLITE_PRAGMAS.update(getattr(conf, "SQLITE_PRAGMAS", {}))
+# 每个连接缓存的预编译语句数量，同一条 SQL 再次执行时直接复用
+SQLITE_CACHED_STATEMENTS = getattr(conf, "SQLITE_CACHED_STATEMENTS", 256)
+
+_local = threading.local()
+
+
+def connect(path=DB_PATH):
+    """新建一个按 SQLITE_PRAGMAS 配置好的连接，调用方负责关闭；一般用 get_connection()"""
+    conn = sqlite3.connect(path, timeout=SQLITE_PRAGMAS["busy_timeout"] / 1000, factory=TimedConnection,
+                           cached_statements=SQLITE_CACHED_STATEMENTS)
+    for name, value in SQLITE_PRAGMAS.items():
+        conn.execute(f"PRAGMA {name} = {value}")
+    return conn
+
+
+def get_connection():
+    """返回当前线程的数据库连接，第一次调用时创建"""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = _local.conn = connect()
+    return conn
+
+
+def close_connection():
+    """关闭当前线程的连接（线程退出前调用，不调用也会在线程结束后被回收）"""
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        _local.conn = None
+        conn.close()
+
+
+def row_cursor(conn=None):
+    """返回结果为 sqlite3.Row 的游标，只影响这个游标"""
+    cursor = (conn or get_connection()).cursor()
+    cursor.row_factory = sqlite3.Row
+    return cursor
+
+
+@contextmanager
+def immediate_transaction():
+    """BEGIN IMMEDIATE 事务：开始时就拿到写锁，适合先查后改（如领取任务）"""
+    conn = get_connection()
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
+    else:
+        conn.commit()
@@ -0,0 +1,161 @@
+import asyncio
+import hashlib
+import threading
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import conf
+from conf import BASE_DIR
+from utils.db import get_connection, row_cursor
+from utils.downloader import download, remote_version
+from utils.log import logger
+from utils.migrations import ensure_schema
+
+# 远程视频的下载缓存：同一个 URL（且 ETag/Last-Modified 没变）只下载一次，所有平台、所有发布任务共用
+CACHE_DIR = Path(BASE_DIR / "videoFile" / "cache")
+# 缓存占用的磁盘上限（字节），超过时按最近使用时间淘汰没有被引用的文件
+DOWNLOAD_CACHE_MAX_BYTES = getattr(conf, "DOWNLOAD_CACHE_MAX_BYTES", 20 * 1024 * 1024 * 1024)
+# 服务端没有 ETag/Last-Modified 时无法判断文件是否变化，缓存只在这段时间（秒）内有效
+DOWNLOAD_CACHE_UNVALIDATED_TTL = getattr(conf, "DOWNLOAD_CACHE_UNVALIDATED_TTL", 3600)
+
+
+def cache_key(url, validator):
+    return hashlib.sha1(f"{url}\n{validator or ''}".encode("utf-8")).hexdigest()
+
+
+class DownloadCache(object):
+    """
+    按 URL + 版本标识缓存远程视频，索引在 download_cache 表，文件在 videoFile/cache 下。
+    acquire() 返回本地路径并把引用数加一，用完调用 release()；被引用的文件不会被淘汰。
+    同一文件同时只下载一次，其余请求等待同一个下载完成。acquire 需要在事件循环中调用，release 可以在任意线程调用。
+    """
+
+    def __init__(self, directory=None, max_bytes=None):
+        self.directory = Path(directory or CACHE_DIR)
+        self.max_bytes = max_bytes or DOWNLOAD_CACHE_MAX_BYTES
+        # key -> 引用数
+        self._refs = {}
+        self._refs_lock = threading.Lock()
+        # key -> 正在进行的下载
+        self._downloads = {}
+
+    async def acquire(self, url):
+        ensure_schema()
+        # 探测结果同时用于计算缓存键和下载，未命中时不再重复探测
+        remote = await remote_version(url)
+        key = cache_key(url, remote.validator)
+        while True:
+            path = self._open(key, remote.validator)
+            if path is not None:
+                return path
+            task = self._downloads.get(key)
+            if task is None or task.get_loop() is not asyncio.get_running_loop():
+                task = asyncio.ensure_future(self._fetch(url, key, remote))
+                self._downloads[key] = task
+                task.add_done_callback(lambda done: self._downloads.pop(key, None))
+            # 一个等待方被取消不影响其他等待同一下载的请求
+            await asyncio.shield(task)
+
+    def release(self, path):
+        key = Path(path).stem
+        with self._refs_lock:
+            count = self._refs.get(key, 0) - 1
+            if count > 0:
+                self._refs[key] = count
+            else:
+                self._refs.pop(key, None)
+
+    @asynccontextmanager
+    async def cached(self, url):
+        path = await self.acquire(url)
+        try:
+            yield path
+        finally:
+            self.release(path)
+
+    def _open(self, key, validator):
+        """缓存命中时引用数加一并返回路径，未命中或已失效返回 None"""
+        with get_connection() as conn:
+            row = row_cursor(conn).execute('''
+            SELECT file_name, created_at FROM download_cache WHERE key = ?
+            ''', (key,)).fetchone()
+        if row is None:
+            return None
+        path = self.directory / row['file_name']
+        if not path.exists() or validator is None and time.time() - row['created_at'] > DOWNLOAD_CACHE_UNVALIDATED_TTL:
+            if not self._referenced(key):
+                self._drop(key, path)
+            return None
+        with self._refs_lock:
+            self._refs[key] = self._refs.get(key, 0) + 1
+        with get_connection() as conn:
+            conn.execute('UPDATE download_cache SET last_used = ? WHERE key = ?', (time.time(), key))
+            conn.commit()
+        logger.info(f"[download cache] 命中 {path.name}")
+        return path
+
+    async def _fetch(self, url, key, remote):
+        # 文件名只由 key 决定，中断的下载下次从 .part 续传
+        suffix = Path(urlsplit(url).path).suffix or ".mp4"
+        path = await download(url, self.directory / f"{key}{suffix}", remote=remote)
+        now = time.time()
+        with get_connection() as conn:
+            conn.execute('''
+            INSERT OR REPLACE INTO download_cache (key, url, validator, file_name, size_bytes, created_at, last_used)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (key, url, remote.validator, path.name, path.stat().st_size, now, now))
+            conn.commit()
+            # 同一 URL 的旧版本不会再被命中
+            stale = conn.execute('SELECT key, file_name FROM download_cache WHERE url = ? AND key != ?',
+                                 (url, key)).fetchall()
+        for stale_key, file_name in stale:
+            if not self._referenced(stale_key):
+                self._drop(stale_key, self.directory / file_name)
+        self.evict(keep=key)
+
+    def evict(self, keep=None):
+        """淘汰最久没用、没有被引用的文件，直到总大小不超过 max_bytes"""
+        with get_connection() as conn:
+            rows = conn.execute('SELECT key, file_name, size_bytes FROM download_cache ORDER BY last_used').fetchall()
+        total = sum(row[2] for row in rows)
+        for key, file_name, size in rows:
+            if total <= self.max_bytes:
+                break
+            if key == keep or self._referenced(key):
+                continue
+            logger.info(f"[download cache] 淘汰 {file_name}，{size} 字节")
+            self._drop(key, self.directory / file_name)
+            total -= size
+
+    def stats(self):
+        with get_connection() as conn:
+            count, total = conn.execute('SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM download_cache').fetchone()
+        with self._refs_lock:
+            in_use = len(self._refs)
+        return {"files": count, "bytes": total, "max_bytes": self.max_bytes, "in_use": in_use}
+
+    def _referenced(self, key):
+        with self._refs_lock:
+            return self._refs.get(key, 0) > 0
+
+    @staticmethod
+    def _drop(key, path):
+        path.unlink(missing_ok=True)
+        with get_connection() as conn:
+            conn.execute('DELETE FROM download_cache WHERE key = ?', (key,))
+            conn.commit()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_download_cache():
+    """返回进程内共享的下载缓存"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = DownloadCache()
+    return _cache
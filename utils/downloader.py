@@ -0,0 +1,267 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import threading
+import weakref
+from collections import namedtuple
+from pathlib import Path
+
+import httpx
+
+import conf
+from utils.log import logger
+
+# 远程视频下载：服务端支持 Range 时把文件切成若干段并发下载，按偏移写入预分配的 .part 文件，
+# 已完成的分段记录在 .part.json 里，中断后（进程重启、发布任务重试）从未完成的分段继续
+# 每段的大小（字节）、同时下载的段数
+DOWNLOAD_PART_SIZE = getattr(conf, "DOWNLOAD_PART_SIZE", 8 * 1024 * 1024)
+DOWNLOAD_CONCURRENCY = getattr(conf, "DOWNLOAD_CONCURRENCY", 4)
+# 单次请求的超时（秒，连接和两次读之间的间隔），每段失败后的重试次数
+DOWNLOAD_TIMEOUT = getattr(conf, "DOWNLOAD_TIMEOUT", 60)
+DOWNLOAD_RETRIES = getattr(conf, "DOWNLOAD_RETRIES", 3)
+# 从响应读取、写入磁盘的块大小
+DOWNLOAD_BLOCK_SIZE = 1024 * 1024
+
+_CONTENT_RANGE = re.compile(r'bytes\s+(\d+)-(\d+)/(\d+|\*)')
+
+
+# 探测结果：总大小、版本标识（ETag/Last-Modified），拿不到的为 None；ranges 表示服务端是否支持 Range
+RemoteFile = namedtuple("RemoteFile", ["size", "validator", "ranges"])
+
+
+class DownloadError(Exception):
+    """下载失败：HTTP 错误、重试用尽、资源在下载过程中发生变化或校验不通过"""
+
+
+_clients = weakref.WeakKeyDictionary()
+
+
+def get_download_client():
+    """返回当前事件循环共享的 httpx 客户端，各段请求复用连接"""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(
+            timeout=DOWNLOAD_TIMEOUT,
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=DOWNLOAD_CONCURRENCY * 4,
+                                max_keepalive_connections=DOWNLOAD_CONCURRENCY * 2),
+        )
+        _clients[loop] = client
+    return client
+
+
+if hasattr(os, "pwrite"):
+    def _pwrite(fd, data, offset):
+        while data:
+            written = os.pwrite(fd, data, offset)
+            data = data[written:]
+            offset += written
+else:
+    # Windows 没有 os.pwrite，用锁保证 seek + write 不被其他段打断
+    _seek_lock = threading.Lock()
+
+    def _pwrite(fd, data, offset):
+        with _seek_lock:
+            os.lseek(fd, offset, os.SEEK_SET)
+            while data:
+                written = os.write(fd, data)
+                data = data[written:]
+
+
+def _load_state(state_path):
+    try:
+        with open(state_path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _save_state(state_path, state):
+    tmp_path = state_path.with_name(state_path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, state_path)
+
+
+def _remove(*paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def file_sha256(path):
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(DOWNLOAD_BLOCK_SIZE), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def _validator(response):
+    """资源版本标识，用于断点续传前确认文件没有变化；弱 ETag 不能用于 If-Range"""
+    etag = response.headers.get("etag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return response.headers.get("last-modified")
+
+
+def _content_length(response):
+    return int(response.headers["content-length"]) if "content-length" in response.headers else None
+
+
+def _remote_file(url, response):
+    if response.status_code == 206:
+        match = _CONTENT_RANGE.match(response.headers.get("content-range", ""))
+        size = int(match.group(3)) if match and match.group(3) != "*" else None
+        return RemoteFile(size, _validator(response), True)
+    if response.status_code == 200:
+        return RemoteFile(_content_length(response), _validator(response), False)
+    raise DownloadError(f"下载失败: {url} 返回 {response.status_code}")
+
+
+async def remote_version(url):
+    """只请求第一个字节，返回 RemoteFile；结果可以传给 download(remote=...)，省掉它自己的探测请求"""
+    async with get_download_client().stream("GET", url, headers={"Range": "bytes=0-0"}) as response:
+        return _remote_file(url, response)
+
+
+async def download(url, dest, sha256=None, part_size=None, concurrency=None, remote=None):
+    """
+    下载 url 到 dest，返回 dest。
+    服务端支持 Range 时分段并发下载，有 ETag/Last-Modified 时支持断点续传，否则单连接顺序下载。
+    remote 为 remote_version 的结果，传入时不再重复探测。
+    下载完成后校验长度，传入 sha256 时同时校验内容哈希，不通过抛 DownloadError 并删除临时文件。
+    """
+    dest = Path(dest)
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    part_path = dest.with_name(dest.name + ".part")
+    state_path = dest.with_name(dest.name + ".part.json")
+    part_size = part_size or DOWNLOAD_PART_SIZE
+    concurrency = concurrency or DOWNLOAD_CONCURRENCY
+    client = get_download_client()
+
+    if remote is None:
+        # 只请求第一个字节：206 说明支持 Range，同时拿到总大小和 ETag；200 就直接用这个响应顺序下载
+        async with client.stream("GET", url, headers={"Range": "bytes=0-0"}) as response:
+            remote = _remote_file(url, response)
+            if not remote.ranges:
+                logger.info(f"[download] {url} 不支持分段下载，单连接下载")
+                await _download_single(response, part_path, state_path)
+                return await _finish(part_path, state_path, dest, remote.size, sha256)
+    size, validator = remote.size, remote.validator
+
+    if not remote.ranges or size is None:
+        # 探测结果来自 remote_version 且不支持 Range，或不知道总大小没法切分：发起一次完整请求顺序下载
+        async with client.stream("GET", url) as response:
+            if response.status_code != 200:
+                raise DownloadError(f"下载失败: {url} 返回 {response.status_code}")
+            logger.info(f"[download] {url} 单连接下载")
+            await _download_single(response, part_path, state_path)
+        return await _finish(part_path, state_path, dest, _content_length(response), sha256)
+
+    parts = [(offset, min(offset + part_size, size) - 1) for offset in range(0, size, part_size)]
+    state = _load_state(state_path)
+    if (state is None or validator is None or not part_path.exists() or state.get("url") != url
+            or state.get("size") != size or state.get("validator") != validator or state.get("part_size") != part_size):
+        # 没有可续传的记录、远程文件没有版本标识或已经变化：重新预分配
+        state = {"url": url, "size": size, "validator": validator, "part_size": part_size, "done": []}
+        with open(part_path, "wb") as f:
+            f.truncate(size)
+        _save_state(state_path, state)
+    done = set(state["done"])
+    pending = [index for index in range(len(parts)) if index not in done]
+    if done:
+        logger.info(f"[download] {url} 续传，已完成 {len(done)}/{len(parts)} 段")
+    else:
+        logger.info(f"[download] {url} 分 {len(parts)} 段下载，共 {size} 字节")
+
+    semaphore = asyncio.Semaphore(concurrency)
+    fd = os.open(part_path, os.O_WRONLY | getattr(os, "O_BINARY", 0))
+    try:
+        async def fetch(index):
+            async with semaphore:
+                await _download_range(client, url, fd, *parts[index], validator)
+            done.add(index)
+            state["done"] = sorted(done)
+            await asyncio.to_thread(_save_state, state_path, state)
+
+        tasks = [asyncio.create_task(fetch(index)) for index in pending]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+    finally:
+        os.close(fd)
+    return await _finish(part_path, state_path, dest, size, sha256)
+
+
+async def _download_range(client, url, fd, start, end, validator):
+    """下载 [start, end] 一段，攒够 DOWNLOAD_BLOCK_SIZE 写一次盘，失败时先写入已收到的数据，再从断点重试"""
+    offset = start
+    attempts = 0
+    buffer = bytearray()
+
+    async def flush():
+        nonlocal offset
+        if buffer:
+            await asyncio.to_thread(_pwrite, fd, bytes(buffer), offset)
+            offset += len(buffer)
+            buffer.clear()
+
+    while offset <= end:
+        try:
+            headers = {"Range": f"bytes={offset}-{end}"}
+            if validator is not None:
+                headers["If-Range"] = validator
+            async with client.stream("GET", url, headers=headers) as response:
+                if response.status_code == 200:
+                    # If-Range 不匹配时服务端返回整个文件，说明下载过程中远程文件变了
+                    raise DownloadError(f"下载过程中远程文件发生变化: {url}")
+                if response.status_code != 206:
+                    raise httpx.HTTPStatusError(f"返回 {response.status_code}", request=response.request,
+                                                response=response)
+                async for block in response.aiter_bytes():
+                    buffer += block[:end + 1 - offset - len(buffer)]
+                    if len(buffer) >= DOWNLOAD_BLOCK_SIZE or offset + len(buffer) > end:
+                        await flush()
+                    if offset > end:
+                        break
+            if offset <= end:
+                raise httpx.ReadError(f"响应提前结束，停在 {offset}/{end + 1}")
+        except (httpx.HTTPError, OSError) as e:
+            await flush()
+            attempts += 1
+            if attempts > DOWNLOAD_RETRIES:
+                raise DownloadError(f"分段 {start}-{end} 下载失败: {e}") from e
+            logger.warning(f"[download] 分段 {start}-{end} 第{attempts}次重试，从 {offset} 继续: {e}")
+            await asyncio.sleep(min(2 ** attempts, 10))
+
+
+async def _download_single(response, part_path, state_path):
+    _remove(state_path)
+    with open(part_path, "wb") as f:
+        async for block in response.aiter_bytes(DOWNLOAD_BLOCK_SIZE):
+            await asyncio.to_thread(f.write, block)
+
+
+async def _finish(part_path, state_path, dest, size, sha256):
+    actual_size = os.path.getsize(part_path)
+    if size is not None and actual_size != size:
+        _remove(part_path, state_path)
+        raise DownloadError(f"文件长度不一致: 期望 {size}，实际 {actual_size}")
+    if sha256 is not None:
+        actual = await asyncio.to_thread(file_sha256, part_path)
+        if actual != sha256.lower():
+            _remove(part_path, state_path)
+            raise DownloadError(f"sha256 校验失败: 期望 {sha256}，实际 {actual}")
+    os.replace(part_path, dest)
+    _remove(state_path)
+    return dest
@@ -0,0 +1,67 @@
+import asyncio
+import concurrent.futures
+import threading
+
+from utils.log import logger
+
+# 进程级的后台事件循环：扫码登录、cookie 校验、后台刷新和发布 worker 都运行在这一个长期存在的循环上，
+# 共用 utils.browser_pool.get_browser_pool() 返回的浏览器池。
+# Flask 路由是同步函数，通过 run_coroutine / spawn 把协程交给它，不再每个请求新建事件循环或线程
+
+_loop = None
+_thread = None
+_lock = threading.Lock()
+
+
+def get_loop():
+    """返回后台事件循环，第一次调用时在守护线程中启动"""
+    global _loop, _thread
+    with _lock:
+        if _loop is None or _loop.is_closed():
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def run():
+                asyncio.set_event_loop(loop)
+                loop.call_soon(ready.set)
+                loop.run_forever()
+
+            _thread = threading.Thread(target=run, name="sau-event-loop", daemon=True)
+            _thread.start()
+            ready.wait()
+            _loop = loop
+    return _loop
+
+
+def in_loop_thread():
+    return _thread is not None and threading.current_thread() is _thread
+
+
+def submit(coro):
+    """把协程交给后台循环执行，返回 concurrent.futures.Future"""
+    return asyncio.run_coroutine_threadsafe(coro, get_loop())
+
+
+def run_coroutine(coro, timeout=None):
+    """在后台循环执行协程并等待结果，超时会取消协程；不能在后台循环自己的线程里调用"""
+    if in_loop_thread():
+        coro.close()
+        raise RuntimeError("run_coroutine() cannot be called from the background event loop")
+    future = submit(coro)
+    try:
+        return future.result(timeout)
+    except concurrent.futures.TimeoutError:
+        future.cancel()
+        raise
+
+
+def spawn(coro, name):
+    """后台执行、不等待结果的协程，异常写日志"""
+    future = submit(coro)
+
+    def log_exception(done):
+        if not done.cancelled() and done.exception() is not None:
+            logger.opt(exception=done.exception()).error(f"[event loop] {name} 异常退出: {done.exception()}")
+
+    future.add_done_callback(log_exception)
+    return future
@@ -0,0 +1,215 @@
+import sqlite3
+import threading
+import time
+
+# 进程内的 Prometheus 指标注册表：uploader、myUtils.auth 和 Flask 路由直接更新，/metrics 按文本格式输出
+# 不依赖 prometheus_client，更新只是加锁改一个 dict，开销可以忽略
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key, extra=None):
+    items = list(key) + (extra or [])
+    if not items:
+        return ""
+    pairs = []
+    for k, v in items:
+        v = v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{k}="{v}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric(object):
+    type = None
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def clear(self):
+        with self._lock:
+            self._values = {}
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, value=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+    def inc(self, value=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def dec(self, value=1, **labels):
+        self.inc(-value, **labels)
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation)
+        self.buckets = tuple(buckets) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["buckets"][i] += 1
+                    break
+            state["sum"] += value
+            state["count"] += 1
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        with self._lock:
+            for key, state in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, state["buckets"]):
+                    cumulative += count
+                    le = _format_labels(key, [("le", _format_value(float(bound)))])
+                    lines.append(f"{self.name}_bucket{le} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(state['sum'])}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {state['count']}")
+        return lines
+
+
+class _Timer(object):
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+
+
+class Registry(object):
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        """注册一个在每次输出前调用的函数，用于刷新需要现算的 Gauge（队列长度、浏览器池状态等）"""
+        self._collectors.append(collector)
+        return collector
+
+    def render(self):
+        for collector in self._collectors:
+            try:
+                collector()
+            except Exception:
+                # 某个指标取不到不影响其他指标输出
+                pass
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+PUBLISH_JOBS = REGISTRY.register(Gauge(
+    "sau_publish_jobs", "Publish jobs in the queue by platform and status"))
+PUBLISH_JOBS_FINISHED = REGISTRY.register(Counter(
+    "sau_publish_jobs_finished_total", "Publish jobs finished by this process by platform and status"))
+UPLOAD_BYTES = REGISTRY.register(Counter(
+    "sau_upload_bytes_total", "Bytes received from clients by route"))
+PUBLISH_BYTES = REGISTRY.register(Counter(
+    "sau_publish_bytes_total", "Bytes of video successfully published by platform"))
+COOKIE_CHECK_SECONDS = REGISTRY.register(Histogram(
+    "sau_cookie_check_seconds", "Cookie validity check latency by platform type and result"))
+BROWSER_POOL_BROWSERS = REGISTRY.register(Gauge(
+    "sau_browser_pool_browsers", "Browsers running in live browser pools"))
+BROWSER_POOL_ACTIVE_CONTEXTS = REGISTRY.register(Gauge(
+    "sau_browser_pool_active_contexts", "Browser contexts currently handed out by browser pools"))
+BROWSER_RSS_BYTES = REGISTRY.register(Gauge(
+    "sau_browser_rss_bytes", "Resident memory of the browser process trees in live browser pools"))
+SSE_CONNECTIONS = REGISTRY.register(Gauge(
+    "sau_sse_connections", "Open server-sent event streams"))
+SQLITE_QUERY_SECONDS = REGISTRY.register(Histogram(
+    "sau_sqlite_query_seconds", "SQLite statement execution latency by statement type",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)))
+
+
+def _statement_type(sql):
+    return sql.lstrip().split(None, 1)[0].upper() if sql and sql.strip() else "UNKNOWN"
+
+
+class TimedCursor(sqlite3.Cursor):
+    """记录 execute/executemany 耗时的游标"""
+
+    def execute(self, sql, parameters=()):
+        with SQLITE_QUERY_SECONDS.time(statement=_statement_type(sql)):
+            return super().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        with SQLITE_QUERY_SECONDS.time(statement=_statement_type(sql)):
+            return super().executemany(sql, seq_of_parameters)
+
+
+class TimedConnection(sqlite3.Connection):
+    """
+    sqlite3.connect(path, factory=TimedConnection) 返回的连接，
+    conn.execute 和 conn.cursor() 得到的游标都会把语句耗时记到 sau_sqlite_query_seconds。
+    """
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def render_metrics():
+    return REGISTRY.render()
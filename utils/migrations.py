@@ -0,0 +1,224 @@
+import threading
+
+from utils.db import get_connection
+from utils.log import logger
+
+# 数据库结构迁移：PRAGMA user_version 记录已应用的版本，启动时依次执行更高版本的迁移，每个迁移在一个事务里完成
+# 已发布的迁移不要再修改，结构变化一律追加新的迁移
+# 早期版本由各模块自己建表/加列，所以迁移里的建表、加列都要能在已有结构上重复执行
+
+
+def _add_column(conn, table, name, column_type):
+    columns = {row[1] for row in conn.execute(f'PRAGMA table_info({table})').fetchall()}
+    if name not in columns:
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN {name} {column_type}')
+
+
+def _v1_base_tables(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS user_info (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        type INTEGER NOT NULL,
+        filePath TEXT NOT NULL,  -- 存储文件路径
+        userName TEXT NOT NULL,
+        status INTEGER DEFAULT 0
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS file_records (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, -- 唯一标识每条记录
+        filename TEXT NOT NULL,               -- 文件名
+        filesize REAL,                        -- 文件大小（单位：MB）
+        upload_time DATETIME DEFAULT CURRENT_TIMESTAMP, -- 上传时间，默认当前时间
+        file_path TEXT                        -- 文件路径
+    )
+    ''')
+
+
+def _v2_file_records_content(conn):
+    _add_column(conn, 'file_records', 'content_hash', 'TEXT')    # 文件内容 sha256
+    _add_column(conn, 'file_records', 'size_bytes', 'INTEGER')   # 文件大小（字节）
+    _add_column(conn, 'file_records', 'container', 'TEXT')       # 容器格式：mp4 / mov / webm 等
+    _add_column(conn, 'file_records', 'uuid', 'TEXT')            # file_path 的 UUID 前缀
+    conn.execute('''
+    UPDATE file_records SET uuid = substr(file_path, 1, instr(file_path, '_') - 1)
+    WHERE uuid IS NULL AND instr(file_path, '_') > 0
+    ''')
+
+
+def _v3_service_tables(conn):
+    # 发布任务队列
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS publish_jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        type INTEGER NOT NULL,                  -- 平台类型，与 /postVideo 的 type 一致
+        payload TEXT NOT NULL,                  -- /postVideo 请求体（JSON）
+        status TEXT NOT NULL DEFAULT 'queued',  -- queued / running / succeeded / failed
+        attempts INTEGER NOT NULL DEFAULT 0,
+        lease_owner TEXT,                       -- 持有租约的 worker
+        lease_expires REAL,                     -- 租约到期时间（unix 时间戳）
+        error TEXT,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        started_at DATETIME,
+        finished_at DATETIME
+    )
+    ''')
+    # cookie 校验结果缓存
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS cookie_validity (
+        file_path TEXT PRIMARY KEY,   -- cookie 文件绝对路径
+        type INTEGER NOT NULL,        -- 平台类型
+        content_hash TEXT NOT NULL,   -- 校验时 cookie 文件内容的 sha1
+        valid INTEGER NOT NULL,       -- 1 有效 0 失效
+        checked_at REAL NOT NULL      -- 校验时间（unix 时间戳）
+    )
+    ''')
+    # 上传/登录步骤耗时
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS step_spans (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        platform TEXT NOT NULL,       -- 平台，如 douyin / tencent
+        account TEXT,                 -- 账号 cookie 文件名
+        step TEXT NOT NULL,           -- 步骤名，如 goto / set_input_files / wait_upload
+        duration_ms REAL NOT NULL,
+        ok INTEGER NOT NULL,          -- 1 正常结束 0 步骤中出错
+        created_at REAL NOT NULL      -- 步骤开始时间（unix 时间戳）
+    )
+    ''')
+    # 分片上传会话
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS upload_sessions (
+        id TEXT PRIMARY KEY,              -- 上传 ID
+        filename TEXT NOT NULL,           -- 展示用文件名
+        final_filename TEXT NOT NULL,     -- videoFile 下的最终文件名（{uuid}_{filename}）
+        size INTEGER NOT NULL,            -- 文件总大小（字节）
+        received INTEGER NOT NULL DEFAULT 0,  -- 已确认写入的字节数，客户端从这里续传
+        status TEXT NOT NULL DEFAULT 'uploading',  -- uploading / done
+        created_at REAL NOT NULL,
+        updated_at REAL NOT NULL
+    )
+    ''')
+
+
+def _v4_indexes(conn):
+    for sql in (
+        # /getAccounts 按平台、状态过滤
+        'CREATE INDEX IF NOT EXISTS idx_user_info_type_status ON user_info (type, status, id)',
+        # /getFiles 的排序键、/getFile 按文件名查哈希、按哈希统计引用数
+        'CREATE INDEX IF NOT EXISTS idx_file_records_upload_time ON file_records (upload_time, id)',
+        'CREATE INDEX IF NOT EXISTS idx_file_records_filesize ON file_records (filesize, id)',
+        'CREATE INDEX IF NOT EXISTS idx_file_records_uuid ON file_records (uuid)',
+        'CREATE INDEX IF NOT EXISTS idx_file_records_content_hash ON file_records (content_hash)',
+        'CREATE INDEX IF NOT EXISTS idx_file_records_file_path ON file_records (file_path)',
+        # worker 领取任务（status = queued，或 running 且租约过期）
+        'CREATE INDEX IF NOT EXISTS idx_publish_jobs_status ON publish_jobs (status, lease_expires)',
+        # /getStepMetrics 按时间窗口统计
+        'CREATE INDEX IF NOT EXISTS idx_step_spans_created_at ON step_spans (created_at)',
+        # 清理过期上传
+        'CREATE INDEX IF NOT EXISTS idx_upload_sessions_updated_at ON upload_sessions (updated_at)',
+    ):
+        conn.execute(sql)
+
+
+def _v5_download_cache(conn):
+    # 远程视频下载缓存的索引，文件在 videoFile/cache 下
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS download_cache (
+        key TEXT PRIMARY KEY,         -- sha1(url + 版本标识)
+        url TEXT NOT NULL,
+        validator TEXT,               -- 下载时的 ETag / Last-Modified，没有时为 NULL
+        file_name TEXT NOT NULL,      -- videoFile/cache 下的文件名
+        size_bytes INTEGER NOT NULL,
+        created_at REAL NOT NULL,     -- 下载完成时间（unix 时间戳）
+        last_used REAL NOT NULL       -- 最近一次被使用的时间，按它做 LRU 淘汰
+    )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_download_cache_last_used ON download_cache (last_used)')
+
+
+def _v6_media_info(conn):
+    # ffprobe 结果缓存，按文件内容 sha256 索引，同一内容只探测一次
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS media_info (
+        content_hash TEXT PRIMARY KEY,  -- 与 file_records.content_hash 一致
+        duration REAL,                  -- 时长（秒）
+        width INTEGER,                  -- 显示宽高（已按旋转角度交换）
+        height INTEGER,
+        video_codec TEXT,
+        audio_codec TEXT,
+        bit_rate INTEGER,               -- 总码率（bit/s）
+        frame_rate REAL,
+        format_name TEXT,               -- ffprobe 的 format_name，如 mov,mp4,m4a,3gp,3g2,mj2
+        error TEXT,                     -- ffprobe 无法识别时的错误信息，其余字段为空
+        probed_at REAL NOT NULL
+    )
+    ''')
+
+
+def _v7_publish_job_items(conn):
+    # 发布任务里每个 (文件, 账号) 的结果，任务被重新领取时跳过已经成功的组合
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS publish_job_items (
+        job_id INTEGER NOT NULL,      -- publish_jobs.id
+        file TEXT NOT NULL,           -- fileList 中的原始值
+        account TEXT NOT NULL,        -- 账号 cookie 文件名，YouTube 为空字符串
+        status TEXT NOT NULL,         -- succeeded / failed
+        error TEXT,
+        updated_at REAL NOT NULL,
+        PRIMARY KEY (job_id, file, account)
+    )
+    ''')
+
+
+# (版本号, 说明, 迁移函数)，版本号从 1 开始连续递增
+MIGRATIONS = [
+    (1, "user_info / file_records", _v1_base_tables),
+    (2, "file_records content_hash / size_bytes / container / uuid", _v2_file_records_content),
+    (3, "publish_jobs / cookie_validity / step_spans / upload_sessions", _v3_service_tables),
+    (4, "indexes", _v4_indexes),
+    (5, "download_cache", _v5_download_cache),
+    (6, "media_info", _v6_media_info),
+    (7, "publish_job_items", _v7_publish_job_items),
+]
+
+_lock = threading.Lock()
+_ready = False
+
+
+def migrate(conn=None):
+    """把数据库升级到最新版本，返回升级后的版本号"""
+    conn = conn or get_connection()
+    if conn.in_transaction:
+        conn.commit()
+    (version,) = conn.execute('PRAGMA user_version').fetchone()
+    for target, description, apply in MIGRATIONS:
+        if target <= version:
+            continue
+        # 迁移和版本号在同一个事务里提交，失败时整体回滚，下次启动重试
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # 拿到写锁后再确认一次，其他进程可能已经完成了这个迁移
+            (version,) = conn.execute('PRAGMA user_version').fetchone()
+            if target <= version:
+                conn.commit()
+                continue
+            apply(conn)
+            conn.execute(f'PRAGMA user_version = {target}')
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+        logger.info(f"[migrations] 数据库已升级到版本 {target}: {description}")
+        version = target
+    return version
+
+
+def ensure_schema():
+    """进程内第一次访问数据库前调用，只迁移一次"""
+    global _ready
+    if _ready:
+        return
+    with _lock:
+        if not _ready:
+            migrate()
+            _ready = True
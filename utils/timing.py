@@ -0,0 +1,137 @@
+import functools
+import math
+import sqlite3
+import time
+from pathlib import Path
+
+from utils.db import get_connection
+from utils.log import logger
+from utils.migrations import ensure_schema
+
+
+class StepTimer(object):
+    """
+    记录一次上传/登录流程中每个步骤的耗时，结束时一次性写入 step_spans 表。
+
+    两种用法可以混用:
+        timer = StepTimer("douyin", account_file)
+        timer.step("goto")             # 结束上一步并开始新的一步
+        ...
+        with timer.span("set_thumbnail"):
+            await self.set_thumbnail(page, path)
+        timer.finish()                 # 结束最后一步并写库
+    """
+
+    def __init__(self, platform, account=None):
+        self.platform = platform
+        self.account = Path(account).name if account else None
+        self.spans = []
+        self._current = None
+
+    def step(self, name):
+        self._close_current(True)
+        self._current = (name, time.time(), time.perf_counter())
+
+    def span(self, name):
+        return _Span(self, name)
+
+    def finish(self, ok=True):
+        self._close_current(ok)
+        if not self.spans:
+            return
+        try:
+            ensure_schema()
+            with get_connection() as conn:
+                conn.executemany('''
+                INSERT INTO step_spans (platform, account, step, duration_ms, ok, created_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ''', [(self.platform, self.account, *span) for span in self.spans])
+                conn.commit()
+        except sqlite3.Error as e:
+            # 计时数据写不进去不能影响上传本身
+            logger.warning(f"[timing] 写入步骤耗时失败: {e}")
+        self.spans = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.finish(exc_type is None)
+
+    def _record(self, name, started_at, started, ok):
+        self.spans.append((name, round((time.perf_counter() - started) * 1000, 1), int(ok), started_at))
+
+    def _close_current(self, ok):
+        if self._current is not None:
+            self._record(*self._current, ok)
+            self._current = None
+
+
+def finish_timer_on_error(method):
+    """
+    上传器的 upload() 用：方法抛出异常（包括超时取消）时把 self.timer 当前的步骤记为失败并写库，
+    直接调用 main()、cli_main.py 和 examples 中的失败也会被统计；成功路径仍由方法自己调用 finish()。
+    """
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        try:
+            return await method(self, *args, **kwargs)
+        except BaseException:
+            timer = getattr(self, "timer", None)
+            if timer is not None:
+                timer.finish(ok=False)
+            raise
+    return wrapper
+
+
+class _Span(object):
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        # span 内的耗时单独记录，同时结束之前 step() 开始的步骤
+        self.timer._close_current(True)
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.timer._record(self.name, self.started_at, self.started, exc_type is None)
+
+
+def _percentile(sorted_values, percent):
+    # 最近秩法
+    index = max(0, math.ceil(percent / 100 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+def get_step_metrics(hours=24 * 7, platform=None):
+    """按 平台+步骤 汇总最近 hours 小时的步骤耗时，返回次数、失败次数、p50/p95/最大值（毫秒）"""
+    ensure_schema()
+    sql = 'SELECT platform, step, duration_ms, ok FROM step_spans WHERE created_at >= ?'
+    params = [time.time() - hours * 3600]
+    if platform:
+        sql += ' AND platform = ?'
+        params.append(platform)
+    with get_connection() as conn:
+        rows = conn.execute(sql, params).fetchall()
+    groups = {}
+    for row_platform, step, duration_ms, ok in rows:
+        group = groups.setdefault((row_platform, step), {"durations": [], "failed": 0})
+        group["durations"].append(duration_ms)
+        if not ok:
+            group["failed"] += 1
+    metrics = []
+    for (row_platform, step), group in sorted(groups.items()):
+        durations = sorted(group["durations"])
+        metrics.append({
+            "platform": row_platform,
+            "step": step,
+            "count": len(durations),
+            "failed": group["failed"],
+            "p50_ms": _percentile(durations, 50),
+            "p95_ms": _percentile(durations, 95),
+            "max_ms": durations[-1],
+        })
+    return metrics
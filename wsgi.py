@@ -0,0 +1,22 @@
+import conf
+from sau_backend import app, start_services
+
+# 生产环境入口：用多线程的 WSGI 服务器运行 Flask，路由和返回格式与 python sau_backend.py 相同
+#     python wsgi.py                                           （waitress，Windows/Linux 通用）
+#     gunicorn -w 1 -k gthread --threads 16 -b 0.0.0.0:5409 wsgi:application   （Linux）
+# 每个请求独占一个线程：/login 的 SSE 长连接、/getValidAccounts、大文件上传不会互相阻塞；
+# 客户端断开时 SSE 写心跳失败、生成器被关闭，登录会话随即取消。
+# gunicorn 把请求体直接以流交给视图；waitress 先把超过 512KB 的请求体缓存到临时文件（不占内存），再交给视图。
+# 只能启动一个进程（gunicorn -w 1）：扫码登录的队列、发布 worker 和后台事件循环都在进程内。
+# 扫码登录、cookie 校验和发布任务都运行在 utils.event_loop 的后台事件循环上
+SERVER_HOST = getattr(conf, "SERVER_HOST", "0.0.0.0")
+SERVER_PORT = getattr(conf, "SERVER_PORT", 5409)
+SERVER_THREADS = getattr(conf, "SERVER_THREADS", 16)
+
+start_services()
+application = app
+
+if __name__ == '__main__':
+    from waitress import serve
+
+    serve(application, host=SERVER_HOST, port=SERVER_PORT, threads=SERVER_THREADS)